@@ -1,35 +1,145 @@
+import asyncio
+import functools
 import os
-from typing import Any, Dict, List, Optional
+import threading
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
 
-import opik
 from dotenv import load_dotenv
-from openai import OpenAI
-from opik import track
 
-from app.agent.graph import build_graph, run_graph
-from app.data.vector_db import LegalKnowledgeBase
+from app.agent.llm_gateway import client_timeout
+from app.data.vector_db import get_knowledge_base, knowledge_base_status
 
-# LOAD ENV & OPIK
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+    from app.data.vector_db import LegalKnowledgeBase
+
+# LOAD ENV
+# Tracing, model clients, the knowledge base and the graphs (and their heavy
+# imports) are set up on first use or by warm_up(), so importing this module is cheap.
 load_dotenv()
-opik.configure(use_local=False)
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "100") or "100")
 
-try:
-    kb = LegalKnowledgeBase()
-except Exception:
-    kb = None
+_init_lock = threading.RLock()
+_tracing_configured = False
+_client: Optional["OpenAI"] = None
+_async_client: Optional["AsyncOpenAI"] = None
+_graph_app = None
+_async_graph_app = None
 
-_graph_app = build_graph(client, kb)
 
+def configure_tracing() -> None:
+    global _tracing_configured
+    with _init_lock:
+        if not _tracing_configured:
+            import opik
 
-@track(name="Fiscal_Sentinel_Run")
-def run_sentinel(
+            opik.configure(use_local=False)
+            _tracing_configured = True
+
+
+def get_client() -> "OpenAI":
+    global _client
+    with _init_lock:
+        if _client is None:
+            from openai import OpenAI
+
+            # Retries and deadlines are handled by app.agent.llm_gateway, not the SDK.
+            _client = OpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=client_timeout(),
+            )
+        return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    global _async_client
+    with _init_lock:
+        if _async_client is None:
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            # One pooled HTTP client shared by every concurrent conversation.
+            _async_client = AsyncOpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=client_timeout(),
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_CONNECTIONS // 5 or 1,
+                    ),
+                ),
+            )
+        return _async_client
+
+
+def get_kb() -> Optional["LegalKnowledgeBase"]:
+    """
+    The shared knowledge base, or None when it can't be opened (the agent
+    then answers without retrieval). Loading may pull an embedding model.
+    """
+    return get_knowledge_base()
+
+
+def get_graph(use_async: bool = True):
+    global _graph_app, _async_graph_app
+    with _init_lock:
+        from app.agent.graph import build_graph
+
+        if use_async and _async_graph_app is None:
+            configure_tracing()
+            _async_graph_app = build_graph(get_async_client(), get_kb())
+        if not use_async and _graph_app is None:
+            configure_tracing()
+            _graph_app = build_graph(get_client(), get_kb())
+        return _async_graph_app if use_async else _graph_app
+
+
+async def aget_graph():
+    """
+    get_graph() for the event loop: a cold first build runs in a worker thread.
+    """
+    if _async_graph_app is not None:
+        return _async_graph_app
+    return await asyncio.to_thread(get_graph, True)
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Builds everything the async path needs (tracing, client, knowledge base,
+    graph) so the first request doesn't pay for it. Blocking; safe to call
+    more than once.
+    """
+    get_graph(use_async=True)
+    return readiness()
+
+
+def readiness() -> Dict[str, Any]:
+    """
+    What has been initialized so far; never triggers initialization.
+    """
+    kb_status = knowledge_base_status()
+    components = {
+        "tracing": _tracing_configured,
+        "llm_client": _async_client is not None,
+        "knowledge_base": kb_status["status"],
+        "graph": _async_graph_app is not None,
+    }
+    payload: Dict[str, Any] = {"ready": _async_graph_app is not None, "components": components}
+    if kb_status["error"]:
+        payload["knowledge_base_error"] = kb_status["error"]
+    return payload
+
+
+def _initial_state(
     user_input: str,
     transactions: List[Dict[str, Any]],
-    history: Optional[List[Dict[str, str]]] = None,
-    debug: bool = False,
-):
+    history: Optional[List[Dict[str, str]]],
+    issues: Optional[List[Dict[str, Any]]],
+) -> Dict[str, Any]:
     messages = history[:] if history else []
     messages.append({"role": "user", "content": user_input})
 
@@ -38,7 +148,12 @@ def run_sentinel(
         "user_input": user_input,
         "transactions": transactions,
     }
-    result = run_graph(_graph_app, state)
+    if issues is not None:
+        state["precomputed_issues"] = issues
+    return state
+
+
+def _sentinel_result(result: Dict[str, Any], debug: bool):
     response = result.get("final_response", "")
     if not debug:
         return response
@@ -54,3 +169,118 @@ def run_sentinel(
         "retrieval_used": bool(result.get("retrieval_context")),
     }
     return response, debug_payload
+
+
+def _traced(name: str):
+    """
+    opik's track decorator, applied on first call so opik is only imported
+    (and configured) once an agent run actually happens.
+    """
+
+    def decorator(fn):
+        tracked = None
+
+        def resolve():
+            nonlocal tracked
+            if tracked is None:
+                from opik import track
+
+                configure_tracing()
+                tracked = track(name=name)(fn)
+            return tracked
+
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                return await resolve()(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return resolve()(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@_traced("Fiscal_Sentinel_Run")
+def run_sentinel(
+    user_input: str,
+    transactions: List[Dict[str, Any]],
+    history: Optional[List[Dict[str, str]]] = None,
+    debug: bool = False,
+    issues: Optional[List[Dict[str, Any]]] = None,
+):
+    from app.agent.graph import run_graph
+
+    result = run_graph(get_graph(use_async=False), _initial_state(user_input, transactions, history, issues))
+    return _sentinel_result(result, debug)
+
+
+@_traced("Fiscal_Sentinel_Run")
+async def arun_sentinel(
+    user_input: str,
+    transactions: List[Dict[str, Any]],
+    history: Optional[List[Dict[str, str]]] = None,
+    debug: bool = False,
+    issues: Optional[List[Dict[str, Any]]] = None,
+):
+    """
+    Async counterpart of run_sentinel for use inside the event loop.
+    """
+    from app.agent.graph import arun_graph
+
+    result = await arun_graph(await aget_graph(), _initial_state(user_input, transactions, history, issues))
+    return _sentinel_result(result, debug)
+
+
+async def astream_sentinel(
+    user_input: str,
+    transactions: List[Dict[str, Any]],
+    history: Optional[List[Dict[str, str]]] = None,
+    issues: Optional[List[Dict[str, Any]]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs the graph and yields events as they happen:
+    {"event": "node", "node": name, "data": summary} after each node,
+    {"event": "token", "data": {"text": ...}} for compose/assistant output,
+    then a final {"event": "done", "data": {"response": ...}} (or "error").
+    """
+    queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+
+    async def on_token(text: str) -> None:
+        queue.put_nowait({"event": "token", "data": {"text": text}})
+
+    async def run() -> None:
+        final: Dict[str, Any] = {}
+        try:
+            from app.agent.graph import summarize_node_update
+
+            app = await aget_graph()
+            async for update in app.astream(
+                _initial_state(user_input, transactions, history, issues),
+                config={"configurable": {"on_token": on_token}},
+                stream_mode="updates",
+            ):
+                for node, values in update.items():
+                    final.update(values or {})
+                    queue.put_nowait({"event": "node", "node": node, "data": summarize_node_update(node, values)})
+            queue.put_nowait({"event": "done", "data": {"response": final.get("final_response", "")}})
+        except Exception as exc:
+            queue.put_nowait({"event": "error", "data": {"detail": str(exc)}})
+        finally:
+            queue.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+    finally:
+        if not task.done():
+            task.cancel()
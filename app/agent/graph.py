@@ -1,12 +1,16 @@
+import asyncio
 import json
 import re
-from typing import Any, Dict, List, Optional, TypedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypedDict, Union
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, StateGraph
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from opik import track
 from opik.opik_context import update_current_span
 
+from app.agent.intent_classifier import get_intent_classifier, record_routing_trace
+from app.agent.llm_gateway import LLM_GENERATION_TIMEOUT_SECONDS, chat_completion, stream_chat_completion
 from app.agent.prompts import (
     FISCAL_SENTINEL_ANALYSIS_PROMPT,
     FISCAL_SENTINEL_ASSISTANT_PROMPT,
@@ -14,15 +18,26 @@ from app.agent.prompts import (
     FISCAL_SENTINEL_LETTER_PROMPT,
     FISCAL_SENTINEL_ROUTER_PROMPT,
 )
+from app.agent.response_cache import ResponseCache, get_response_cache
 from app.analysis.transaction_analyzer import analyze_transactions_rule_based
-from app.analysis.transaction_query import answer_transaction_query, parse_transaction_query, TransactionQuery
+from app.analysis.transaction_context import build_context_chunks, merge_chunk_issues
+from app.analysis.transaction_query import (
+    answer_transaction_query,
+    compose_rule_based_findings,
+    parse_transaction_query,
+    TransactionQuery,
+)
 from app.data.vector_db import LegalKnowledgeBase
 
+LLMClient = Union[OpenAI, AsyncOpenAI]
+TokenCallback = Callable[[str], Awaitable[None]]
+
 
 class AgentState(TypedDict, total=False):
     messages: List[Dict[str, str]]
     user_input: str
     transactions: List[Dict[str, Any]]
+    precomputed_issues: List[Dict[str, Any]]
     intent: str
     wants_letter: bool
     wants_retrieval: bool
@@ -31,6 +46,7 @@ class AgentState(TypedDict, total=False):
     analysis: Dict[str, Any]
     needs_evidence: bool
     retrieval_context: str
+    letter_issue: Dict[str, Any]
     letter: str
     assistant_response: str
     final_response: str
@@ -141,7 +157,7 @@ def _wants_analysis(text: str) -> bool:
     return any(t in text for t in triggers)
 
 
-def _normalize_merchant(name: Optional[str]) -> Optional[str]:
+def normalize_merchant(name: Optional[str]) -> Optional[str]:
     if not name:
         return None
     base = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
@@ -232,8 +248,81 @@ def _basic_intent_heuristic(user_input: str, messages: List[Dict[str, str]]) ->
     return None
 
 
-def _openai_json_response(client: OpenAI, messages: List[Dict[str, str]]) -> Dict[str, Any]:
-    response = client.chat.completions.create(
+async def _cache_get(cache: ResponseCache, prompt: str, history: List[Dict[str, str]]) -> Any:
+    if cache.semantic:
+        return await asyncio.to_thread(cache.get, prompt, history)
+    return cache.get(prompt, history)
+
+
+async def _cache_put(cache: ResponseCache, prompt: str, history: List[Dict[str, str]], value: Any) -> None:
+    if cache.semantic:
+        await asyncio.to_thread(cache.put, prompt, history, value)
+    else:
+        cache.put(prompt, history, value)
+
+
+def _token_callback(config: Optional[RunnableConfig]) -> Optional[TokenCallback]:
+    return ((config or {}).get("configurable") or {}).get("on_token")
+
+
+def build_letter_messages(issue: Dict[str, Any], evidence: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": FISCAL_SENTINEL_LETTER_PROMPT},
+        {
+            "role": "user",
+            "content": json.dumps(
+                {
+                    "merchant": issue.get("merchant"),
+                    "issue": issue.get("issue"),
+                    "amount": issue.get("amount"),
+                    "reason": issue.get("reason"),
+                    "evidence": evidence,
+                },
+                indent=2,
+            ),
+        },
+    ]
+
+
+async def _openai_text_response(
+    client: LLMClient,
+    messages: List[Dict[str, str]],
+    on_token: Optional[TokenCallback] = None,
+    node: str = "text",
+) -> str:
+    """
+    Returns the completion text. With `on_token`, an async client streams the
+    completion and reports each delta as it arrives. Free text can run long,
+    so unstreamed calls get the generation budget rather than the short one.
+    """
+    if on_token is None or not isinstance(client, AsyncOpenAI):
+        response = await chat_completion(
+            client,
+            node,
+            timeout=LLM_GENERATION_TIMEOUT_SECONDS,
+            model="gpt-4o-mini",
+            messages=messages,
+        )
+        content = response.choices[0].message.content or ""
+        if on_token is not None and content:
+            await on_token(content)
+        return content
+
+    return await stream_chat_completion(client, node, on_token, model="gpt-4o-mini", messages=messages)
+
+
+async def _openai_json_response(
+    client: LLMClient,
+    messages: List[Dict[str, str]],
+    node: str = "json",
+    hedge: bool = False,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    response = await chat_completion(
+        client,
+        node,
+        hedge=hedge,
+        timeout=timeout,
         model="gpt-4o-mini",
         messages=messages,
         response_format={"type": "json_object"},
@@ -242,11 +331,20 @@ def _openai_json_response(client: OpenAI, messages: List[Dict[str, str]]) -> Dic
     return _safe_json_loads(content)
 
 
-def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
+def build_graph(client: LLMClient, kb: Optional[LegalKnowledgeBase] = None):
+    """
+    Builds the agent graph. Nodes are coroutines shared by both entry points:
+    pass an AsyncOpenAI client for ainvoke, or a sync OpenAI client for
+    run_graph (its calls run in worker threads).
+    """
     graph = StateGraph(AgentState)
+    embedder = kb.embed_queries if kb is not None else None
+    router_cache = get_response_cache("router", embedder)
+    assistant_cache = get_response_cache("assistant", embedder)
+    intent_classifier = get_intent_classifier()
 
     @track(name="router")
-    def router(state: AgentState) -> AgentState:
+    async def router(state: AgentState) -> AgentState:
         user_input = state.get("user_input", "")
         messages = state.get("messages", [])
         tx = state.get("transactions", [])
@@ -275,6 +373,7 @@ def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
 
         heuristic = _basic_intent_heuristic(user_input, messages)
         if heuristic:
+            record_routing_trace(user_input, heuristic, "heuristic")
             _safe_span_update(
                 {
                     "intent": heuristic,
@@ -287,10 +386,22 @@ def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
                 "wants_retrieval": wants_retrieval or heuristic == "retrieve_laws",
             }
 
-        history = messages[-6:] if messages else [{"role": "user", "content": user_input}]
-        router_messages = [{"role": "system", "content": FISCAL_SENTINEL_ROUTER_PROMPT}] + history
-        result = _openai_json_response(client, router_messages)
-        intent = result.get("intent") or "other"
+        # Local classifier first; only low-confidence messages escalate to the LLM.
+        intent = intent_classifier.classify(user_input) if intent_classifier else None
+        source = "classifier"
+        if intent is None:
+            history = messages[-6:] if messages else [{"role": "user", "content": user_input}]
+            result = await _cache_get(router_cache, user_input, history[:-1])
+            source = "cache"
+            if result is None:
+                router_messages = [{"role": "system", "content": FISCAL_SENTINEL_ROUTER_PROMPT}] + history
+                result = await _openai_json_response(client, router_messages, node="router", hedge=True)
+                source = "llm"
+                if result.get("intent"):
+                    await _cache_put(router_cache, user_input, history[:-1], result)
+            intent = result.get("intent") or "other"
+        record_routing_trace(user_input, intent, source)
+        _safe_span_update({"router_source": source})
         explicit_legal = _wants_legal_help(normalized)
         if intent == "draft_letter" and not wants_letter:
             intent = "general_question"
@@ -310,7 +421,7 @@ def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
         }
 
     @track(name="assistant")
-    def assistant(state: AgentState) -> AgentState:
+    async def assistant(state: AgentState, config: RunnableConfig) -> AgentState:
         messages = state.get("messages", [])
         user_input = state.get("user_input", "")
         if _is_out_of_scope(user_input):
@@ -320,21 +431,25 @@ def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
                 "Ask me about your bank statement, a charge, or a subscription issue."
             )
             return {"assistant_response": response}
+        on_token = _token_callback(config)
+        prior = messages[:-1]
+        cached = await _cache_get(assistant_cache, user_input, prior)
+        if cached is not None:
+            if on_token is not None:
+                await on_token(cached)
+            return {"assistant_response": cached}
         base = [{"role": "system", "content": FISCAL_SENTINEL_ASSISTANT_PROMPT}]
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=base + messages,
-        )
-        content = response.choices[0].message.content or ""
+        content = await _openai_text_response(client, base + messages, on_token, node="assistant")
+        await _cache_put(assistant_cache, user_input, prior, content)
         return {"assistant_response": content}
 
     @track(name="transaction_query")
-    def transaction_query_node(state: AgentState) -> AgentState:
+    async def transaction_query_node(state: AgentState) -> AgentState:
         query = state.get("transaction_query")
         tx = state.get("transactions", [])
         if not query:
             return {"final_response": "Can you clarify what you want to know about your transactions?"}
-        response = answer_transaction_query(query, tx)
+        response = answer_transaction_query(query, tx, issues=state.get("precomputed_issues"))
         _safe_span_update(
             {
                 "transaction_query_type": query.query_type,
@@ -345,30 +460,40 @@ def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
         return {"final_response": response}
 
     @track(name="analyze_transactions")
-    def analyze_transactions(state: AgentState) -> AgentState:
+    async def analyze_transactions(state: AgentState) -> AgentState:
         user_input = state.get("user_input", "")
         tx = state.get("transactions", [])
-        rule_based_issues = analyze_transactions_rule_based(tx)
+        rule_based_issues = state.get("precomputed_issues")
+        if rule_based_issues is None:
+            rule_based_issues = analyze_transactions_rule_based(tx)
         if rule_based_issues:
             needs_evidence = bool(state.get("wants_retrieval") or state.get("wants_letter"))
             return {
-                "analysis": {"issues": rule_based_issues},
+                "analysis": {"issues": rule_based_issues, "source": "rule_based"},
                 "needs_evidence": needs_evidence,
             }
-        messages = [
-            {"role": "system", "content": FISCAL_SENTINEL_ANALYSIS_PROMPT},
-            {
-                "role": "user",
-                "content": f"USER REQUEST:\n{user_input}\n\nTRANSACTIONS:\n{json.dumps(tx, indent=2)}",
-            },
-        ]
-        result = _openai_json_response(client, messages)
-        issues = result.get("issues") or []
+        # Map over bounded context chunks, then reduce to one deduplicated issue list.
+        chunks = build_context_chunks(tx)
+        results = await asyncio.gather(
+            *(
+                _openai_json_response(
+                    client,
+                    [
+                        {"role": "system", "content": FISCAL_SENTINEL_ANALYSIS_PROMPT},
+                        {"role": "user", "content": f"USER REQUEST:\n{user_input}\n\n{chunk}"},
+                    ],
+                    node="analyze_transactions",
+                    timeout=LLM_GENERATION_TIMEOUT_SECONDS,
+                )
+                for chunk in chunks
+            )
+        )
+        issues = merge_chunk_issues(results)
         needs_evidence = any(i.get("needs_evidence") for i in issues)
-        return {"analysis": result, "needs_evidence": needs_evidence}
+        return {"analysis": {"issues": issues}, "needs_evidence": needs_evidence}
 
     @track(name="retrieve_laws")
-    def retrieve_laws(state: AgentState) -> AgentState:
+    async def retrieve_laws(state: AgentState) -> AgentState:
         if not kb:
             return {"retrieval_context": ""}
         user_input = state.get("user_input", "")
@@ -378,57 +503,45 @@ def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
         if issues:
             issue = issues[0]
             issue_text = f"{issue.get('merchant', '')} - {issue.get('issue', '')}"
-            merchant = _normalize_merchant(issue.get("merchant"))
+            merchant = normalize_merchant(issue.get("merchant"))
         else:
             merchant = _detect_merchant_from_text(user_input)
         query = f"{user_input}\n{issue_text}".strip()
-        context = kb.search_laws(query, merchant=merchant) if query else ""
+        # Vector search is blocking (embedding call + DB query).
+        context = await asyncio.to_thread(kb.search_laws, query, merchant=merchant) if query else ""
         _safe_span_update({"retrieval_used": True, "merchant": merchant or ""})
         return {"retrieval_context": context}
 
-    @track(name="draft_letter")
-    def draft_letter(state: AgentState) -> AgentState:
-        issues = (state.get("analysis") or {}).get("issues") or []
-        issue = issues[0] if issues else {}
-        if not issue:
-            extract_messages = [
-                {
-                    "role": "system",
-                    "content": "Extract merchant and issue from the user request. Return JSON: {\"merchant\":\"...\",\"issue\":\"...\"}.",
-                },
-                {"role": "user", "content": state.get("user_input", "")},
-            ]
-            extracted = _openai_json_response(client, extract_messages)
-            issue = {
-                "merchant": extracted.get("merchant"),
-                "issue": extracted.get("issue"),
-            }
-        evidence = state.get("retrieval_context", "")
-        messages = [
-            {"role": "system", "content": FISCAL_SENTINEL_LETTER_PROMPT},
+    async def _extract_letter_issue(user_input: str) -> Dict[str, Any]:
+        extract_messages = [
             {
-                "role": "user",
-                "content": json.dumps(
-                    {
-                        "merchant": issue.get("merchant"),
-                        "issue": issue.get("issue"),
-                        "amount": issue.get("amount"),
-                        "reason": issue.get("reason"),
-                        "evidence": evidence,
-                    },
-                    indent=2,
-                ),
+                "role": "system",
+                "content": "Extract merchant and issue from the user request. Return JSON: {\"merchant\":\"...\",\"issue\":\"...\"}.",
             },
+            {"role": "user", "content": user_input},
         ]
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-        )
-        content = response.choices[0].message.content or ""
+        extracted = await _openai_json_response(client, extract_messages, node="extract_issue")
+        return {
+            "merchant": extracted.get("merchant"),
+            "issue": extracted.get("issue"),
+        }
+
+    @track(name="extract_issue")
+    async def extract_issue(state: AgentState) -> AgentState:
+        return {"letter_issue": await _extract_letter_issue(state.get("user_input", ""))}
+
+    @track(name="draft_letter")
+    async def draft_letter(state: AgentState) -> AgentState:
+        issues = (state.get("analysis") or {}).get("issues") or []
+        issue = issues[0] if issues else state.get("letter_issue") or {}
+        if not issue:
+            issue = await _extract_letter_issue(state.get("user_input", ""))
+        messages = build_letter_messages(issue, state.get("retrieval_context", ""))
+        content = await _openai_text_response(client, messages, node="draft_letter")
         return {"letter": content}
 
     @track(name="compose")
-    def compose(state: AgentState) -> AgentState:
+    async def compose(state: AgentState, config: RunnableConfig) -> AgentState:
         intent = state.get("intent", "other")
         assistant_response = state.get("assistant_response", "")
         analysis = state.get("analysis") or {}
@@ -450,44 +563,60 @@ def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
             {"role": "system", "content": FISCAL_SENTINEL_COMPOSER_PROMPT},
             {"role": "user", "content": json.dumps(payload, indent=2)},
         ]
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-        )
-        content = response.choices[0].message.content or ""
+        content = await _openai_text_response(client, messages, _token_callback(config), node="compose")
         return {"final_response": content}
 
-    def route_after_router(state: AgentState) -> str:
+    def route_after_router(state: AgentState) -> Union[str, List[str]]:
         intent = state.get("intent", "other")
         if intent == "transaction_query":
             return "transaction_query"
         if intent in ["greeting", "general_question", "other"]:
             return "assistant"
+        if intent in ["retrieve_laws", "draft_letter"] and state.get("wants_letter"):
+            # Letter flow: evidence lookup and issue extraction are independent.
+            return ["retrieve_for_letter", "extract_issue"]
         if intent == "analyze_transactions":
+            if (state.get("wants_retrieval") or state.get("wants_letter")) and _detect_merchant_from_text(
+                state.get("user_input", "")
+            ):
+                # A named merchant is enough to search; don't wait for the analysis.
+                return ["analyze_with_laws", "retrieve_merchant_laws"]
             return "analyze_transactions"
         if intent == "retrieve_laws":
             return "retrieve_laws"
-        if intent == "draft_letter":
-            return "retrieve_laws"
         return "assistant"
 
+    @track(name="compose_findings")
+    async def compose_findings(state: AgentState) -> AgentState:
+        issues = (state.get("analysis") or {}).get("issues") or []
+        response = compose_rule_based_findings(issues, state.get("transactions", []))
+        return {"final_response": response}
+
     def route_after_analysis(state: AgentState) -> str:
         if state.get("final_response"):
             return END
         wants_letter = state.get("wants_letter", False)
         wants_retrieval = state.get("wants_retrieval", False)
-        issues = (state.get("analysis") or {}).get("issues") or []
+        analysis = state.get("analysis") or {}
+        issues = analysis.get("issues") or []
         if wants_letter:
             return "retrieve_laws"
         if wants_retrieval and issues:
             return "retrieve_laws"
+        # Rule-based findings are complete on their own; no synthesis needed.
+        if analysis.get("source") == "rule_based" and issues:
+            return "compose_findings"
         return "compose"
 
     def route_after_retrieve(state: AgentState) -> str:
         return "draft_letter" if state.get("wants_letter") else "compose"
 
+    @track(name="join_evidence")
+    async def join_evidence(state: AgentState) -> AgentState:
+        return {}
+
     @track(name="finalize_assistant")
-    def finalize_assistant(state: AgentState) -> AgentState:
+    async def finalize_assistant(state: AgentState) -> AgentState:
         return {"final_response": state.get("assistant_response", "")}
 
     graph.add_node("router", router)
@@ -496,22 +625,83 @@ def build_graph(client: OpenAI, kb: Optional[LegalKnowledgeBase] = None):
     graph.add_node("analyze_transactions", analyze_transactions)
     graph.add_node("retrieve_laws", retrieve_laws)
     graph.add_node("draft_letter", draft_letter)
+    graph.add_node("extract_issue", extract_issue)
+    graph.add_node("retrieve_for_letter", retrieve_laws)
+    graph.add_node("analyze_with_laws", analyze_transactions)
+    graph.add_node("retrieve_merchant_laws", retrieve_laws)
+    graph.add_node("join_evidence", join_evidence)
     graph.add_node("compose", compose)
+    graph.add_node("compose_findings", compose_findings)
     graph.add_node("finalize_assistant", finalize_assistant)
 
     graph.set_entry_point("router")
     graph.add_conditional_edges("router", route_after_router)
     graph.add_conditional_edges("analyze_transactions", route_after_analysis)
     graph.add_conditional_edges("retrieve_laws", route_after_retrieve)
+    graph.add_conditional_edges("join_evidence", route_after_retrieve)
+
+    # Fan-in: each join runs once both parallel branches have finished.
+    graph.add_edge(["retrieve_for_letter", "extract_issue"], "draft_letter")
+    graph.add_edge(["analyze_with_laws", "retrieve_merchant_laws"], "join_evidence")
 
     graph.add_edge("assistant", "finalize_assistant")
     graph.add_edge("draft_letter", "compose")
 
     graph.add_edge("compose", END)
+    graph.add_edge("compose_findings", END)
     graph.add_edge("finalize_assistant", END)
 
     return graph.compile()
 
 
+# Parallel-branch nodes reuse another node's function (and its summary).
+_NODE_SUMMARY_ALIASES = {
+    "retrieve_for_letter": "retrieve_laws",
+    "retrieve_merchant_laws": "retrieve_laws",
+    "analyze_with_laws": "analyze_transactions",
+}
+
+
+def summarize_node_update(node: str, update: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Small client-facing summary of a node's state update for progress events.
+    """
+    update = update or {}
+    node = _NODE_SUMMARY_ALIASES.get(node, node)
+    if node == "router":
+        return {
+            "intent": update.get("intent"),
+            "wants_letter": bool(update.get("wants_letter")),
+            "wants_retrieval": bool(update.get("wants_retrieval")),
+        }
+    if node == "analyze_transactions":
+        issues = (update.get("analysis") or {}).get("issues") or []
+        return {
+            "issue_count": len(issues),
+            "issues": [
+                {key: issue.get(key) for key in ("merchant", "issue", "amount")}
+                for issue in issues
+                if isinstance(issue, dict)
+            ],
+            "needs_evidence": bool(update.get("needs_evidence")),
+        }
+    if node == "retrieve_laws":
+        context = update.get("retrieval_context") or ""
+        return {"retrieval_used": bool(context), "evidence_chars": len(context)}
+    if node == "extract_issue":
+        issue = update.get("letter_issue") or {}
+        return {"merchant": issue.get("merchant"), "issue": issue.get("issue")}
+    if node == "draft_letter":
+        return {"letter_ready": bool(update.get("letter"))}
+    return {}
+
+
 def run_graph(app, state: AgentState) -> AgentState:
-    return app.invoke(state)
+    """
+    Synchronous entry point; must not be called from a running event loop.
+    """
+    return asyncio.run(app.ainvoke(state))
+
+
+async def arun_graph(app, state: AgentState) -> AgentState:
+    return await app.ainvoke(state)
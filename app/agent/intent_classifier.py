@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+INTENTS = (
+    "greeting",
+    "general_question",
+    "analyze_transactions",
+    "retrieve_laws",
+    "draft_letter",
+    "other",
+)
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent / "models" / "intent_classifier.json"
+INTENT_CLASSIFIER_PATH = Path(os.environ.get("INTENT_CLASSIFIER_PATH") or DEFAULT_MODEL_PATH)
+INTENT_CLASSIFIER_ENABLED = os.environ.get("INTENT_CLASSIFIER_ENABLED", "1").strip().lower() not in {"0", "false", "no"}
+# Append-only JSONL of routing decisions ({"text", "intent", "source"}), used as training data.
+ROUTING_TRACE_PATH = os.environ.get("ROUTING_TRACE_PATH", "").strip()
+# Intents that never reach this threshold are always escalated to the LLM router.
+NEVER = 1.01
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _features(text: str) -> List[str]:
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    features = [f"w:{token}" for token in tokens]
+    features.extend(f"b:{left}_{right}" for left, right in zip(tokens, tokens[1:]))
+    padded = f" {' '.join(tokens)} "
+    features.extend(f"c:{padded[i:i + 4]}" for i in range(len(padded) - 3))
+    return features
+
+
+@dataclass
+class IntentClassifier:
+    """
+    TF-IDF (word 1-2 grams + char 4-grams) with multinomial logistic
+    regression. Predictions below the per-intent calibrated threshold are
+    reported as None so the caller can escalate.
+    """
+
+    intents: List[str]
+    vocabulary: Dict[str, int]
+    idf: np.ndarray
+    weights: np.ndarray  # (features, intents)
+    bias: np.ndarray  # (intents,)
+    thresholds: Dict[str, float] = field(default_factory=dict)
+
+    def vectorize(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float64)
+        for row, text in enumerate(texts):
+            counts = Counter(f for f in _features(text) if f in self.vocabulary)
+            for feature, count in counts.items():
+                col = self.vocabulary[feature]
+                matrix[row, col] = (1.0 + math.log(count)) * self.idf[col]
+            norm = np.linalg.norm(matrix[row])
+            if norm:
+                matrix[row] /= norm
+        return matrix
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        return _softmax(self.vectorize(texts) @ self.weights + self.bias)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        proba = self.predict_proba([text])[0]
+        best = int(np.argmax(proba))
+        return self.intents[best], float(proba[best])
+
+    def classify(self, text: str) -> Optional[str]:
+        """
+        The predicted intent when it clears its confidence threshold, else None.
+        """
+        if not (text or "").strip():
+            return None
+        intent, confidence = self.predict(text)
+        return intent if confidence >= self.thresholds.get(intent, NEVER) else None
+
+    def to_dict(self) -> Dict[str, object]:
+        features = sorted(self.vocabulary, key=self.vocabulary.get)
+        return {
+            "intents": self.intents,
+            "features": features,
+            "idf": [round(float(v), 6) for v in self.idf],
+            "weights": [[round(float(v), 6) for v in row] for row in self.weights],
+            "bias": [round(float(v), 6) for v in self.bias],
+            "thresholds": self.thresholds,
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, object]) -> "IntentClassifier":
+        features = list(payload["features"])
+        return cls(
+            intents=list(payload["intents"]),
+            vocabulary={feature: idx for idx, feature in enumerate(features)},
+            idf=np.asarray(payload["idf"], dtype=np.float64),
+            weights=np.asarray(payload["weights"], dtype=np.float64).reshape(len(features), -1),
+            bias=np.asarray(payload["bias"], dtype=np.float64),
+            thresholds={k: float(v) for k, v in dict(payload.get("thresholds") or {}).items()},
+        )
+
+    def save(self, path: Path = INTENT_CLASSIFIER_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path = INTENT_CLASSIFIER_PATH) -> "IntentClassifier":
+        return cls.from_dict(json.loads(path.read_text(encoding="utf-8")))
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def train_intent_classifier(
+    texts: Sequence[str],
+    labels: Sequence[str],
+    min_df: int = 1,
+    l2: float = 1e-3,
+    epochs: int = 300,
+    learning_rate: float = 0.5,
+) -> IntentClassifier:
+    """
+    Fits the model with full-batch gradient descent. Thresholds are left
+    unset; see calibrate_thresholds.
+    """
+    intents = [intent for intent in INTENTS if intent in set(labels)]
+    intents += sorted(set(labels) - set(intents))
+    doc_freq: Counter = Counter()
+    for text in texts:
+        doc_freq.update(set(_features(text)))
+    features = sorted(f for f, df in doc_freq.items() if df >= min_df)
+    vocabulary = {feature: idx for idx, feature in enumerate(features)}
+    idf = np.asarray(
+        [math.log((1 + len(texts)) / (1 + doc_freq[f])) + 1.0 for f in features],
+        dtype=np.float64,
+    )
+
+    model = IntentClassifier(
+        intents=intents,
+        vocabulary=vocabulary,
+        idf=idf,
+        weights=np.zeros((len(features), len(intents)), dtype=np.float64),
+        bias=np.zeros(len(intents), dtype=np.float64),
+    )
+    x = model.vectorize(texts)
+    y = np.zeros((len(texts), len(intents)), dtype=np.float64)
+    y[np.arange(len(texts)), [intents.index(label) for label in labels]] = 1.0
+    for _ in range(epochs):
+        grad = (_softmax(x @ model.weights + model.bias) - y) / max(len(texts), 1)
+        model.weights -= learning_rate * (x.T @ grad + l2 * model.weights)
+        model.bias -= learning_rate * grad.sum(axis=0)
+    return model
+
+
+def calibrate_thresholds(
+    model: IntentClassifier,
+    texts: Sequence[str],
+    labels: Sequence[str],
+    target_precision: float = 0.95,
+    min_support: int = 3,
+) -> Dict[str, float]:
+    """
+    Per intent, the lowest confidence at which held-out predictions of that
+    intent reach `target_precision`. Intents without enough held-out
+    predictions to tell are never trusted (always escalate).
+    """
+    thresholds = {intent: NEVER for intent in model.intents}
+    if not texts:
+        return thresholds
+    proba = model.predict_proba(texts)
+    predicted = proba.argmax(axis=1)
+    confidence = proba.max(axis=1)
+    for idx, intent in enumerate(model.intents):
+        mask = predicted == idx
+        if mask.sum() < min_support:
+            continue
+        order = np.argsort(-confidence[mask], kind="stable")
+        correct = np.asarray([labels[i] == intent for i in np.flatnonzero(mask)])[order]
+        scores = confidence[mask][order]
+        precision = np.cumsum(correct) / np.arange(1, len(correct) + 1)
+        ok = np.flatnonzero(precision >= target_precision)
+        if not len(ok):
+            continue
+        cutoff = int(ok[-1])
+        if cutoff + 1 >= min_support:
+            thresholds[intent] = round(float(scores[cutoff]), 4)
+    return thresholds
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """
+    The trained classifier, loaded once; None when disabled or not trained
+    (run scripts/train_intent_classifier.py), in which case routing falls
+    back to the LLM.
+    """
+    global _classifier, _classifier_loaded
+    with _classifier_lock:
+        if not _classifier_loaded:
+            _classifier_loaded = True
+            if INTENT_CLASSIFIER_ENABLED and INTENT_CLASSIFIER_PATH.exists():
+                try:
+                    _classifier = IntentClassifier.load(INTENT_CLASSIFIER_PATH)
+                except (OSError, ValueError, KeyError):
+                    _classifier = None
+        return _classifier
+
+
+_trace_lock = threading.Lock()
+
+
+def record_routing_trace(text: str, intent: str, source: str) -> None:
+    """
+    Appends one routing decision to ROUTING_TRACE_PATH (no-op when unset).
+    """
+    if not ROUTING_TRACE_PATH or not (text or "").strip():
+        return
+    line = json.dumps({"text": text, "intent": intent, "source": source}, ensure_ascii=False)
+    try:
+        with _trace_lock, open(ROUTING_TRACE_PATH, "a", encoding="utf-8") as handle:
+            handle.write(line + "\n")
+    except OSError:
+        return
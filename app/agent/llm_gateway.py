@@ -0,0 +1,383 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+# Per-attempt budget for short calls (routing, extraction) and, for streams, the
+# wait for the first delta; connect time is included in both.
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.environ.get("LLM_ATTEMPT_TIMEOUT_SECONDS", "20") or "20")
+# Per-attempt budget for nodes that generate long text (letters, answers).
+LLM_GENERATION_TIMEOUT_SECONDS = float(os.environ.get("LLM_GENERATION_TIMEOUT_SECONDS", "120") or "120")
+# Longest gap allowed between chunks once a stream has started.
+LLM_STREAM_IDLE_TIMEOUT_SECONDS = float(os.environ.get("LLM_STREAM_IDLE_TIMEOUT_SECONDS", "20") or "20")
+# Total budget for one logical call, retries and backoff included; never shorter
+# than a single attempt's budget.
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "45") or "45")
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3") or "3")
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5") or "0.5")
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "8") or "8")
+# In-flight requests per event loop.
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32") or "32")
+# Hedged calls send a second request if the first hasn't answered by then; 0 disables.
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", "2.5") or "0")
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5") or "5")
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30") or "30")
+
+LLMClient = Union["OpenAI", "AsyncOpenAI"]
+DeltaCallback = Callable[[str], Awaitable[None]]
+
+
+@functools.lru_cache(maxsize=None)
+def _retryable() -> Tuple[type, ...]:
+    # openai is imported on first call so importing this module stays cheap.
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+    return (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError, asyncio.TimeoutError)
+
+
+def client_timeout() -> "httpx.Timeout":
+    """
+    Transport timeout for OpenAI clients used with this module. The gateway
+    enforces each call's budget, so the SDK only bounds connecting and must
+    not cut off a long generation that sends nothing until it's done.
+    """
+    import httpx
+
+    return httpx.Timeout(max(LLM_GENERATION_TIMEOUT_SECONDS, LLM_ATTEMPT_TIMEOUT_SECONDS), connect=LLM_ATTEMPT_TIMEOUT_SECONDS)
+
+
+class LLMUnavailableError(RuntimeError):
+    """
+    Raised when the model provider can't answer within the call's deadline or
+    the circuit breaker is open.
+    """
+
+
+class _CircuitBreaker:
+    """
+    Opens after `failures` consecutive failed calls; while open every call is
+    rejected until `reset_seconds` pass, then a single probe call is let through.
+    """
+
+    def __init__(self, failures: int, reset_seconds: float):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> Tuple[bool, bool]:
+        """Returns (allowed, probe); a probe must end in record() or abandon()."""
+        with self._lock:
+            if self._opened_at is None:
+                return True, False
+            if self._probing or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False, False
+            self._probing = True
+            return True, True
+
+    def abandon(self) -> None:
+        # A probe that never finished (cancelled) says nothing about the provider;
+        # the next call after it becomes the probe instead.
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            if self.failures > 0 and self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+
+class _NodeMetrics:
+    def __init__(self, window: int = 512):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def pct(q: float) -> float:
+            return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 4) if ordered else 0.0
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_p50": pct(0.5),
+            "latency_p95": pct(0.95),
+            "latency_max": round(ordered[-1], 4) if ordered else 0.0,
+        }
+
+
+_breaker = _CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+_metrics: Dict[str, _NodeMetrics] = {}
+_metrics_lock = threading.Lock()
+# asyncio primitives are bound to one loop; run_graph starts a fresh loop per call.
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    with _metrics_lock:
+        sem = _semaphores.get(loop)
+        if sem is None:
+            sem = asyncio.Semaphore(max(LLM_MAX_CONCURRENCY, 1))
+            _semaphores[loop] = sem
+        return sem
+
+
+def _record(node: str, **counts: Any) -> None:
+    with _metrics_lock:
+        metrics = _metrics.setdefault(node, _NodeMetrics())
+        latency = counts.pop("latency", None)
+        if latency is not None:
+            metrics.latencies.append(latency)
+        usage = counts.pop("usage", None)
+        if usage is not None:
+            metrics.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            metrics.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        for name, value in counts.items():
+            setattr(metrics, name, getattr(metrics, name) + value)
+
+
+def llm_metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        nodes = {node: metrics.snapshot() for node, metrics in sorted(_metrics.items())}
+    return {"circuit": _breaker.state, "nodes": nodes}
+
+
+def reset_llm_metrics() -> None:
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def _backoff(attempt: int, exc: BaseException) -> float:
+    retry_after = None
+    response = getattr(exc, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+    if retry_after is not None:
+        return min(retry_after, LLM_RETRY_MAX_DELAY)
+    # Full jitter: uniform over [0, base * 2^attempt], capped.
+    return random.uniform(0, min(LLM_RETRY_BASE_DELAY * (2 ** attempt), LLM_RETRY_MAX_DELAY))
+
+
+async def _create(client: LLMClient, kwargs: Dict[str, Any]) -> Any:
+    from openai import AsyncOpenAI
+
+    if isinstance(client, AsyncOpenAI):
+        return await client.chat.completions.create(**kwargs)
+    # The sync client runs in a worker thread so nodes never block the event loop.
+    return await asyncio.to_thread(client.chat.completions.create, **kwargs)
+
+
+async def _attempt(client: LLMClient, kwargs: Dict[str, Any], timeout: float) -> Any:
+    async with _semaphore():
+        return await asyncio.wait_for(_create(client, kwargs), timeout)
+
+
+async def _hedged(node: str, client: LLMClient, kwargs: Dict[str, Any], timeout: float, hedge_after: float) -> Any:
+    """
+    Starts a second identical request if the first is still pending after
+    `hedge_after` seconds; returns whichever succeeds first.
+    """
+    pending = {asyncio.ensure_future(_attempt(client, kwargs, timeout))}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_after)
+        if not done:
+            _record(node, hedges=1)
+            pending.add(asyncio.ensure_future(_attempt(client, kwargs, max(timeout - hedge_after, 0.001))))
+        error: Optional[BaseException] = None
+        while done or pending:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        raise error  # type: ignore[misc]
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _call_with_retries(node: str, attempt_call: Callable[[float], Awaitable[Any]], timeout: float) -> Any:
+    allowed, probe = _breaker.allow()
+    if not allowed:
+        _record(node, calls=1, errors=1)
+        raise LLMUnavailableError("Model provider is temporarily unavailable; try again shortly.")
+    settled = False
+
+    def settle(ok: bool) -> None:
+        nonlocal settled
+        settled = True
+        _breaker.record(ok)
+
+    started = time.monotonic()
+    deadline = started + max(LLM_DEADLINE_SECONDS, timeout)
+    attempt = 0
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                result = await attempt_call(min(timeout, max(remaining, 0.001)))
+            except _retryable() as exc:
+                delay = _backoff(attempt, exc)
+                if attempt >= LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                    settle(False)
+                    _record(node, calls=1, errors=1, latency=time.monotonic() - started)
+                    raise LLMUnavailableError(f"Model call for {node} failed after {attempt + 1} attempt(s): {type(exc).__name__} {exc}".strip()) from exc
+                attempt += 1
+                _record(node, retries=1)
+                await asyncio.sleep(delay)
+                continue
+            except LLMUnavailableError:
+                settle(False)
+                _record(node, calls=1, errors=1, latency=time.monotonic() - started)
+                raise
+            except Exception:
+                # Bad requests and auth errors won't improve on retry; the provider did answer, though.
+                settle(True)
+                _record(node, calls=1, errors=1, latency=time.monotonic() - started)
+                raise
+            settle(True)
+            _record(node, calls=1, latency=time.monotonic() - started, usage=getattr(result, "usage", None))
+            return result
+    finally:
+        # Cancellation (client disconnect, hedge loser, route timeout) skips settle();
+        # a half-open probe must still be released or the breaker never closes.
+        if probe and not settled:
+            _breaker.abandon()
+
+
+async def chat_completion(
+    client: LLMClient,
+    node: str,
+    hedge: bool = False,
+    timeout: Optional[float] = None,
+    **kwargs: Any,
+) -> Any:
+    """
+    client.chat.completions.create with a deadline, jittered retries on
+    transient errors (timeouts, 429, 5xx), the shared concurrency limit and
+    circuit breaker, and per-node latency/token metrics. `timeout` is the
+    per-attempt budget (LLM_ATTEMPT_TIMEOUT_SECONDS by default); nodes that
+    generate long text pass LLM_GENERATION_TIMEOUT_SECONDS. With `hedge`, a
+    slow first attempt is raced against a duplicate request; that only
+    applies on the short budget, since a long generation is routinely slower
+    than LLM_HEDGE_AFTER_SECONDS and hedging it would double its cost.
+    """
+    budget = timeout or LLM_ATTEMPT_TIMEOUT_SECONDS
+    hedge_after = LLM_HEDGE_AFTER_SECONDS if hedge and budget <= LLM_ATTEMPT_TIMEOUT_SECONDS else 0
+
+    async def attempt_call(budget: float) -> Any:
+        if hedge_after and hedge_after < budget:
+            return await _hedged(node, client, kwargs, budget, hedge_after)
+        return await _attempt(client, kwargs, budget)
+
+    return await _call_with_retries(node, attempt_call, budget)
+
+
+async def stream_chat_completion(
+    client: "AsyncOpenAI",
+    node: str,
+    on_delta: DeltaCallback,
+    first_token_timeout: Optional[float] = None,
+    **kwargs: Any,
+) -> str:
+    """
+    Streams a completion, passing each text delta to `on_delta`, and returns
+    the full text. The first delta must arrive within `first_token_timeout`
+    (LLM_ATTEMPT_TIMEOUT_SECONDS by default) and later chunks within
+    LLM_STREAM_IDLE_TIMEOUT_SECONDS of each other; there is no cap on the
+    whole stream, so a long letter finishes as long as it keeps moving.
+    Retries only happen before the first delta arrives.
+    """
+    emitted = False
+
+    async def attempt_call(budget: float) -> Any:
+        nonlocal emitted
+        usage = None
+        parts = []
+        loop = asyncio.get_running_loop()
+        first_by = loop.time() + budget
+
+        def wait_limit() -> float:
+            return LLM_STREAM_IDLE_TIMEOUT_SECONDS if emitted else max(first_by - loop.time(), 0.001)
+
+        async with _semaphore():
+            stream = None
+            try:
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **kwargs,
+                    ),
+                    wait_limit(),
+                )
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), wait_limit())
+                    except StopAsyncIteration:
+                        break
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        emitted = True
+                        await on_delta(delta)
+            except _retryable() as exc:
+                if emitted:
+                    # Partial output already reached the caller; a retry would repeat it.
+                    raise LLMUnavailableError(f"Model stream for {node} was interrupted: {type(exc).__name__} {exc}".strip()) from exc
+                raise
+            finally:
+                if stream is not None:
+                    await stream.close()
+        return SimpleNamespace(text="".join(parts), usage=usage)
+
+    result = await _call_with_retries(node, attempt_call, first_token_timeout or LLM_ATTEMPT_TIMEOUT_SECONDS)
+    return result.text
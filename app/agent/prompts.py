@@ -30,6 +30,9 @@ Transaction questions (highest/lowest/total/recent/merchant/category) should be
 
 FISCAL_SENTINEL_ANALYSIS_PROMPT = """
 You analyze transactions for suspicious charges. Use the provided transactions.
+The data is a compact summary (overview, recurring candidates, outliers, per-merchant totals)
+followed by a pipe-separated table; it may be one part of a larger statement, so judge
+merchants not listed in the table from the summary.
 Return ONLY JSON:
 {
   "issues": [
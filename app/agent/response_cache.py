@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "2048") or "2048")
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600") or "3600")
+# Preceding messages (besides the prompt itself) that scope a cache entry.
+RESPONSE_CACHE_HISTORY_TURNS = int(os.environ.get("RESPONSE_CACHE_HISTORY_TURNS", "4") or "4")
+RESPONSE_CACHE_SEMANTIC = os.environ.get("RESPONSE_CACHE_SEMANTIC", "0").strip().lower() in {"1", "true", "yes"}
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.95") or "0.95")
+
+Embedder = Callable[[List[str]], List[List[float]]]
+
+
+def normalize_prompt(text: str) -> str:
+    text = re.sub(r"[^\w\s']", " ", (text or "").lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def history_digest(history: Optional[List[Dict[str, str]]], turns: int = RESPONSE_CACHE_HISTORY_TURNS) -> str:
+    recent = (history or [])[-turns:] if turns > 0 else []
+    material = json.dumps(
+        [[msg.get("role", ""), normalize_prompt(msg.get("content", ""))] for msg in recent],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    scope: str
+    vector: Optional[np.ndarray] = None
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache for LLM responses keyed on the normalized prompt and a
+    digest of the recent history. With an embedder, a miss falls back to the
+    most similar cached prompt under the same history digest.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        embedder: Optional[Embedder] = None,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedder = embedder
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.embedder is not None
+
+    def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        if not self.embedder or not prompt:
+            return None
+        try:
+            return np.asarray(self.embedder([prompt])[0], dtype=np.float32)
+        except Exception:
+            return None
+
+    def get(self, prompt: str, history: Optional[List[Dict[str, str]]] = None) -> Any:
+        """
+        Returns the cached value or None. May call the embedder (blocking).
+        """
+        normalized = normalize_prompt(prompt)
+        scope = history_digest(history)
+        key = f"{scope}:{normalized}"
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry.value
+            if entry is not None:
+                del self._entries[key]
+            if not self.semantic:
+                self._misses += 1
+                return None
+
+        vector = self._embed(normalized)
+        with self._lock:
+            if vector is not None:
+                candidates = [
+                    (candidate_key, entry)
+                    for candidate_key, entry in self._entries.items()
+                    if entry.scope == scope and entry.vector is not None and entry.expires_at > now
+                ]
+                if candidates:
+                    scores = np.stack([entry.vector for _, entry in candidates]) @ vector
+                    best = int(np.argmax(scores))
+                    if float(scores[best]) >= self.similarity:
+                        candidate_key, entry = candidates[best]
+                        self._entries.move_to_end(candidate_key)
+                        self._semantic_hits += 1
+                        return entry.value
+            self._misses += 1
+            return None
+
+    def put(self, prompt: str, history: Optional[List[Dict[str, str]]], value: Any) -> None:
+        if value is None or value == "" or value == {}:
+            return
+        normalized = normalize_prompt(prompt)
+        if not normalized:
+            return
+        scope = history_digest(history)
+        vector = self._embed(normalized) if self.semantic else None
+        with self._lock:
+            key = f"{scope}:{normalized}"
+            self._entries[key] = _Entry(
+                value=value,
+                expires_at=time.monotonic() + self.ttl_seconds,
+                scope=scope,
+                vector=vector,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._hits + self._semantic_hits
+            lookups = hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "semantic_hits": self._semantic_hits,
+                "misses": self._misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "semantic": self.semantic,
+            }
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(name: str, embedder: Optional[Embedder] = None) -> ResponseCache:
+    """
+    Process-wide cache per name, so every compiled graph shares hits and
+    metrics. The semantic tier is only enabled with RESPONSE_CACHE_SEMANTIC.
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = ResponseCache(name, embedder=embedder if RESPONSE_CACHE_SEMANTIC else None)
+            _caches[name] = cache
+        elif cache.embedder is None and embedder is not None and RESPONSE_CACHE_SEMANTIC:
+            cache.embedder = embedder
+        return cache
+
+
+def response_cache_stats() -> Dict[str, Dict[str, Any]]:
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
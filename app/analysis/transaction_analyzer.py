@@ -1,192 +1,328 @@
 from __future__ import annotations
 
-from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 
-def _parse_date(value: Any) -> Optional[datetime]:
-    if not value:
+from app.analysis.transaction_frame import NO_DATE, TransactionFrame, get_frame
+
+
+class RuleContext:
+    """
+    Per-run state shared by every rule: the frame plus keyword hit tables.
+
+    Keyword checks are evaluated once per distinct (already lowercased) notes or
+    category string and then looked up per row by code, so adding a rule never
+    adds another pass over the raw text.
+    """
+
+    def __init__(self, frame: TransactionFrame):
+        self.frame = frame
+        self._note_hits: Dict[Tuple[str, ...], np.ndarray] = {}
+        self._category_hits: Dict[Tuple[str, ...], np.ndarray] = {}
+
+    @staticmethod
+    def _row_hits(values: List[str], codes: np.ndarray, needles: Tuple[str, ...]) -> np.ndarray:
+        table = np.asarray([any(n in value for n in needles) for value in values], dtype=bool)
+        return table[codes] if len(table) else np.zeros(len(codes), dtype=bool)
+
+    def note_hits(self, needles: Tuple[str, ...]) -> np.ndarray:
+        """
+        Per-row flags: does the row's notes text contain any of `needles`?
+        """
+        hits = self._note_hits.get(needles)
+        if hits is None:
+            hits = self._row_hits(self.frame.notes_lower, self.frame.note_code, needles)
+            self._note_hits[needles] = hits
+        return hits
+
+    def category_hits(self, needles: Tuple[str, ...]) -> np.ndarray:
+        hits = self._category_hits.get(needles)
+        if hits is None:
+            hits = self._row_hits(self.frame.category_texts, self.frame.category_code, needles)
+            self._category_hits[needles] = hits
+        return hits
+
+
+@dataclass
+class MerchantGroup:
+    merchant: str
+    rows: np.ndarray  # row indices in original order
+    dated: np.ndarray  # dated row indices, stably sorted by date
+    context: RuleContext
+
+    @property
+    def frame(self) -> TransactionFrame:
+        return self.context.frame
+
+    def amount(self, row: int) -> float:
+        return float(self.frame.amount[row])
+
+    def days(self) -> List[Tuple[int, np.ndarray]]:
+        """
+        Dated rows split per calendar day, in order of each day's first charge.
+        """
+        if not len(self.dated):
+            return []
+        ordinals = self.frame.date_ordinal[self.dated]
+        boundaries = np.flatnonzero(np.diff(ordinals)) + 1
+        runs = np.split(self.dated, boundaries)
+        days = [(int(self.frame.date_ordinal[run[0]]), run) for run in runs]
+        days.sort(key=lambda item: item[1].min())
+        return days
+
+
+RuleFn = Callable[[MerchantGroup], Optional[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    evaluate: RuleFn
+
+
+RULES: List[Rule] = []
+
+
+def register_rule(name: str) -> Callable[[RuleFn], RuleFn]:
+    """
+    Registers a per-merchant rule. Rules run in registration order and each may
+    return at most one issue per merchant group.
+    """
+
+    def decorator(fn: RuleFn) -> RuleFn:
+        RULES.append(Rule(name=name, evaluate=fn))
+        return fn
+
+    return decorator
+
+
+def _issue(merchant: str, issue: str, amount: float, reason: str) -> Dict[str, Any]:
+    return {
+        "merchant": merchant,
+        "issue": issue,
+        "amount": amount,
+        "reason": reason,
+        "needs_evidence": False,
+    }
+
+
+def register_notes_rule(name: str, needles: List[str], issue: str, reason: str) -> None:
+    """
+    Declares a rule that flags the first charge whose notes mention any needle.
+    """
+    key = tuple(needles)
+
+    def evaluate(group: MerchantGroup) -> Optional[Dict[str, Any]]:
+        hits = group.context.note_hits(key)[group.rows]
+        if not hits.any():
+            return None
+        row = int(group.rows[int(np.argmax(hits))])
+        return _issue(group.merchant, issue, group.amount(row), reason)
+
+    RULES.append(Rule(name=name, evaluate=evaluate))
+
+
+# Rule 1: Duplicate charges (same merchant + amount within 1 day)
+@register_rule("duplicate_charge")
+def _duplicate_charge(group: MerchantGroup) -> Optional[Dict[str, Any]]:
+    ordered = group.dated
+    if len(ordered) < 2:
         return None
-    if isinstance(value, datetime):
-        return value
-    text = str(value).strip()
-    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%d-%m-%Y"):
-        try:
-            return datetime.strptime(text, fmt)
-        except ValueError:
-            continue
-    return None
+    amounts = group.frame.amount[ordered]
+    hits = (np.diff(group.frame.date_ordinal[ordered]) <= 1) & (amounts[1:] == amounts[:-1])
+    if not hits.any():
+        return None
+    curr = int(ordered[int(np.argmax(hits)) + 1])
+    return _issue(
+        group.merchant,
+        "Possible duplicate charge",
+        group.amount(curr),
+        "Same amount charged twice within 24 hours.",
+    )
+
+
+# Rule 2: Price increase for recurring subscriptions
+_SUBSCRIPTION_WORDS = ("subscription", "recurring", "plan", "membership")
+
+
+@register_rule("subscription_price_increase")
+def _subscription_price_increase(group: MerchantGroup) -> Optional[Dict[str, Any]]:
+    if len(group.rows) < 2 or len(group.dated) < 2:
+        return None
+    prev_row = int(group.dated[-2])
+    curr_row = int(group.dated[-1])
+    prev_amt = group.amount(prev_row)
+    curr_amt = group.amount(curr_row)
+    if not (prev_amt > 0 and curr_amt > prev_amt * 1.1):
+        return None
+    context = group.context
+    recurring = (
+        context.note_hits(_SUBSCRIPTION_WORDS)[curr_row]
+        or context.category_hits(_SUBSCRIPTION_WORDS)[curr_row]
+    )
+    if not recurring:
+        return None
+    return _issue(
+        group.merchant,
+        "Possible price increase on subscription",
+        curr_amt,
+        f"Amount increased from {prev_amt:.2f} to {curr_amt:.2f}.",
+    )
+
+
+# Rule 3: Cancellation friction or post-cancel billing
+register_notes_rule(
+    "cancellation_friction",
+    ["cancel", "cancellation", "terminate", "in person"],
+    "Cancellation friction or billing after cancel request",
+    "Notes mention cancellation or in-person requirement.",
+)
+
+# Rule 4: Free trial conversion without notice
+register_notes_rule(
+    "free_trial_conversion",
+    ["free trial", "trial ended", "trial"],
+    "Free trial converted to paid plan",
+    "Charge occurred after a trial period.",
+)
+
+
+# Rule 5: Unexpected fees
+_FEE_WORDS = ("fee", "fees", "maintenance")
 
 
-def _text_contains(text: str, needles: List[str]) -> bool:
-    lower = text.lower()
-    return any(n in lower for n in needles)
-
-
-def analyze_transactions_rule_based(transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    issues: List[Dict[str, Any]] = []
-    by_merchant: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-
-    for tx in transactions:
-        merchant = (tx.get("merchant_name") or "Unknown Merchant").strip()
-        by_merchant[merchant].append(tx)
-
-    # Rule 1: Duplicate charges (same merchant + amount within 1 day)
-    for merchant, txs in by_merchant.items():
-        indexed = []
-        for tx in txs:
-            date = _parse_date(tx.get("date"))
-            if not date:
-                continue
-            indexed.append((date, tx))
-        indexed.sort(key=lambda x: x[0])
-
-        for i in range(1, len(indexed)):
-            prev_date, prev_tx = indexed[i - 1]
-            curr_date, curr_tx = indexed[i]
-            if (
-                abs((curr_date - prev_date).days) <= 1
-                and float(curr_tx.get("amount", 0.0)) == float(prev_tx.get("amount", 0.0))
-            ):
-                issues.append(
-                    {
-                        "merchant": merchant,
-                        "issue": "Possible duplicate charge",
-                        "amount": float(curr_tx.get("amount", 0.0)),
-                        "reason": "Same amount charged twice within 24 hours.",
-                        "needs_evidence": False,
-                    }
-                )
-                break
-
-    # Rule 2: Price increase for recurring subscriptions
-    for merchant, txs in by_merchant.items():
-        if len(txs) < 2:
+@register_rule("unexpected_fee")
+def _unexpected_fee(group: MerchantGroup) -> Optional[Dict[str, Any]]:
+    if any(word in group.merchant.lower() for word in _FEE_WORDS):
+        row = int(group.rows[0])
+    else:
+        context = group.context
+        hits = context.note_hits(_FEE_WORDS)[group.rows] | context.category_hits(_FEE_WORDS)[group.rows]
+        if not hits.any():
+            return None
+        row = int(group.rows[int(np.argmax(hits))])
+    return _issue(
+        group.merchant,
+        "Unexpected fee",
+        group.amount(row),
+        "Charge categorized as a fee or described as maintenance.",
+    )
+
+
+# Rule 6: Chargeback or dispute fees
+register_notes_rule(
+    "chargeback_fee",
+    ["chargeback fee", "dispute fee", "returned item fee"],
+    "Possible chargeback/dispute fee",
+    "Notes mention a chargeback or dispute-related fee.",
+)
+
+
+# Rule 7: Multiple same-day charges (possible split billing)
+@register_rule("same_day_charges")
+def _same_day_charges(group: MerchantGroup) -> Optional[Dict[str, Any]]:
+    for day, rows in group.days():
+        if len(rows) < 2:
             continue
-        indexed = []
-        for tx in txs:
-            date = _parse_date(tx.get("date"))
-            if not date:
-                continue
-            indexed.append((date, tx))
-        indexed.sort(key=lambda x: x[0])
-        if len(indexed) < 2:
+        amounts = group.frame.amount[np.sort(rows)].tolist()
+        if len(set(amounts)) == 1:
+            continue  # duplicates handled earlier
+        total = sum(amounts)
+        if total <= 0:
             continue
-        prev_tx = indexed[-2][1]
-        curr_tx = indexed[-1][1]
-        prev_amt = float(prev_tx.get("amount", 0.0))
-        curr_amt = float(curr_tx.get("amount", 0.0))
-        notes = (curr_tx.get("notes") or "").lower()
-        category = curr_tx.get("category") or []
-        category_text = " ".join(category) if isinstance(category, list) else str(category)
-
-        if prev_amt > 0 and curr_amt > prev_amt * 1.1 and _text_contains(
-            f"{notes} {category_text}", ["subscription", "recurring", "plan", "membership"]
-        ):
-            issues.append(
-                {
-                    "merchant": merchant,
-                    "issue": "Possible price increase on subscription",
-                    "amount": curr_amt,
-                    "reason": f"Amount increased from {prev_amt:.2f} to {curr_amt:.2f}.",
-                    "needs_evidence": False,
-                }
-            )
+        return _issue(
+            group.merchant,
+            "Multiple same-day charges",
+            total,
+            f"{len(rows)} charges on {date.fromordinal(day).strftime('%Y-%m-%d')}. Possible split billing.",
+        )
+    return None
+
+
+def _merchant_groups(context: RuleContext) -> List[MerchantGroup]:
+    frame = context.frame
+    names: List[str] = []
+    name_index: Dict[str, int] = {}
+    code_to_group = np.zeros(len(frame.merchants), dtype=np.int64)
+    for code, raw in enumerate(frame.merchants):
+        name = (raw or "Unknown Merchant").strip()
+        if name not in name_index:
+            name_index[name] = len(names)
+            names.append(name)
+        code_to_group[code] = name_index[name]
+    if not len(frame):
+        return []
 
-    # Rule 3: Cancellation friction or post-cancel billing
-    for merchant, txs in by_merchant.items():
-        for tx in txs:
-            notes = (tx.get("notes") or "")
-            if _text_contains(notes, ["cancel", "cancellation", "terminate", "in person"]):
-                issues.append(
-                    {
-                        "merchant": merchant,
-                        "issue": "Cancellation friction or billing after cancel request",
-                        "amount": float(tx.get("amount", 0.0)),
-                        "reason": "Notes mention cancellation or in-person requirement.",
-                        "needs_evidence": False,
-                    }
-                )
-                break
-
-    # Rule 4: Free trial conversion without notice
-    for merchant, txs in by_merchant.items():
-        for tx in txs:
-            notes = (tx.get("notes") or "")
-            if _text_contains(notes, ["free trial", "trial ended", "trial"]):
-                issues.append(
-                    {
-                        "merchant": merchant,
-                        "issue": "Free trial converted to paid plan",
-                        "amount": float(tx.get("amount", 0.0)),
-                        "reason": "Charge occurred after a trial period.",
-                        "needs_evidence": False,
-                    }
-                )
-                break
-
-    # Rule 5: Unexpected fees
-    for merchant, txs in by_merchant.items():
-        for tx in txs:
-            category = tx.get("category") or []
-            category_text = " ".join(category) if isinstance(category, list) else str(category)
-            notes = (tx.get("notes") or "")
-            if _text_contains(f"{merchant} {notes} {category_text}", ["fee", "fees", "maintenance"]):
-                issues.append(
-                    {
-                        "merchant": merchant,
-                        "issue": "Unexpected fee",
-                        "amount": float(tx.get("amount", 0.0)),
-                        "reason": "Charge categorized as a fee or described as maintenance.",
-                        "needs_evidence": False,
-                    }
-                )
-                break
-
-    # Rule 6: Chargeback or dispute fees
-    for merchant, txs in by_merchant.items():
-        for tx in txs:
-            notes = (tx.get("notes") or "")
-            if _text_contains(notes, ["chargeback fee", "dispute fee", "returned item fee"]):
-                issues.append(
-                    {
-                        "merchant": merchant,
-                        "issue": "Possible chargeback/dispute fee",
-                        "amount": float(tx.get("amount", 0.0)),
-                        "reason": "Notes mention a chargeback or dispute-related fee.",
-                        "needs_evidence": False,
-                    }
-                )
-                break
-
-    # Rule 7: Multiple same-day charges (possible split billing)
-    for merchant, txs in by_merchant.items():
-        by_date: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-        for tx in txs:
-            date = _parse_date(tx.get("date"))
-            if not date:
-                continue
-            by_date[date.strftime("%Y-%m-%d")].append(tx)
-
-        for day, day_txs in by_date.items():
-            if len(day_txs) < 2:
-                continue
-            amounts = [float(tx.get("amount", 0.0)) for tx in day_txs]
-            if len(set(amounts)) == 1:
-                continue  # duplicates handled earlier
-            total = sum(amounts)
-            if total <= 0:
-                continue
-            issues.append(
-                {
-                    "merchant": merchant,
-                    "issue": "Multiple same-day charges",
-                    "amount": total,
-                    "reason": f"{len(day_txs)} charges on {day}. Possible split billing.",
-                    "needs_evidence": False,
-                }
+    # One stable sort by (merchant, date) yields every group's date-ordered rows;
+    # undated rows sort first within a group and are split off.
+    group_ids = code_to_group[frame.merchant_code]
+    order = np.lexsort((frame.date_ordinal, group_ids))
+    sorted_ids = group_ids[order]
+    boundaries = np.flatnonzero(np.diff(sorted_ids)) + 1
+    groups: List[MerchantGroup] = []
+    for by_date in np.split(order, boundaries):
+        dated = by_date[frame.date_ordinal[by_date] != NO_DATE]
+        groups.append(
+            MerchantGroup(
+                merchant=names[int(group_ids[by_date[0]])],
+                rows=np.sort(by_date),
+                dated=dated,
+                context=context,
             )
-            break
+        )
+    groups.sort(key=lambda group: group.rows[0])
+    return groups
+
+
+def ruleset_signature(rules: Optional[List[Rule]] = None) -> str:
+    """
+    Identifies the active rule set; persisted issues built with a different
+    signature are recomputed.
+    """
+    return ",".join(rule.name for rule in (RULES if rules is None else rules))
+
+
+def analyze_by_merchant(
+    transactions: Union[Sequence[Dict[str, Any]], TransactionFrame],
+    rules: Optional[List[Rule]] = None,
+) -> "OrderedDict[str, List[Tuple[str, Dict[str, Any]]]]":
+    """
+    Runs every rule over every merchant group in a single sweep. Returns
+    merchant -> [(rule name, issue)] in first-seen merchant order; merchants
+    without findings map to an empty list.
+    """
+    active = RULES if rules is None else rules
+    context = RuleContext(get_frame(transactions))
+    results: "OrderedDict[str, List[Tuple[str, Dict[str, Any]]]]" = OrderedDict()
+    for group in _merchant_groups(context):
+        found = results.setdefault(group.merchant, [])
+        for rule in active:
+            issue = rule.evaluate(group)
+            if issue is not None:
+                found.append((rule.name, issue))
+    return results
+
+
+def merge_merchant_issues(groups: Iterable[Sequence[Tuple[str, Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    Flattens per-merchant findings (given in merchant order) into the report
+    order: rule by rule, merchants in the given order within each rule.
+    """
+    position = {rule.name: idx for idx, rule in enumerate(RULES)}
+    flat = [
+        (position.get(name, len(position)), merchant_idx, issue)
+        for merchant_idx, found in enumerate(groups)
+        for name, issue in found
+    ]
+    flat.sort(key=lambda item: (item[0], item[1]))
+    return [issue for _, _, issue in flat]
+
 
-    return issues
+def analyze_transactions_rule_based(
+    transactions: Union[Sequence[Dict[str, Any]], TransactionFrame],
+) -> List[Dict[str, Any]]:
+    return merge_merchant_issues(analyze_by_merchant(transactions).values())
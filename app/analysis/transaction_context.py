@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.analysis.transaction_frame import NO_DATE, TransactionFrame, get_frame
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "6000") or "6000")
+CONTEXT_MAX_CHUNKS = int(os.environ.get("CONTEXT_MAX_CHUNKS", "8") or "8")
+# Share of each prompt's budget reserved for the summary sections.
+SUMMARY_BUDGET_SHARE = 0.35
+NOTES_MAX_CHARS = 80
+
+# (name, min gap days, max gap days, min charges)
+_CADENCES = (("weekly", 6, 8, 3), ("monthly", 26, 35, 2), ("quarterly", 85, 95, 2), ("annual", 355, 375, 2))
+# Share of gaps that must fall in the cadence window.
+_CADENCE_REGULARITY = 0.6
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about 4 characters per token for English/numeric text).
+    """
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _fmt_date(ordinal: int) -> str:
+    return date.fromordinal(int(ordinal)).strftime("%Y-%m-%d") if ordinal != NO_DATE else ""
+
+
+def _cell(value: Any) -> str:
+    return " ".join(str(value or "").replace("|", "/").split())
+
+
+@dataclass
+class _MerchantStats:
+    merchant: str
+    rows: np.ndarray
+    count: int
+    total: float
+    mean: float
+    minimum: float
+    maximum: float
+    first: int
+    last: int
+
+
+def _merchant_stats(frame: TransactionFrame) -> List[_MerchantStats]:
+    if not len(frame):
+        return []
+    order = np.argsort(frame.merchant_code, kind="stable")
+    boundaries = np.flatnonzero(np.diff(frame.merchant_code[order])) + 1
+    stats: List[_MerchantStats] = []
+    for rows in np.split(order, boundaries):
+        amounts = frame.amount[rows]
+        ordinals = frame.date_ordinal[rows]
+        dated = ordinals[ordinals != NO_DATE]
+        stats.append(
+            _MerchantStats(
+                merchant=frame.merchants[int(frame.merchant_code[rows[0]])] or "Unknown Merchant",
+                rows=rows,
+                count=len(rows),
+                total=float(amounts.sum()),
+                mean=float(amounts.mean()),
+                minimum=float(amounts.min()),
+                maximum=float(amounts.max()),
+                first=int(dated.min()) if len(dated) else NO_DATE,
+                last=int(dated.max()) if len(dated) else NO_DATE,
+            )
+        )
+    stats.sort(key=lambda s: (-s.total, s.merchant))
+    return stats
+
+
+def _recurring_lines(frame: TransactionFrame, stats: List[_MerchantStats]) -> List[str]:
+    lines: List[str] = []
+    for item in stats:
+        dated = item.rows[frame.date_ordinal[item.rows] != NO_DATE]
+        if len(dated) < 2:
+            continue
+        dated = dated[np.argsort(frame.date_ordinal[dated], kind="stable")]
+        gaps = np.diff(frame.date_ordinal[dated])
+        gaps = gaps[gaps > 0]
+        if not len(gaps):
+            continue
+        median_gap = float(np.median(gaps))
+        cadence = next(
+            (
+                name
+                for name, low, high, min_charges in _CADENCES
+                if low <= median_gap <= high
+                and len(dated) >= min_charges
+                and float(np.mean((gaps >= low) & (gaps <= high))) >= _CADENCE_REGULARITY
+            ),
+            None,
+        )
+        if cadence is None:
+            continue
+        amounts = frame.amount[dated]
+        typical = float(np.median(amounts))
+        last_amount = float(amounts[-1])
+        change = f"{(last_amount - typical) / typical:+.0%}" if typical else "n/a"
+        lines.append(
+            f"{_cell(item.merchant)}|{cadence}|{len(dated)}|{typical:.2f}|{last_amount:.2f}|{change}|{_fmt_date(item.last)}"
+        )
+    return lines
+
+
+def _outlier_lines(frame: TransactionFrame, stats: List[_MerchantStats], limit: int = 20) -> List[str]:
+    scored = []
+    for item in stats:
+        if item.count < 3:
+            continue
+        amounts = frame.amount[item.rows]
+        median = float(np.median(amounts))
+        mad = float(np.median(np.abs(amounts - median))) or max(abs(median) * 0.05, 0.01)
+        scores = np.abs(amounts - median) / (1.4826 * mad)
+        for row, score in zip(item.rows[scores > 3.5], scores[scores > 3.5]):
+            scored.append((float(score), int(row), median))
+    scored.sort(key=lambda entry: -entry[0])
+    lines = []
+    for score, row, median in scored[:limit]:
+        tx = frame.rows[row]
+        lines.append(
+            f"{_fmt_date(frame.date_ordinal[row])}|{_cell(tx.get('merchant_name'))}|{frame.amount[row]:.2f}|{median:.2f}|{score:.1f}"
+        )
+    return lines
+
+
+def _row_line(frame: TransactionFrame, row: int) -> str:
+    tx = frame.rows[row]
+    category = tx.get("category") or []
+    if isinstance(category, list):
+        category = ",".join(str(c) for c in category)
+    notes = _cell(tx.get("notes"))
+    if len(notes) > NOTES_MAX_CHARS:
+        notes = notes[: NOTES_MAX_CHARS - 3] + "..."
+    return (
+        f"{_fmt_date(frame.date_ordinal[row])}|{_cell(tx.get('merchant_name'))}|"
+        f"{frame.amount[row]:.2f}|{_cell(category)}|{notes}"
+    )
+
+
+def _fit(header: str, lines: List[str], budget: int) -> List[str]:
+    """
+    Header plus as many lines as fit in `budget` tokens (with an omission note).
+    """
+    if not lines:
+        return []
+    out = [header]
+    used = estimate_tokens(header)
+    for idx, line in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            out.append(f"... {len(lines) - idx} more omitted")
+            break
+        out.append(line)
+        used += cost
+    return out
+
+
+def _summary(frame: TransactionFrame, stats: List[_MerchantStats], budget: int) -> str:
+    amounts = frame.amount
+    dated = frame.date_ordinal[frame.dated()]
+    overview = [
+        "OVERVIEW",
+        f"transactions={len(frame)} merchants={len(stats)} "
+        f"from={_fmt_date(dated.min()) if len(dated) else ''} to={_fmt_date(dated.max()) if len(dated) else ''} "
+        f"money_out={float(amounts[amounts > 0].sum()):.2f} money_in={float(-amounts[amounts < 0].sum()) + 0.0:.2f}",
+        "(positive amount = money out, negative = money in)",
+    ]
+    remaining = max(budget - estimate_tokens("\n".join(overview)), 0)
+    recurring = _fit(
+        "RECURRING CANDIDATES merchant|cadence|charges|typical|last|last_vs_typical|last_date",
+        _recurring_lines(frame, stats),
+        remaining // 3,
+    )
+    remaining -= estimate_tokens("\n".join(recurring))
+    outliers = _fit(
+        "OUTLIERS date|merchant|amount|merchant_median|robust_z",
+        _outlier_lines(frame, stats),
+        remaining // 2,
+    )
+    remaining -= estimate_tokens("\n".join(outliers))
+    merchants = _fit(
+        "MERCHANTS merchant|count|total|mean|min|max|first|last",
+        [
+            f"{_cell(s.merchant)}|{s.count}|{s.total:.2f}|{s.mean:.2f}|{s.minimum:.2f}|{s.maximum:.2f}|"
+            f"{_fmt_date(s.first)}|{_fmt_date(s.last)}"
+            for s in stats
+        ],
+        remaining,
+    )
+    return "\n\n".join("\n".join(section) for section in (overview, recurring, outliers, merchants) if section)
+
+
+_TABLE_HEADER = "TRANSACTIONS date|merchant|amount|category|notes"
+
+
+def build_context_chunks(
+    transactions: Union[Sequence[Dict[str, Any]], TransactionFrame],
+    token_budget: Optional[int] = None,
+    max_chunks: Optional[int] = None,
+) -> List[str]:
+    """
+    Compact prompt context for LLM analysis, each string within `token_budget`.
+
+    Every chunk starts with the same summary (overview, recurring-charge
+    candidates, outliers, per-merchant aggregates) followed by a pipe-separated
+    transaction table. When all rows do not fit in one prompt they are split
+    into chunks for map-reduce, keeping each merchant's rows together; rows
+    beyond `max_chunks` chunks are left to the summary.
+    """
+    budget = token_budget or CONTEXT_TOKEN_BUDGET
+    limit = max_chunks or CONTEXT_MAX_CHUNKS
+    frame = get_frame(transactions)
+    stats = _merchant_stats(frame)
+    summary = _summary(frame, stats, int(budget * SUMMARY_BUDGET_SHARE))
+    table_budget = max(budget - estimate_tokens(summary) - estimate_tokens(_TABLE_HEADER) - 8, 1)
+
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    omitted = 0
+    # Highest-spend merchants first, so any rows left out are the smallest.
+    for item in stats:
+        lines = [_row_line(frame, int(row)) for row in np.sort(item.rows)]
+        if len(chunks) >= limit:
+            omitted += len(lines)
+            continue
+        cost = sum(estimate_tokens(line) + 1 for line in lines)
+        if current and used + cost > table_budget:
+            chunks.append(current)
+            current, used = [], 0
+        for pos, line in enumerate(lines):
+            line_cost = estimate_tokens(line) + 1
+            if current and used + line_cost > table_budget:
+                chunks.append(current)
+                current, used = [], 0
+            if len(chunks) >= limit:
+                omitted += len(lines) - pos
+                break
+            current.append(line)
+            used += line_cost
+    if current:
+        chunks.append(current)
+
+    if not chunks:
+        return [summary]
+    rendered = []
+    for idx, lines in enumerate(chunks):
+        header = _TABLE_HEADER if len(chunks) == 1 else f"{_TABLE_HEADER} (part {idx + 1} of {len(chunks)})"
+        body = "\n".join([header] + lines)
+        if omitted and idx == len(chunks) - 1:
+            body += f"\n... {omitted} more transactions omitted (covered by the summary above)"
+        rendered.append(f"{summary}\n\n{body}")
+    return rendered
+
+
+def merge_chunk_issues(results: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reduce step: concatenates per-chunk issues, dropping repeats of the same
+    merchant/issue pair reported by more than one chunk.
+    """
+    merged: List[Dict[str, Any]] = []
+    seen = set()
+    for result in results:
+        for issue in (result or {}).get("issues") or []:
+            if not isinstance(issue, dict):
+                continue
+            key = (
+                str(issue.get("merchant") or "").strip().lower(),
+                str(issue.get("issue") or "").strip().lower(),
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(issue)
+    return merged
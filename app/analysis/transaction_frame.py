@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%d-%m-%Y")
+NO_DATE = 0  # date.toordinal() is always >= 1
+
+
+def parse_tx_date(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def coerce_amount(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _Codes:
+    def __init__(self) -> None:
+        self.index: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def code(self, value: str) -> int:
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(value)
+        return code
+
+
+@dataclass
+class TransactionFrame:
+    """
+    Columnar view over a list of transaction dicts.
+
+    Amounts and dates are parsed once into NumPy arrays; merchant, category,
+    notes and currency strings are dictionary-encoded (text columns are
+    lowercased once per distinct value) so filters and group-bys run over
+    integer codes. Codes are assigned in first-appearance order, which keeps
+    tie-breaking identical to the list-of-dicts implementations.
+    """
+
+    rows: List[Dict[str, Any]]
+    amount: np.ndarray
+    date_ordinal: np.ndarray
+    merchant_code: np.ndarray
+    merchants: List[str]
+    category_code: np.ndarray
+    category_texts: List[str]
+    note_code: np.ndarray
+    notes_lower: List[str]
+    category_item_row: np.ndarray
+    category_item_code: np.ndarray
+    category_item_default: np.ndarray
+    category_items: List[str]
+    symbol_code: np.ndarray
+    symbols: List[str]
+    currency_code: np.ndarray
+    currencies: List[str]
+    source: Optional[Sequence[Dict[str, Any]]] = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @classmethod
+    def from_transactions(cls, transactions: Sequence[Dict[str, Any]]) -> "TransactionFrame":
+        count = len(transactions)
+        amount = np.zeros(count, dtype=np.float64)
+        date_ordinal = np.zeros(count, dtype=np.int64)
+        merchant_code = np.zeros(count, dtype=np.int32)
+        category_code = np.zeros(count, dtype=np.int32)
+        note_code = np.zeros(count, dtype=np.int32)
+        symbol_code = np.zeros(count, dtype=np.int32)
+        currency_code = np.zeros(count, dtype=np.int32)
+        item_rows: List[int] = []
+        item_codes: List[int] = []
+        item_defaults: List[bool] = []
+
+        merchants = _Codes()
+        category_texts = _Codes()
+        notes = _Codes()
+        category_items = _Codes()
+        symbols = _Codes()
+        currencies = _Codes()
+        ordinal_by_text: Dict[Any, int] = {}
+
+        for idx, tx in enumerate(transactions):
+            amount[idx] = coerce_amount(tx.get("amount", 0.0))
+
+            raw_date = tx.get("date")
+            date_key = raw_date if isinstance(raw_date, (str, type(None))) else str(raw_date)
+            ordinal = ordinal_by_text.get(date_key)
+            if ordinal is None:
+                parsed = parse_tx_date(raw_date)
+                ordinal = parsed.toordinal() if parsed else NO_DATE
+                ordinal_by_text[date_key] = ordinal
+            date_ordinal[idx] = ordinal
+
+            merchant_code[idx] = merchants.code(str(tx.get("merchant_name") or ""))
+
+            categories = tx.get("category") or []
+            if isinstance(categories, list):
+                category_code[idx] = category_texts.code(" ".join(str(c).lower() for c in categories))
+            else:
+                category_code[idx] = category_texts.code(str(categories).lower())
+            note_code[idx] = notes.code(str(tx.get("notes") or ""))
+            items = tx.get("category") or ["Uncategorized"]
+            for item in items if isinstance(items, list) else [items]:
+                item_rows.append(idx)
+                item_codes.append(category_items.code(str(item)))
+                item_defaults.append(not tx.get("category"))
+
+            symbol_code[idx] = symbols.code(str(tx.get("currency_symbol") or "").strip())
+            currency_code[idx] = currencies.code(str(tx.get("currency") or "").strip())
+
+        return cls(
+            rows=list(transactions),
+            amount=amount,
+            date_ordinal=date_ordinal,
+            merchant_code=merchant_code,
+            merchants=merchants.values,
+            category_code=category_code,
+            category_texts=category_texts.values,
+            note_code=note_code,
+            notes_lower=[note.lower() for note in notes.values],
+            category_item_row=np.asarray(item_rows, dtype=np.int64),
+            category_item_code=np.asarray(item_codes, dtype=np.int32),
+            category_item_default=np.asarray(item_defaults, dtype=bool),
+            category_items=category_items.values,
+            symbol_code=symbol_code,
+            symbols=symbols.values,
+            currency_code=currency_code,
+            currencies=currencies.values,
+        )
+
+    def take(self, indices: np.ndarray) -> "TransactionFrame":
+        """
+        Row subset sharing this frame's dictionaries (codes stay valid).
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        remap = np.full(len(self.rows), -1, dtype=np.int64)
+        remap[indices] = np.arange(len(indices))
+        item_mask = remap[self.category_item_row] >= 0
+        return TransactionFrame(
+            rows=[self.rows[i] for i in indices.tolist()],
+            amount=self.amount[indices],
+            date_ordinal=self.date_ordinal[indices],
+            merchant_code=self.merchant_code[indices],
+            merchants=self.merchants,
+            category_code=self.category_code[indices],
+            category_texts=self.category_texts,
+            note_code=self.note_code[indices],
+            notes_lower=self.notes_lower,
+            category_item_row=remap[self.category_item_row[item_mask]],
+            category_item_code=self.category_item_code[item_mask],
+            category_item_default=self.category_item_default[item_mask],
+            category_items=self.category_items,
+            symbol_code=self.symbol_code[indices],
+            symbols=self.symbols,
+            currency_code=self.currency_code[indices],
+            currencies=self.currencies,
+        )
+
+    def codes_matching(self, values: List[str], needle: str) -> np.ndarray:
+        """
+        Codes whose lowercased dictionary value contains `needle` (case-insensitive).
+        """
+        lowered = needle.lower()
+        return np.asarray(
+            [code for code, value in enumerate(values) if lowered in value.lower()],
+            dtype=np.int32,
+        )
+
+    def dated(self) -> np.ndarray:
+        return self.date_ordinal != NO_DATE
+
+
+def ordered_group_codes(codes: np.ndarray) -> np.ndarray:
+    """
+    Distinct codes in order of first appearance within `codes`.
+    """
+    if not len(codes):
+        return np.asarray([], dtype=codes.dtype)
+    unique, first_index = np.unique(codes, return_index=True)
+    return unique[np.argsort(first_index, kind="stable")]
+
+
+_frame_cache: "OrderedDict[int, TransactionFrame]" = OrderedDict()
+_frame_cache_lock = threading.Lock()
+_FRAME_CACHE_SIZE = 8
+
+
+def get_frame(transactions: Sequence[Dict[str, Any]]) -> TransactionFrame:
+    """
+    Returns the frame for `transactions`, building it once per list object.
+
+    Cached lists (e.g. from load_transactions) are reused by identity across
+    requests; entries hold a reference to their list so ids are never recycled.
+    """
+    if isinstance(transactions, TransactionFrame):
+        return transactions
+    key = id(transactions)
+    with _frame_cache_lock:
+        frame = _frame_cache.get(key)
+        if frame is not None and frame.source is transactions:
+            _frame_cache.move_to_end(key)
+            return frame
+    frame = TransactionFrame.from_transactions(transactions)
+    frame.source = transactions
+    with _frame_cache_lock:
+        _frame_cache[key] = frame
+        while len(_frame_cache) > _FRAME_CACHE_SIZE:
+            _frame_cache.popitem(last=False)
+    return frame
@@ -3,11 +3,20 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 from typing import Any, Dict, List, Optional, Tuple
-from collections import Counter
 import os
 import re
 
+import numpy as np
+
 from app.analysis.transaction_analyzer import analyze_transactions_rule_based
+from app.analysis.transaction_frame import (
+    NO_DATE,
+    TransactionFrame,
+    coerce_amount,
+    get_frame,
+    ordered_group_codes,
+    parse_tx_date,
+)
 
 TX_KEYWORDS = [
     "transaction",
@@ -132,27 +141,18 @@ def _parse_date_range(text: str) -> Tuple[Optional[date], Optional[date]]:
 
 
 def _extract_merchants(transactions: List[Dict[str, Any]]) -> List[str]:
-    names = set()
-    for tx in transactions:
-        name = str(tx.get("merchant_name") or "").strip()
-        if name:
-            names.add(name)
+    frame = get_frame(transactions)
+    names = {name.strip() for name in frame.merchants if name.strip()}
     return sorted(names, key=lambda n: len(n), reverse=True)
 
 
 def _extract_categories(transactions: List[Dict[str, Any]]) -> List[str]:
+    frame = get_frame(transactions)
     categories = set()
-    for tx in transactions:
-        cat = tx.get("category") or []
-        if isinstance(cat, list):
-            for item in cat:
-                item_text = str(item).strip()
-                if item_text:
-                    categories.add(item_text)
-        else:
-            item_text = str(cat).strip()
-            if item_text:
-                categories.add(item_text)
+    for code in np.unique(frame.category_item_code[~frame.category_item_default]).tolist():
+        item_text = frame.category_items[code].strip()
+        if item_text:
+            categories.add(item_text)
     return sorted(categories, key=lambda n: len(n), reverse=True)
 
 
@@ -242,26 +242,11 @@ def parse_transaction_query(text: str, transactions: List[Dict[str, Any]]) -> Op
 
 
 def _parse_tx_date(value: Any) -> Optional[date]:
-    if not value:
-        return None
-    if isinstance(value, datetime):
-        return value.date()
-    if isinstance(value, date):
-        return value
-    text = str(value).strip()
-    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%d-%m-%Y"):
-        try:
-            return datetime.strptime(text, fmt).date()
-        except ValueError:
-            continue
-    return None
+    return parse_tx_date(value)
 
 
 def _coerce_amount(value: Any) -> float:
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return 0.0
+    return coerce_amount(value)
 
 
 def _format_amount(amount: float, symbol: str) -> str:
@@ -279,21 +264,23 @@ def _symbol_from_code(code: str) -> str:
     return mapping.get(code.upper(), "")
 
 
+def _most_common(codes: np.ndarray, values: List[str]) -> str:
+    # Ties resolve to the lowest code, i.e. the first value seen, like Counter.most_common.
+    present = np.asarray([bool(v) for v in values], dtype=bool)
+    counts = np.bincount(codes, minlength=len(values))
+    counts = np.where(present, counts, 0)
+    if not counts.any():
+        return ""
+    return values[int(np.argmax(counts))]
+
+
 def _resolve_currency_symbol(transactions: List[Dict[str, Any]]) -> str:
-    symbols = []
-    codes = []
-    for tx in transactions:
-        symbol = str(tx.get("currency_symbol") or "").strip()
-        code = str(tx.get("currency") or "").strip()
-        if symbol:
-            symbols.append(symbol)
-        if code:
-            codes.append(code)
-
-    if symbols:
-        return Counter(symbols).most_common(1)[0][0]
-    if codes:
-        code = Counter(codes).most_common(1)[0][0]
+    frame = get_frame(transactions)
+    symbol = _most_common(frame.symbol_code, frame.symbols)
+    if symbol:
+        return symbol
+    code = _most_common(frame.currency_code, frame.currencies)
+    if code:
         symbol = _symbol_from_code(code)
         if symbol:
             return symbol
@@ -309,41 +296,49 @@ def _resolve_currency_symbol(transactions: List[Dict[str, Any]]) -> str:
     return "$"
 
 
-def _filter_transactions(query: TransactionQuery, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    filtered: List[Dict[str, Any]] = []
-    for tx in transactions:
-        amount = _coerce_amount(tx.get("amount", 0.0))
-        if query.direction == "debit" and amount <= 0:
-            continue
-        if query.direction == "credit" and amount >= 0:
-            continue
+def _filter_mask(query: TransactionQuery, frame: TransactionFrame) -> np.ndarray:
+    mask = np.ones(len(frame), dtype=bool)
+    if query.direction == "debit":
+        mask &= frame.amount > 0
+    elif query.direction == "credit":
+        mask &= frame.amount < 0
 
-        if query.merchant:
-            merchant = str(tx.get("merchant_name") or "").lower()
-            if query.merchant.lower() not in merchant:
-                continue
+    if query.merchant:
+        codes = frame.codes_matching(frame.merchants, query.merchant)
+        mask &= np.isin(frame.merchant_code, codes)
 
-        if query.category:
-            categories = tx.get("category") or []
-            if isinstance(categories, list):
-                cat_text = " ".join(str(c).lower() for c in categories)
-            else:
-                cat_text = str(categories).lower()
-            if query.category.lower() not in cat_text:
-                continue
+    if query.category:
+        codes = frame.codes_matching(frame.category_texts, query.category)
+        mask &= np.isin(frame.category_code, codes)
 
-        if query.start_date or query.end_date:
-            tx_date = _parse_tx_date(tx.get("date"))
-            if not tx_date:
-                continue
-            if query.start_date and tx_date < query.start_date:
-                continue
-            if query.end_date and tx_date > query.end_date:
-                continue
+    if query.start_date or query.end_date:
+        mask &= frame.date_ordinal != NO_DATE
+        if query.start_date:
+            mask &= frame.date_ordinal >= query.start_date.toordinal()
+        if query.end_date:
+            mask &= frame.date_ordinal <= query.end_date.toordinal()
 
-        filtered.append(tx)
+    return mask
 
-    return filtered
+
+def _filter_transactions(query: TransactionQuery, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    frame = get_frame(transactions)
+    indices = np.flatnonzero(_filter_mask(query, frame))
+    return [frame.rows[i] for i in indices.tolist()]
+
+
+def _directional_amounts(amounts: np.ndarray, direction: str) -> np.ndarray:
+    if direction == "credit":
+        return np.where(amounts < 0, np.abs(amounts), 0.0)
+    return np.where(amounts > 0, amounts, 0.0)
+
+
+def _top_totals(codes: np.ndarray, weights: np.ndarray, values: List[str], limit: int = 5) -> List[Tuple[str, float]]:
+    sums = np.bincount(codes, weights=weights, minlength=len(values))
+    totals: Dict[str, float] = {}
+    for code in ordered_group_codes(codes).tolist():
+        totals[values[code]] = totals.get(values[code], 0.0) + float(sums[code])
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
 
 
 def _format_tx(tx: Dict[str, Any], amount: float, symbol: str) -> List[str]:
@@ -370,41 +365,51 @@ def _format_tx(tx: Dict[str, Any], amount: float, symbol: str) -> List[str]:
     return lines
 
 
-def answer_transaction_query(query: TransactionQuery, transactions: List[Dict[str, Any]]) -> str:
+def _scan_uses_precomputed(query: TransactionQuery) -> bool:
+    # Precomputed issues cover whole merchant groups, so they stand in for a
+    # fresh scan only when the query does not slice groups by date/direction/category.
+    return query.direction == "any" and not query.category and not (query.start_date or query.end_date)
+
+
+def answer_transaction_query(
+    query: TransactionQuery,
+    transactions: List[Dict[str, Any]],
+    issues: Optional[List[Dict[str, Any]]] = None,
+) -> str:
     if query.needs_followup and query.follow_up_question:
         return query.follow_up_question
 
-    filtered = _filter_transactions(query, transactions)
-    if not filtered:
+    frame = get_frame(transactions)
+    indices = np.flatnonzero(_filter_mask(query, frame))
+    if not len(indices):
         return "I could not find any transactions that match that request."
     symbol = _resolve_currency_symbol(transactions)
+    amounts = frame.amount[indices]
 
     if query.query_type == "max":
-        chosen = max(filtered, key=lambda tx: abs(_coerce_amount(tx.get("amount", 0.0))))
-        amount = _coerce_amount(chosen.get("amount", 0.0))
+        chosen = int(indices[np.argmax(np.abs(amounts))])
+        amount = float(frame.amount[chosen])
         header = "Here is the highest transaction I found:"
-        return "\n".join([header] + _format_tx(chosen, amount, symbol))
+        return "\n".join([header] + _format_tx(frame.rows[chosen], amount, symbol))
 
     if query.query_type == "min":
-        chosen = min(filtered, key=lambda tx: abs(_coerce_amount(tx.get("amount", 0.0))))
-        amount = _coerce_amount(chosen.get("amount", 0.0))
+        chosen = int(indices[np.argmin(np.abs(amounts))])
+        amount = float(frame.amount[chosen])
         header = "Here is the lowest transaction I found:"
-        return "\n".join([header] + _format_tx(chosen, amount, symbol))
+        return "\n".join([header] + _format_tx(frame.rows[chosen], amount, symbol))
 
     if query.query_type == "count":
-        return f"I found {len(filtered)} transactions that match that request."
+        return f"I found {len(indices)} transactions that match that request."
 
     if query.query_type == "total":
+        outflow = float(amounts[amounts > 0].sum())
+        inflow = float(np.abs(amounts[amounts < 0]).sum())
         if query.direction == "debit":
-            total = sum(_coerce_amount(tx.get("amount", 0.0)) for tx in filtered if _coerce_amount(tx.get("amount", 0.0)) > 0)
-            return f"Total debits: {_format_amount(total, symbol)} across {len(filtered)} transactions."
+            return f"Total debits: {_format_amount(outflow, symbol)} across {len(indices)} transactions."
         if query.direction == "credit":
-            total = sum(abs(_coerce_amount(tx.get("amount", 0.0))) for tx in filtered if _coerce_amount(tx.get("amount", 0.0)) < 0)
-            return f"Total credits: {_format_amount(total, symbol)} across {len(filtered)} transactions."
+            return f"Total credits: {_format_amount(inflow, symbol)} across {len(indices)} transactions."
 
-        outflow = sum(_coerce_amount(tx.get("amount", 0.0)) for tx in filtered if _coerce_amount(tx.get("amount", 0.0)) > 0)
-        inflow = sum(abs(_coerce_amount(tx.get("amount", 0.0))) for tx in filtered if _coerce_amount(tx.get("amount", 0.0)) < 0)
-        net = sum(_coerce_amount(tx.get("amount", 0.0)) for tx in filtered)
+        net = float(amounts.sum())
         return (
             f"Totals for the selected transactions:\n"
             f"- Outflow: {_format_amount(outflow, symbol)}\n"
@@ -413,59 +418,44 @@ def answer_transaction_query(query: TransactionQuery, transactions: List[Dict[st
         )
 
     if query.query_type == "by_merchant":
-        totals: Dict[str, float] = {}
-        for tx in filtered:
-            merchant = str(tx.get("merchant_name") or "Unknown Merchant")
-            amount = _coerce_amount(tx.get("amount", 0.0))
-            if query.direction == "credit":
-                amount = abs(amount) if amount < 0 else 0.0
-            elif query.direction == "debit":
-                amount = amount if amount > 0 else 0.0
-            else:
-                amount = amount if amount > 0 else 0.0
-            totals[merchant] = totals.get(merchant, 0.0) + amount
-        top = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:5]
+        names = [name or "Unknown Merchant" for name in frame.merchants]
+        weights = _directional_amounts(amounts, query.direction)
+        top = _top_totals(frame.merchant_code[indices], weights, names)
         lines = ["Top merchants by spend:"]
         for merchant, total in top:
             lines.append(f"- {merchant}: {_format_amount(total, symbol)}")
         return "\n".join(lines)
 
     if query.query_type == "by_category":
-        totals: Dict[str, float] = {}
-        for tx in filtered:
-            categories = tx.get("category") or ["Uncategorized"]
-            if not categories:
-                categories = ["Uncategorized"]
-            amount = _coerce_amount(tx.get("amount", 0.0))
-            if query.direction == "credit":
-                amount = abs(amount) if amount < 0 else 0.0
-            elif query.direction == "debit":
-                amount = amount if amount > 0 else 0.0
-            else:
-                amount = amount if amount > 0 else 0.0
-            for category in categories if isinstance(categories, list) else [categories]:
-                cat_key = str(category)
-                totals[cat_key] = totals.get(cat_key, 0.0) + amount
-        top = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:5]
+        selected = np.zeros(len(frame), dtype=bool)
+        selected[indices] = True
+        item_mask = selected[frame.category_item_row]
+        item_rows = frame.category_item_row[item_mask]
+        weights = _directional_amounts(frame.amount[item_rows], query.direction)
+        top = _top_totals(frame.category_item_code[item_mask], weights, frame.category_items)
         lines = ["Top categories by spend:"]
         for category, total in top:
             lines.append(f"- {category}: {_format_amount(total, symbol)}")
         return "\n".join(lines)
 
     if query.query_type == "recent":
-        def sort_key(tx: Dict[str, Any]) -> Tuple[int, date]:
-            parsed = _parse_tx_date(tx.get("date"))
-            return (0, parsed) if parsed else (1, date.min)
-
-        ordered = sorted(filtered, key=sort_key, reverse=True)[:5]
+        # Undated rows sort ahead of dated ones, matching the previous (1, date.min) key.
+        ordinals = frame.date_ordinal[indices]
+        keys = np.where(ordinals == NO_DATE, np.iinfo(np.int64).max, ordinals)
+        ordered = indices[np.argsort(-keys, kind="stable")][:5]
         lines = ["Most recent transactions:"]
-        for tx in ordered:
-            amount = _coerce_amount(tx.get("amount", 0.0))
+        for idx in ordered.tolist():
+            tx = frame.rows[idx]
+            amount = float(frame.amount[idx])
             lines.append(f"- {tx.get('date', '')} | {tx.get('merchant_name', '')} | {_format_amount(amount, symbol)}")
         return "\n".join(lines)
 
     if query.query_type == "subscription_scan":
-        issues = analyze_transactions_rule_based(filtered)
+        if issues is not None and _scan_uses_precomputed(query):
+            merchant = (query.merchant or "").lower()
+            issues = [i for i in issues if merchant in str(i.get("merchant", "")).lower()]
+        else:
+            issues = analyze_transactions_rule_based(frame.take(indices))
         if not issues:
             return "I did not find any obvious subscription issues in the selected transactions."
         lines = ["Subscription-related findings:"]
@@ -476,3 +466,36 @@ def answer_transaction_query(query: TransactionQuery, transactions: List[Dict[st
         return "\n".join(lines)
 
     return "Can you clarify what you want to know about your transactions?"
+
+
+def compose_rule_based_findings(
+    issues: List[Dict[str, Any]],
+    transactions: List[Dict[str, Any]],
+    limit: int = 10,
+) -> str:
+    """
+    Templated summary of rule-based findings, used instead of an LLM compose
+    round trip when no letter or legal evidence was requested.
+    """
+    if not issues:
+        return "I did not find any obvious issues in your transactions."
+    symbol = _resolve_currency_symbol(transactions)
+    noun = "issue" if len(issues) == 1 else "issues"
+    lines = [f"I reviewed your transactions and found {len(issues)} potential {noun}:"]
+    for issue in issues[:limit]:
+        line = (
+            f"- {issue.get('merchant', '')}: {issue.get('issue', '')} "
+            f"({_format_amount(_coerce_amount(issue.get('amount', 0.0)), symbol)})"
+        )
+        reason = str(issue.get("reason") or "").strip()
+        if reason:
+            line += f". {reason}"
+        lines.append(line)
+    if len(issues) > limit:
+        lines.append(f"- ...and {len(issues) - limit} more.")
+    lines.append("")
+    lines.append(
+        "Would you like me to draft a dispute or cancellation letter, "
+        "or pull the relevant terms and regulations for any of these?"
+    )
+    return "\n".join(lines)
@@ -1,19 +1,48 @@
 from __future__ import annotations
 
 import csv
-import io
+import hashlib
 import io
 import json
-import uuid
 import tempfile
 import re
 import os
-from datetime import datetime
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from app.analysis.transaction_analyzer import (
+    analyze_by_merchant,
+    merge_merchant_issues,
+    ruleset_signature,
+)
+from app.data.pdf_pages import extract_pdf_page_texts, ocr_pdf_page_texts
+from app.data.transaction_store import (
+    append_transactions,
+    claim_legacy_transactions as _claim_legacy_rows,
+    commit_staged_upload,
+    discard_staged_upload,
+    fetch_merchant_issues,
+    fetch_transactions,
+    issue_index_ruleset,
+    list_merchants,
+    merchant_first_seq,
+    merchants_for_transaction_ids,
+    owner_version,
+    replace_merchant_issues,
+    stage_transactions,
+    store_signature,
+    stored_merchant_name,
+)
+from app.data.upload_cache import load_cached_upload, store_cached_upload, upload_digest
 
 DATA_DIR = Path(__file__).resolve().parent
-STORE_PATH = DATA_DIR / "bank_transactions.json"
+UPLOAD_READ_CHUNK_BYTES = int(os.environ.get("UPLOAD_READ_CHUNK_BYTES", str(256 * 1024)) or str(256 * 1024))
+CSV_STREAM_BATCH_SIZE = int(os.environ.get("CSV_STREAM_BATCH_SIZE", "2000") or "2000")
 
 
 def _parse_amount(value: Any) -> float:
@@ -141,7 +170,24 @@ def _normalize_category(value: Any) -> List[str]:
     return [text.strip()] if text.strip() else []
 
 
-def normalize_transactions(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _fallback_transaction_id(record: Dict[str, Any], occurrences: Dict[str, int]) -> str:
+    # Derived from the row itself so re-uploading the same export updates rows
+    # instead of duplicating them; repeats of an identical row get a counter.
+    digest = hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+    seen = occurrences.get(digest, 0)
+    occurrences[digest] = seen + 1
+    return f"tx_{digest}_{seen}" if seen else f"tx_{digest}"
+
+
+def normalize_transactions(
+    records: List[Dict[str, Any]],
+    occurrences: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    `occurrences` carries the identical-row counts behind fallback ids across
+    calls, for callers that normalize one upload in several batches.
+    """
+    occurrences = {} if occurrences is None else occurrences
     normalized: List[Dict[str, Any]] = []
     for record in records:
         rec = _lower_keys(record)
@@ -161,7 +207,7 @@ def normalize_transactions(records: List[Dict[str, Any]]) -> List[Dict[str, Any]
 
         tx_id = _first_value(rec, ["transaction_id", "id", "txid", "reference"])
         if not tx_id:
-            tx_id = f"tx_{uuid.uuid4().hex[:10]}"
+            tx_id = _fallback_transaction_id(rec, occurrences)
 
         date = _parse_date(_first_value(rec, ["date", "transaction_date", "posted_date", "post_date"]))
         amount = _parse_amount(_first_value(rec, ["amount", "transaction_amount", "amt", "value", "debit", "credit"]))
@@ -310,79 +356,14 @@ def _detect_category(text: str) -> str:
 
 def _ocr_pdf_to_text(content: bytes) -> str:
     try:
-        from pdf2image import convert_from_bytes
-        import pytesseract
-        from PIL import Image
+        import pytesseract  # noqa: F401
+        from PIL import Image  # noqa: F401
     except ImportError as exc:  # pragma: no cover - dependency optional at runtime
         raise ValueError(
             "OCR requires pdf2image + pytesseract. Install them or upload a CSV/JSON export instead."
         ) from exc
-
-    def find_poppler_path() -> Optional[str]:
-        env_path = os.environ.get("POPPLER_PATH") or os.environ.get("POPPLER_BIN")
-        if env_path and Path(env_path).exists():
-            return str(Path(env_path))
-        choco_bin = Path(r"C:\ProgramData\chocolatey\bin\pdftoppm.exe")
-        if choco_bin.exists():
-            return str(choco_bin.parent)
-        base = Path(r"C:\ProgramData\chocolatey\lib\poppler\tools")
-        if base.exists():
-            for candidate in base.glob("poppler-*/Library/bin"):
-                if (candidate / "pdftoppm.exe").exists():
-                    return str(candidate)
-        return None
-
-    def find_tesseract_cmd() -> Optional[str]:
-        env_cmd = os.environ.get("TESSERACT_CMD") or os.environ.get("TESSERACT_PATH")
-        if env_cmd and Path(env_cmd).exists():
-            return str(Path(env_cmd))
-        candidates = [
-            Path(r"C:\Program Files\Tesseract-OCR\tesseract.exe"),
-            Path(r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"),
-            Path(r"C:\ProgramData\chocolatey\bin\tesseract.exe"),
-        ]
-        for candidate in candidates:
-            if candidate.exists():
-                return str(candidate)
-        return None
-
-    poppler_path = find_poppler_path()
-    tesseract_cmd = find_tesseract_cmd()
-    if tesseract_cmd:
-        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
-
-    try:
-        pages = convert_from_bytes(
-            content,
-            dpi=200,
-            poppler_path=poppler_path,
-        ) if poppler_path else convert_from_bytes(content, dpi=200)
-        texts = []
-        for page in pages:
-            texts.append(pytesseract.image_to_string(page))
-        return "\n".join(texts)
-    except Exception:
-        # Fallback to PyMuPDF rendering when Poppler is unavailable.
-        try:
-            import fitz  # PyMuPDF
-        except ImportError as exc:
-            raise ValueError(
-                "OCR failed. Install Poppler (for pdf2image) or PyMuPDF, and ensure Tesseract is available. "
-                "Optionally set POPPLER_PATH or TESSERACT_CMD."
-            ) from exc
-
-        try:
-            doc = fitz.open(stream=content, filetype="pdf")
-            texts = []
-            for page in doc:
-                pix = page.get_pixmap(dpi=200)
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                texts.append(pytesseract.image_to_string(img))
-            return "\n".join(texts)
-        except Exception as exc:
-            raise ValueError(
-                "OCR failed using both Poppler and PyMuPDF. Ensure Tesseract is installed and accessible."
-            ) from exc
+    # Pages are rendered and recognized in parallel; texts come back in page order.
+    return "\n".join(ocr_pdf_page_texts(content))
 
 
 def _parse_ocr_rows(text: str) -> List[Dict[str, str]]:
@@ -494,20 +475,7 @@ def _parse_transactions_from_ocr(text: str) -> List[Dict[str, Any]]:
 
 
 def _extract_text_from_pdf(content: bytes) -> str:
-    try:
-        reader = PdfReader(io.BytesIO(content))
-        texts = [page.extract_text() or "" for page in reader.pages]
-        return "\n".join(texts)
-    except Exception:
-        try:
-            import fitz  # PyMuPDF
-        except Exception:
-            return ""
-        try:
-            doc = fitz.open(stream=content, filetype="pdf")
-            return "\n".join(page.get_text() for page in doc)
-        except Exception:
-            return ""
+    return "\n".join(extract_pdf_page_texts(content))
 
 
 def _row_quality(rows: List[Dict[str, Any]]) -> float:
@@ -524,7 +492,39 @@ def _row_quality(rows: List[Dict[str, Any]]) -> float:
     return valid / max(len(rows), 1)
 
 
+def _confidence_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    confidences = [
+        float(r.get("confidence", 0.0))
+        for r in rows
+        if isinstance(r, dict) and r.get("confidence") is not None
+    ]
+    if not confidences:
+        return {"avg": 0.0, "min": 0.0, "max": 0.0, "count": 0}
+    return {
+        "avg": round(sum(confidences) / len(confidences), 3),
+        "min": round(min(confidences), 3),
+        "max": round(max(confidences), 3),
+        "count": len(confidences),
+    }
+
+
 def extract_pdf_rows(content: bytes) -> Dict[str, Any]:
+    """
+    Extracts statement rows from a PDF. Results are cached by content hash, so
+    a preview followed by a confirm, or a re-upload, skips Camelot/text/OCR.
+    """
+    digest = upload_digest(content)
+    cached = load_cached_upload(digest)
+    if cached is not None:
+        return cached
+    result = _extract_pdf_rows_uncached(content)
+    result["confidence_stats"] = _confidence_stats(result["rows"])
+    if result["rows"]:
+        store_cached_upload(digest, result)
+    return result
+
+
+def _extract_pdf_rows_uncached(content: bytes) -> Dict[str, Any]:
     camelot_available = True
     try:
         import camelot
@@ -745,7 +745,6 @@ def normalize_rows_with_mapping(rows: List[Dict[str, Any]], mapping: Dict[str, s
 
         transactions.append(
             {
-                "transaction_id": f"tx_{uuid.uuid4().hex[:10]}",
                 "date": date,
                 "merchant_name": merchant or "Unknown Merchant",
                 "amount": amount,
@@ -773,21 +772,6 @@ def extract_rows_from_upload(filename: str, content: bytes) -> Dict[str, Any]:
         }
         result["suggested_mapping"] = suggested
         result["schema"] = get_preview_schema()
-        rows = result.get("rows") or []
-        confidences = [
-            float(r.get("confidence", 0.0))
-            for r in rows
-            if isinstance(r, dict) and r.get("confidence") is not None
-        ]
-        if confidences:
-            result["confidence_stats"] = {
-                "avg": round(sum(confidences) / len(confidences), 3),
-                "min": round(min(confidences), 3),
-                "max": round(max(confidences), 3),
-                "count": len(confidences),
-            }
-        else:
-            result["confidence_stats"] = {"avg": 0.0, "min": 0.0, "max": 0.0, "count": 0}
         return result
 
     if suffix == ".json" or text.strip().startswith(("{", "[")):
@@ -863,22 +847,376 @@ def parse_transactions_from_upload(filename: str, content: bytes) -> List[Dict[s
     raise ValueError("Unsupported file type. Please upload a .csv, .json, or .pdf file.")
 
 
-def save_transactions(transactions: List[Dict[str, Any]], source: str = "upload") -> None:
-    payload = {
-        "source": source,
-        "updated_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "transactions": transactions,
-    }
-    STORE_PATH.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+@dataclass
+class TransactionSnapshot:
+    transactions: List[Dict[str, Any]]
+    dates: List[Optional[date]]
+    merchants: List[str]
+    categories: List[str]
+    issues: List[Dict[str, Any]]
+    version: int
+    signature: tuple
 
 
-def load_transactions() -> Optional[List[Dict[str, Any]]]:
-    if not STORE_PATH.exists():
+def _snapshot_date(value: Any) -> Optional[date]:
+    parsed = _parse_date(value)
+    try:
+        return datetime.strptime(parsed, "%Y-%m-%d").date()
+    except ValueError:
         return None
-    data = json.loads(STORE_PATH.read_text(encoding="utf-8") or "{}")
-    if isinstance(data, list):
-        return data
-    if isinstance(data, dict):
-        tx = data.get("transactions")
-        return tx if isinstance(tx, list) else None
-    return None
+
+
+def _build_snapshot(
+    transactions: List[Dict[str, Any]],
+    issues: List[Dict[str, Any]],
+    version: int,
+    signature: tuple,
+) -> TransactionSnapshot:
+    parsed_by_text: Dict[str, Optional[date]] = {}
+    dates: List[Optional[date]] = []
+    merchants = set()
+    categories = set()
+    for tx in transactions:
+        text = str(tx.get("date") or "")
+        if text not in parsed_by_text:
+            parsed_by_text[text] = _snapshot_date(text)
+        dates.append(parsed_by_text[text])
+        name = str(tx.get("merchant_name") or "").strip()
+        if name:
+            merchants.add(name)
+        for item in tx.get("category") or []:
+            item_text = str(item).strip()
+            if item_text:
+                categories.add(item_text)
+    return TransactionSnapshot(
+        transactions=transactions,
+        dates=dates,
+        merchants=sorted(merchants, key=len, reverse=True),
+        categories=sorted(categories, key=len, reverse=True),
+        issues=issues,
+        version=version,
+        signature=signature,
+    )
+
+
+class _TransactionCache:
+    """
+    Process-wide cache of parsed transactions per (user_id, account_id).
+
+    An entry is trusted while the database files' (mtime, size) signature is
+    unchanged. When another worker or thread writes, the signature moves and the
+    owner's version counter decides whether this entry actually went stale, so
+    one tenant's upload does not evict everyone else.
+    """
+
+    def __init__(self, max_owners: int):
+        self.max_owners = max_owners
+        self._entries: "OrderedDict[tuple, TransactionSnapshot]" = OrderedDict()
+        # Guards the two dicts only; loads run under the owner's own lock so a
+        # slow miss for one tenant never blocks another tenant's hits.
+        self._lock = threading.Lock()
+        self._owner_locks: Dict[tuple, threading.Lock] = {}
+
+    def _cached(self, key: tuple, signature: tuple) -> Optional[TransactionSnapshot]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.signature == signature:
+                self._entries.move_to_end(key)
+                return entry
+        # Another write landed somewhere in the store; only this owner's
+        # version says whether the entry went stale.
+        version = owner_version(*key)
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return None
+            if version == entry.version:
+                entry.signature = signature
+                self._entries.move_to_end(key)
+                return entry
+            self._entries.pop(key, None)
+        return None
+
+    def _owner_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            lock = self._owner_locks.get(key)
+            if lock is None:
+                lock = self._owner_locks[key] = threading.Lock()
+            return lock
+
+    def _publish(self, key: tuple, entry: TransactionSnapshot) -> TransactionSnapshot:
+        with self._lock:
+            current = self._entries.get(key)
+            # A loader that read an older version must not replace a newer entry.
+            if current is not None and current.version > entry.version:
+                self._entries.move_to_end(key)
+                return current
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_owners:
+                evicted, _ = self._entries.popitem(last=False)
+                self._owner_locks.pop(evicted, None)
+            return entry
+
+    def get(self, user_id: Optional[str], account_id: Optional[str]) -> Optional[TransactionSnapshot]:
+        key = (str(user_id or "").strip(), str(account_id or "").strip())
+        entry = self._cached(key, store_signature())
+        if entry is not None:
+            return entry
+
+        with self._owner_lock(key):
+            # Another thread may have loaded this owner while we waited.
+            signature = store_signature()
+            entry = self._cached(key, signature)
+            if entry is not None:
+                return entry
+
+            if issue_index_ruleset(*key) != ruleset_signature():
+                refresh_transaction_issues(user_id=key[0], account_id=key[1])
+                signature = store_signature()
+
+            # Read the version before the rows so a concurrent write can only
+            # make this entry look older than it is, never newer.
+            version = owner_version(*key)
+            transactions = fetch_transactions(user_id=key[0], account_id=key[1])
+            if not transactions:
+                return None
+            return self._publish(key, _build_snapshot(transactions, _load_issues(*key), version, signature))
+
+    def invalidate(self, user_id: Optional[str] = None, account_id: Optional[str] = None) -> None:
+        key = (str(user_id or "").strip(), str(account_id or "").strip())
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def find(self, transactions: List[Dict[str, Any]]) -> Optional[TransactionSnapshot]:
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.transactions is transactions:
+                    return entry
+        return None
+
+
+_cache = _TransactionCache(int(os.environ.get("TRANSACTION_CACHE_MAX_OWNERS", "64") or "64"))
+
+
+def _issue_group_key(stored_name: str) -> str:
+    # Mirrors the analyzer's merchant grouping for names read back from the store.
+    return (stored_name or "Unknown Merchant").strip()
+
+
+def _load_issues(user_id: str, account_id: str) -> List[Dict[str, Any]]:
+    _, rows = fetch_merchant_issues(user_id=user_id, account_id=account_id)
+    return merge_merchant_issues(
+        [(name, issue) for name, issue in found] for _, _, found in rows
+    )
+
+
+def refresh_transaction_issues(
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+    merchants: Optional[Iterable[str]] = None,
+) -> None:
+    """
+    Re-runs the rule engine for the given stored merchant names (their full
+    history) and persists per-merchant findings. With merchants=None the
+    owner's whole issue index is rebuilt.
+    """
+    full = merchants is None or issue_index_ruleset(user_id, account_id) != ruleset_signature()
+    if full:
+        names = set(list_merchants(user_id=user_id, account_id=account_id))
+        transactions = fetch_transactions(user_id=user_id, account_id=account_id)
+    else:
+        names = set(merchants or [])
+        if not names:
+            return
+        transactions = fetch_transactions(user_id=user_id, account_id=account_id, merchants=names)
+
+    first_seq: Dict[str, int] = {}
+    for name, seq in merchant_first_seq(names, user_id=user_id, account_id=account_id).items():
+        key = _issue_group_key(name)
+        first_seq[key] = min(seq, first_seq.get(key, seq))
+
+    entries: Dict[str, tuple] = {}
+    for merchant, found in analyze_by_merchant(transactions).items():
+        if merchant in first_seq:
+            entries[merchant] = (first_seq[merchant], [[name, issue] for name, issue in found])
+
+    replace_merchant_issues(
+        entries,
+        stale_merchants={_issue_group_key(name) for name in names},
+        user_id=user_id,
+        account_id=account_id,
+        ruleset=ruleset_signature(),
+        full=full,
+    )
+
+
+class _NonClosing(io.RawIOBase):
+    """Readable view of an upload that leaves the caller's file open when the
+    text wrapper around it is closed or collected."""
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self._fileobj = fileobj
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        data = self._fileobj.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def _iter_text_lines(fileobj: BinaryIO, chunk_size: int = UPLOAD_READ_CHUNK_BYTES) -> Iterator[str]:
+    # newline="" leaves line endings ("\n", "\r\n" or a bare "\r") for the csv
+    # module, which also needs them to reassemble quoted multi-line fields.
+    reader = io.BufferedReader(_NonClosing(fileobj), buffer_size=chunk_size)
+    yield from io.TextIOWrapper(reader, encoding="utf-8-sig", errors="ignore", newline="")
+
+
+def is_streamable_csv(filename: str, fileobj: BinaryIO) -> bool:
+    """
+    True when an upload should take the streaming CSV path: a .csv name whose
+    content is not actually a PDF or JSON (those keep their in-memory parsers).
+    Leaves the file positioned at the start.
+    """
+    if Path(filename or "").suffix.lower() != ".csv":
+        return False
+    head = fileobj.read(1024)
+    fileobj.seek(0)
+    if not head or head[:5] == b"%PDF-":
+        return False
+    return not _decode_text(head).lstrip().startswith(("{", "["))
+
+
+def iter_csv_batches(
+    fileobj: BinaryIO,
+    batch_size: int = CSV_STREAM_BATCH_SIZE,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Reads a CSV upload in chunks and yields normalized transactions in batches,
+    so peak memory is bounded by the batch size rather than the file size.
+    """
+    batch: List[Dict[str, Any]] = []
+    occurrences: Dict[str, int] = {}
+    for record in csv.DictReader(_iter_text_lines(fileobj)):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield normalize_transactions(batch, occurrences)
+            batch = []
+    if batch:
+        yield normalize_transactions(batch, occurrences)
+
+
+def ingest_csv_stream(
+    fileobj: BinaryIO,
+    source: str = "upload",
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+    batch_size: int = CSV_STREAM_BATCH_SIZE,
+) -> int:
+    """
+    Streams a CSV upload into the store batch by batch. Batches are staged and
+    committed together as one upload, so a bad row part-way through leaves the
+    store untouched. Issue detection runs once over every merchant it touched.
+    """
+    upload_id = uuid.uuid4().hex
+    affected: set = set()
+    try:
+        for batch in iter_csv_batches(fileobj, batch_size=batch_size):
+            affected |= _affected_merchants(batch, user_id=user_id, account_id=account_id)
+            stage_transactions(upload_id, batch, source=source, user_id=user_id, account_id=account_id)
+        count = commit_staged_upload(upload_id, source=source, user_id=user_id, account_id=account_id)
+    except BaseException:
+        discard_staged_upload(upload_id)
+        raise
+    try:
+        if count:
+            refresh_transaction_issues(user_id=user_id, account_id=account_id, merchants=affected)
+    finally:
+        _cache.invalidate(user_id, account_id)
+    return count
+
+
+def _affected_merchants(
+    transactions: List[Dict[str, Any]],
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> set:
+    # Merchant groups the rows join, plus any an upsert would move them out of.
+    affected = {stored_merchant_name(tx) for tx in transactions}
+    affected |= merchants_for_transaction_ids(
+        [tx.get("transaction_id") for tx in transactions],
+        user_id=user_id,
+        account_id=account_id,
+    )
+    return affected
+
+
+def save_transactions(
+    transactions: List[Dict[str, Any]],
+    source: str = "upload",
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+    refresh_issues: bool = True,
+) -> set:
+    """
+    Appends transactions and re-evaluates only the merchant groups they touch.
+    Returns the affected stored merchant names (for callers that batch writes
+    with refresh_issues=False and refresh once at the end).
+    """
+    affected = _affected_merchants(transactions, user_id=user_id, account_id=account_id)
+    try:
+        append_transactions(transactions, source=source, user_id=user_id, account_id=account_id)
+        if refresh_issues:
+            refresh_transaction_issues(user_id=user_id, account_id=account_id, merchants=affected)
+    finally:
+        _cache.invalidate(user_id, account_id)
+    return affected
+
+
+def claim_legacy_transactions(user_id: Optional[str] = None, account_id: Optional[str] = None) -> int:
+    """
+    Moves rows imported from the old bank_transactions.json to a signed-in
+    owner with nothing stored, once per store. Returns the rows moved.
+    """
+    moved = _claim_legacy_rows(user_id=user_id, account_id=account_id)
+    if moved:
+        _cache.invalidate(user_id, account_id)
+    return moved
+
+
+def load_transaction_snapshot(
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> Optional[TransactionSnapshot]:
+    return _cache.get(user_id, account_id)
+
+
+def find_transaction_snapshot(transactions: List[Dict[str, Any]]) -> Optional[TransactionSnapshot]:
+    """
+    Returns the cached snapshot whose list is `transactions` (identity, not equality).
+    """
+    return _cache.find(transactions)
+
+
+def load_transactions(
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    # The returned list is shared with the cache; callers must not mutate it.
+    snapshot = _cache.get(user_id, account_id)
+    return snapshot.transactions if snapshot else None
+
+
+def load_transaction_issues(
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Precomputed rule-based findings for the owner's stored transactions, in
+    analyze_transactions_rule_based order. None when nothing is stored.
+    """
+    snapshot = _cache.get(user_id, account_id)
+    return snapshot.issues if snapshot else None
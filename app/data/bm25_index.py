@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+INDEX_VERSION = 1
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.\-'][a-z0-9]+)*")
+_TOKEN_PARTS = re.compile(r"[.\-']")
+# Section references ("§ 425.2", "425.5(a)(4)", "Section 5") and quoted phrases must match verbatim.
+_SECTION_REF = re.compile(r"\bsection\s+(\d+[\w.]*(?:\([a-z0-9]+\))*)|\b(\d+\.\d+[\w.]*(?:\([a-z0-9]+\))*)", re.IGNORECASE)
+_QUOTED = re.compile(r"\"([^\"]{3,80})\"|“([^”]{3,80})”")
+_STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "can", "for", "from", "has", "have", "how",
+    "i", "if", "in", "into", "is", "it", "its", "may", "me", "my", "not", "of", "on", "or", "our",
+    "shall", "such", "that", "the", "their", "this", "to", "was", "we", "what", "when", "which",
+    "will", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms without stopwords, plus the parts of hyphenated/dotted
+    terms ("auto-renewal" -> "auto", "renewal") and adjacent word pairs, so
+    phrases like "negative option" score above their words apart.
+    """
+    terms: List[str] = []
+    words: List[str] = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group(0)
+        if token in _STOPWORDS:
+            continue
+        terms.append(token)
+        words.append(token)
+        if _TOKEN_PARTS.search(token):
+            terms.extend(part for part in _TOKEN_PARTS.split(token) if len(part) > 1 and part not in _STOPWORDS)
+    terms.extend(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return terms
+
+
+def exact_terms(query: str) -> List[str]:
+    """
+    Section numbers and quoted phrases in `query`, lowercased.
+    """
+    terms = [
+        (f"section {section}" if section else number).rstrip(".").lower()
+        for section, number in _SECTION_REF.findall(query)
+    ]
+    terms.extend((straight or curly).strip().lower() for straight, curly in _QUOTED.findall(query))
+    return [term for term in dict.fromkeys(terms) if term]
+
+
+def _contains(text: str, term: str) -> bool:
+    return re.search(rf"(?<![\w.]){re.escape(term)}(?!\w)", text) is not None
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """
+    Keys ordered by sum(1 / (k + rank)) across `rankings`.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda key: -scores[key])
+
+
+@dataclass(frozen=True)
+class LexicalHit:
+    chunk_id: str
+    score: float
+    text: str
+    metadata: Dict
+
+
+class BM25Index:
+    """
+    Okapi BM25 over ingested chunks, persisted as JSON (chunk texts and
+    metadata, grouped by source file). Postings are rebuilt in memory on first
+    search after a load or change.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, str] = {}
+        self.docs: Dict[str, Dict] = {}
+        self.mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._postings: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None
+        self._ids: List[str] = []
+        self._lengths = np.zeros(0)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        index = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            index.mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            return index
+        except (OSError, ValueError) as exc:
+            print(f"Ignoring unreadable BM25 index {path}: {exc}")
+            return index
+        if isinstance(data, dict) and data.get("version") == INDEX_VERSION:
+            index.files = data.get("files", {})
+            index.docs = data.get("docs", {})
+        return index
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def has_file(self, file_name: str, file_hash: str) -> bool:
+        return self.files.get(file_name) == file_hash
+
+    def replace_file(self, file_name: str, file_hash: str, chunks: Iterable[tuple]) -> None:
+        """
+        Swaps in the (chunk_id, text, metadata) chunks of one source file.
+        """
+        with self._lock:
+            self._drop(file_name)
+            for chunk_id, text, meta in chunks:
+                self.docs[chunk_id] = {"file": file_name, "text": text, "meta": meta}
+            self.files[file_name] = file_hash
+            self._postings = None
+
+    def remove_file(self, file_name: str) -> None:
+        with self._lock:
+            self._drop(file_name)
+            self.files.pop(file_name, None)
+            self._postings = None
+
+    def _drop(self, file_name: str) -> None:
+        for chunk_id in [chunk_id for chunk_id, doc in self.docs.items() if doc["file"] == file_name]:
+            del self.docs[chunk_id]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            payload = {"version": INDEX_VERSION, "files": self.files, "docs": self.docs}
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.mtime = os.path.getmtime(self.path)
+
+    def _build(self) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], List[str], np.ndarray]:
+        with self._lock:
+            if self._postings is not None:
+                return self._postings, self._ids, self._lengths
+            ids = list(self.docs)
+            lengths = np.zeros(len(ids))
+            grouped: Dict[str, Tuple[List[int], List[int]]] = {}
+            for position, chunk_id in enumerate(ids):
+                counts = Counter(tokenize(self.docs[chunk_id]["text"]))
+                lengths[position] = sum(counts.values())
+                for term, count in counts.items():
+                    doc_positions, freqs = grouped.setdefault(term, ([], []))
+                    doc_positions.append(position)
+                    freqs.append(count)
+            self._ids = ids
+            self._lengths = lengths
+            self._postings = {
+                term: (np.asarray(positions, dtype=np.int32), np.asarray(freqs, dtype=np.float32))
+                for term, (positions, freqs) in grouped.items()
+            }
+            return self._postings, ids, lengths
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        merchant: Optional[str] = None,
+        require: Sequence[str] = (),
+    ) -> List[LexicalHit]:
+        """
+        Top `limit` chunks by BM25, optionally only those whose metadata
+        merchant matches and whose text contains every `require` term verbatim.
+        """
+        postings, ids, lengths = self._build()
+        if not ids:
+            return []
+        total = len(ids)
+        avg_length = float(lengths.mean()) or 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length)
+        scores = np.zeros(total)
+        for term in set(tokenize(query)):
+            entry = postings.get(term)
+            if entry is None:
+                continue
+            positions, freqs = entry
+            idf = math.log(1 + (total - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * freqs * (BM25_K1 + 1) / (freqs + norm[positions])
+
+        hits: List[LexicalHit] = []
+        matched = np.flatnonzero(scores > 0)
+        for position in matched[np.argsort(-scores[matched], kind="stable")]:
+            if len(hits) >= limit:
+                break
+            doc = self.docs.get(ids[position])
+            if doc is None:
+                continue
+            if merchant and doc["meta"].get("merchant") != merchant:
+                continue
+            if require:
+                lowered = doc["text"].lower()
+                if not all(_contains(lowered, term) for term in require):
+                    continue
+            hits.append(LexicalHit(ids[position], float(scores[position]), doc["text"], doc["meta"]))
+        return hits
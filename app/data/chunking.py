@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import functools
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+# Bump when chunk boundaries change so ingestion re-chunks existing documents.
+CHUNKER_VERSION = 1
+DEFAULT_MAX_TOKENS = 400
+DEFAULT_OVERLAP_TOKENS = 40
+TOKENIZER_ENCODING = "cl100k_base"
+
+# Headings: "Section 5", "§ 310.4 Definitions", "II. BACKGROUND", "A. Scope", "12.3 Cancellation",
+# or short ALL-CAPS lines.
+_KEYWORD_HEADING = re.compile(
+    r"^[ \t]*(?:(?i:section|sec\.|article|part|chapter|subpart|appendix|schedule)\b|§+)[ \t]*"
+    r"[\dIVXLC]+[\w.()\-]*(?:[ \t]+[A-Z][^\n,;]{0,80})?[ \t]*$",
+    re.MULTILINE,
+)
+_OUTLINE_HEADING = re.compile(r"^[ \t]*(?:[IVXLC]{1,6}|[A-Z])\.[ \t]+[A-Z][^\n.;:,]{0,80}$", re.MULTILINE)
+_NUMBERED_HEADING = re.compile(r"^[ \t]*\d{1,2}(?:\.\d{1,3})*\.?[ \t]+[A-Z][^\n.;:,]{0,80}$", re.MULTILINE)
+_CAPS_HEADING = re.compile(r"^[ \t]*[A-Z][A-Z0-9 ,&'()/\-]{3,80}$", re.MULTILINE)
+# A heading line has to follow a finished sentence, a page number or a blank line,
+# which rules out body text that happens to wrap before "§ 425.2".
+_HEADING_PRECEDERS = set(".:;!?)\"'\u201d\u2019") | set("0123456789")
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9§])")
+_CLAUSE_END = re.compile(r"[;:,]\s+")
+_WORD = re.compile(r"\S+")
+_APPROX_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+_ABBREVIATIONS = {
+    "art", "cf", "co", "corp", "dr", "e.g", "etc", "i.e", "inc", "ltd", "mr", "mrs", "ms",
+    "no", "nos", "para", "pp", "sec", "secs", "st", "u.s", "v", "vs",
+}
+_QUERY_TERM = re.compile(r"[a-z0-9§][a-z0-9.§]*[a-z0-9]|[a-z0-9]", re.IGNORECASE)
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "for", "from", "how", "i", "if",
+    "in", "is", "it", "me", "my", "of", "on", "or", "the", "this", "to", "was", "what", "when",
+    "with", "you", "your",
+}
+
+Span = Tuple[int, int]
+
+
+@dataclass(frozen=True)
+class Chunk:
+    text: str
+    # Character offsets into the chunked text: text == source[start:end].
+    start: int
+    end: int
+    section: Optional[str] = None
+
+
+@functools.lru_cache(maxsize=1)
+def _token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        # Without tiktoken (or its encoding files), count word pieces of up to four characters.
+        return lambda text: len(_APPROX_TOKEN.findall(text))
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str) -> int:
+    return _token_counter()(text)
+
+
+def _strip_span(text: str, start: int, end: int) -> Optional[Span]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
+
+
+def _split(text: str, start: int, end: int, boundary: "re.Pattern[str]") -> List[Span]:
+    """
+    Spans of text[start:end] cut after each `boundary` match, whitespace trimmed.
+    """
+    spans = []
+    cursor = start
+    for match in boundary.finditer(text, start, end):
+        piece = _strip_span(text, cursor, match.end())
+        if piece:
+            spans.append(piece)
+        cursor = match.end()
+    piece = _strip_span(text, cursor, end)
+    if piece:
+        spans.append(piece)
+    return spans
+
+
+def _sentence_spans(text: str, start: int, end: int) -> List[Span]:
+    spans: List[Span] = []
+    cursor = start
+    for match in _SENTENCE_END.finditer(text, start, end):
+        words = text[cursor : match.start() + 1].split()
+        last_word = words[-1].rstrip(".").lower() if words else ""
+        # "U.S. Code", "Sec. 4", "e.g. a refund" don't end a sentence.
+        if last_word in _ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha()):
+            continue
+        piece = _strip_span(text, cursor, match.end())
+        if piece:
+            spans.append(piece)
+        cursor = match.end()
+    piece = _strip_span(text, cursor, end)
+    if piece:
+        spans.append(piece)
+    return spans
+
+
+def _section_spans(text: str) -> List[Tuple[int, int, Optional[str]]]:
+    starts = {}
+    for pattern in (_KEYWORD_HEADING, _OUTLINE_HEADING, _NUMBERED_HEADING, _CAPS_HEADING):
+        for match in pattern.finditer(text):
+            heading = match.group(0).strip()
+            if not heading:
+                continue
+            before = text[: match.start()].rstrip(" \t")
+            if before and not before.endswith("\n\n") and before.rstrip()[-1] not in _HEADING_PRECEDERS:
+                continue
+            starts.setdefault(match.start(), heading)
+    if not starts:
+        return [(0, len(text), None)]
+    ordered = sorted(starts.items())
+    sections: List[Tuple[int, int, Optional[str]]] = []
+    if ordered[0][0] > 0:
+        sections.append((0, ordered[0][0], None))
+    for idx, (start, heading) in enumerate(ordered):
+        end = ordered[idx + 1][0] if idx + 1 < len(ordered) else len(text)
+        sections.append((start, end, heading))
+    return sections
+
+
+def _fit(text: str, span: Span, max_tokens: int, levels: List[Callable[[str, int, int], List[Span]]]) -> List[Tuple[Span, int]]:
+    """
+    `span` as (span, tokens) units of at most `max_tokens`, splitting at the
+    coarsest boundary in `levels` that works and by words as a last resort.
+    """
+    tokens = count_tokens(text[span[0] : span[1]])
+    if tokens <= max_tokens:
+        return [(span, tokens)]
+    for idx, level in enumerate(levels):
+        parts = level(text, span[0], span[1])
+        if len(parts) > 1:
+            units: List[Tuple[Span, int]] = []
+            for part in parts:
+                units.extend(_fit(text, part, max_tokens, levels[idx + 1 :]))
+            return units
+    # A single run-on "sentence": cut between words.
+    units = []
+    words = [(m.start(), m.end()) for m in _WORD.finditer(text, span[0], span[1])]
+    piece_start: Optional[int] = None
+    piece_tokens = 0
+    prev_end = span[0]
+    for word_start, word_end in words:
+        word_tokens = count_tokens(text[word_start:word_end]) + 1
+        if piece_start is not None and piece_tokens + word_tokens > max_tokens:
+            units.append(((piece_start, prev_end), piece_tokens))
+            piece_start, piece_tokens = None, 0
+        if piece_start is None:
+            piece_start = word_start
+        piece_tokens += word_tokens
+        prev_end = word_end
+    if piece_start is not None:
+        units.append(((piece_start, prev_end), piece_tokens))
+    return units
+
+
+_LEVELS: List[Callable[[str, int, int], List[Span]]] = [
+    lambda text, start, end: _split(text, start, end, _PARAGRAPH_BREAK),
+    _sentence_spans,
+    lambda text, start, end: _split(text, start, end, _CLAUSE_END),
+]
+
+
+def chunk_document(
+    text: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> List[Chunk]:
+    """
+    Splits `text` into chunks of up to `max_tokens` tokens (tiktoken when
+    installed, an approximation otherwise). Chunks break at section headings,
+    then paragraphs, then sentences; a section shorter than a quarter window is
+    packed together with the next one. Consecutive chunks of one section share
+    up to `overlap_tokens` of trailing sentences.
+    """
+    max_tokens = max(max_tokens, 16)
+    overlap_tokens = max(min(overlap_tokens, max_tokens // 2), 0)
+    min_tokens = max_tokens // 4
+    chunks: List[Chunk] = []
+    current: List[Tuple[Span, int]] = []
+    current_tokens = 0
+    current_section: Optional[str] = None
+
+    def emit() -> None:
+        start, end = current[0][0][0], current[-1][0][1]
+        chunks.append(Chunk(text=text[start:end], start=start, end=end, section=current_section))
+
+    for section_start, section_end, heading in _section_spans(text):
+        section = _strip_span(text, section_start, section_end)
+        if section is None:
+            continue
+        if current and current_tokens >= min_tokens:
+            emit()
+            current, current_tokens = [], 0
+        if not current:
+            current_section = heading
+        for unit in _fit(text, section, max_tokens, _LEVELS):
+            if current and current_tokens + unit[1] > max_tokens:
+                emit()
+                carried: List[Tuple[Span, int]] = []
+                carried_tokens = 0
+                for prev in reversed(current[1:]):
+                    if carried_tokens + prev[1] > overlap_tokens:
+                        break
+                    carried.insert(0, prev)
+                    carried_tokens += prev[1]
+                if carried_tokens + unit[1] > max_tokens:
+                    carried, carried_tokens = [], 0
+                current, current_tokens = carried, carried_tokens
+                current_section = heading
+            current.append(unit)
+            current_tokens += unit[1]
+    if current:
+        emit()
+    return chunks
+
+
+def best_excerpt(text: str, query: str, max_chars: int) -> Span:
+    """
+    (start, end) of the run of whole sentences in `text`, at most `max_chars`
+    long, that mentions the most query terms; the opening when none match.
+    """
+    if len(text) <= max_chars:
+        return (0, len(text))
+    sentences = _sentence_spans(text, 0, len(text)) or [(0, len(text))]
+    terms = {term.lower() for term in _QUERY_TERM.findall(query)} - _STOPWORDS
+    scores = [
+        sum(1 for word in _QUERY_TERM.findall(text[start:end]) if word.lower() in terms) for start, end in sentences
+    ]
+    best: Tuple[int, int, int] = (-1, 0, 0)
+    right = 0
+    score = 0
+    for left in range(len(sentences)):
+        if right < left:
+            right, score = left, 0
+        while right < len(sentences) and sentences[right][1] - sentences[left][0] <= max_chars:
+            score += scores[right]
+            right += 1
+        if right > left and score > best[0]:
+            best = (score, sentences[left][0], sentences[right - 1][1])
+        if right > left:
+            score -= scores[left]
+    if best[0] <= 0:
+        start = sentences[0][0]
+        return (start, min(start + max_chars, len(text)))
+    return (best[1], best[2])
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DATA_DIR = Path(__file__).resolve().parent
+EMBEDDING_CACHE_PATH = Path(os.environ.get("EMBEDDING_CACHE_PATH") or DATA_DIR / "embedding_cache.db")
+EMBEDDING_CACHE_ENABLED = (os.environ.get("EMBEDDING_CACHE_ENABLED", "1") or "1").strip().lower() not in {"0", "false", "no"}
+# float32 keeps vectors exact; float16 halves the file at ~1e-3 precision.
+EMBEDDING_CACHE_DTYPE = (os.environ.get("EMBEDDING_CACHE_DTYPE", "float32") or "float32").strip().lower()
+# Query vectors kept in memory (the disk tier holds everything).
+EMBEDDING_CACHE_HOT_SIZE = int(os.environ.get("EMBEDDING_CACHE_HOT_SIZE", "2048") or "2048")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    text_hash BLOB NOT NULL,
+    dtype TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (provider, model, text_hash, dim)
+) WITHOUT ROWID;
+"""
+
+# Stay well under SQLite's bound-parameter limit on older builds.
+MAX_IN_PARAMS = 500
+
+_DTYPES = {"float16": np.float16, "float32": np.float32}
+
+Computer = Callable[[List[str]], List[List[float]]]
+
+
+def _text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (provider, model, dimension, sha256 of the text), stored
+    as raw float blobs in SQLite, with an in-memory LRU in front for queries.
+    `dim=None` on lookup accepts whatever dimension the model produced.
+    """
+
+    def __init__(self, path: Path = EMBEDDING_CACHE_PATH, dtype: str = EMBEDDING_CACHE_DTYPE, hot_size: int = EMBEDDING_CACHE_HOT_SIZE):
+        if dtype not in _DTYPES:
+            raise ValueError(f"EMBEDDING_CACHE_DTYPE must be one of {', '.join(sorted(_DTYPES))}; got {dtype!r}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self.hot_size = max(hot_size, 0)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._hot: "OrderedDict[Tuple[str, str, bytes], List[float]]" = OrderedDict()
+        self._hot_lock = threading.Lock()
+        self._counts = {"hot_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._hot_lock:
+            self._counts[name] += n
+
+    def _hot_get(self, key: Tuple[str, str, bytes], dim: Optional[int]) -> Optional[List[float]]:
+        with self._hot_lock:
+            vector = self._hot.get(key)
+            if vector is None or (dim is not None and len(vector) != dim):
+                return None
+            self._hot.move_to_end(key)
+            return vector
+
+    def _hot_put(self, key: Tuple[str, str, bytes], vector: List[float]) -> None:
+        if not self.hot_size:
+            return
+        with self._hot_lock:
+            self._hot[key] = vector
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.hot_size:
+                self._hot.popitem(last=False)
+
+    def get_many(self, provider: str, model: str, dim: Optional[int], hashes: Sequence[bytes]) -> Dict[bytes, List[float]]:
+        found: Dict[bytes, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        conn = self._conn()
+        for start in range(0, len(unique), MAX_IN_PARAMS):
+            batch = unique[start : start + MAX_IN_PARAMS]
+            placeholders = ",".join("?" for _ in batch)
+            rows = conn.execute(
+                f"SELECT text_hash, dtype, vector FROM embeddings "
+                f"WHERE provider = ? AND model = ? AND (? IS NULL OR dim = ?) AND text_hash IN ({placeholders})",
+                (provider, model, dim, dim, *batch),
+            ).fetchall()
+            for text_hash, dtype, blob in rows:
+                found[bytes(text_hash)] = np.frombuffer(blob, dtype=_DTYPES[dtype]).astype(np.float32).tolist()
+        return found
+
+    def put_many(self, provider: str, model: str, items: Sequence[Tuple[bytes, List[float]]]) -> None:
+        np_dtype = _DTYPES[self.dtype]
+        rows = [
+            (provider, model, len(vector), text_hash, self.dtype, np.asarray(vector, dtype=np_dtype).tobytes())
+            for text_hash, vector in items
+        ]
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (provider, model, dim, text_hash, dtype, vector) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def embed(
+        self,
+        provider: str,
+        model: str,
+        dim: Optional[int],
+        texts: Sequence[str],
+        compute: Computer,
+        hot: bool = False,
+    ) -> List[List[float]]:
+        """
+        Vectors for `texts`, calling `compute` once with only the distinct texts
+        missing from the cache. `hot` also consults and fills the in-memory
+        tier (use it for queries, not bulk ingestion).
+        """
+        hashes = [_text_hash(text) for text in texts]
+        vectors: Dict[bytes, List[float]] = {}
+        if hot:
+            for text_hash in hashes:
+                cached = self._hot_get((provider, model, text_hash), dim)
+                if cached is not None:
+                    vectors[text_hash] = cached
+            self._count("hot_hits", sum(1 for text_hash in hashes if text_hash in vectors))
+
+        wanted = [text_hash for text_hash in hashes if text_hash not in vectors]
+        if wanted:
+            try:
+                on_disk = self.get_many(provider, model, dim, wanted)
+            except sqlite3.Error as exc:
+                print(f"Embedding cache read failed ({exc}); computing embeddings directly.")
+                on_disk = {}
+            self._count("disk_hits", sum(1 for text_hash in wanted if text_hash in on_disk))
+            vectors.update(on_disk)
+
+        missing: Dict[bytes, str] = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+        if missing:
+            self._count("misses", sum(1 for text_hash in hashes if text_hash in missing))
+            computed = compute(list(missing.values()))
+            fresh = list(zip(missing.keys(), computed))
+            vectors.update(fresh)
+            try:
+                self.put_many(provider, model, fresh)
+            except sqlite3.Error as exc:
+                print(f"Embedding cache write failed: {exc}")
+
+        if hot:
+            for text_hash in dict.fromkeys(hashes):
+                self._hot_put((provider, model, text_hash), vectors[text_hash])
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def stats(self) -> Dict[str, int]:
+        with self._hot_lock:
+            return {**self._counts, "hot_entries": len(self._hot)}
+
+
+_cache_lock = threading.Lock()
+_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    The process-wide embedding cache, or None when EMBEDDING_CACHE_ENABLED is off.
+    """
+    global _cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
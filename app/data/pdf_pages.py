@@ -0,0 +1,219 @@
+"""
+Page-parallel PDF text extraction and OCR.
+
+Pages are fanned out to a process pool. Each worker opens the document once
+(from a temp file written by the parent) and renders one page at a time, so
+no more than one rasterized page per worker is held in memory. Per-page text
+is returned in page order for the caller to merge.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+OCR_DPI = 200
+PDF_PAGE_WORKERS = int(os.environ.get("PDF_PAGE_WORKERS", "0") or "0") or min(4, os.cpu_count() or 1)
+# Text extraction is cheap per page; only pay for worker start-up on long documents.
+PDF_TEXT_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_TEXT_PARALLEL_MIN_PAGES", "16") or "16")
+PDF_OCR_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_OCR_PARALLEL_MIN_PAGES", "2") or "2")
+
+_OCR_MISSING_RENDERER = (
+    "OCR failed. Install Poppler (for pdf2image) or PyMuPDF, and ensure Tesseract is available. "
+    "Optionally set POPPLER_PATH or TESSERACT_CMD."
+)
+_OCR_FAILED = "OCR failed using both Poppler and PyMuPDF. Ensure Tesseract is installed and accessible."
+
+
+def find_poppler_path() -> Optional[str]:
+    env_path = os.environ.get("POPPLER_PATH") or os.environ.get("POPPLER_BIN")
+    if env_path and Path(env_path).exists():
+        return str(Path(env_path))
+    choco_bin = Path(r"C:\ProgramData\chocolatey\bin\pdftoppm.exe")
+    if choco_bin.exists():
+        return str(choco_bin.parent)
+    base = Path(r"C:\ProgramData\chocolatey\lib\poppler\tools")
+    if base.exists():
+        for candidate in base.glob("poppler-*/Library/bin"):
+            if (candidate / "pdftoppm.exe").exists():
+                return str(candidate)
+    return None
+
+
+def find_tesseract_cmd() -> Optional[str]:
+    env_cmd = os.environ.get("TESSERACT_CMD") or os.environ.get("TESSERACT_PATH")
+    if env_cmd and Path(env_cmd).exists():
+        return str(Path(env_cmd))
+    candidates = [
+        Path(r"C:\Program Files\Tesseract-OCR\tesseract.exe"),
+        Path(r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"),
+        Path(r"C:\ProgramData\chocolatey\bin\tesseract.exe"),
+    ]
+    for candidate in candidates:
+        if candidate.exists():
+            return str(candidate)
+    return None
+
+
+class _Document:
+    """
+    One open PDF inside a worker. Parsers are opened lazily and reused for
+    every page the worker handles.
+    """
+
+    def __init__(self, path: str, poppler_path: Optional[str] = None, tesseract_cmd: Optional[str] = None):
+        self.path = path
+        self.poppler_path = poppler_path
+        self.tesseract_cmd = tesseract_cmd
+        self._pypdf: Any = None
+        self._fitz: Any = None
+
+    def pypdf(self) -> Any:
+        if self._pypdf is None:
+            from pypdf import PdfReader
+
+            self._pypdf = PdfReader(self.path)
+        return self._pypdf
+
+    def fitz(self) -> Any:
+        if self._fitz is None:
+            import fitz  # PyMuPDF
+
+            self._fitz = fitz.open(self.path)
+        return self._fitz
+
+    def page_count(self) -> int:
+        try:
+            return len(self.pypdf().pages)
+        except Exception:
+            pass
+        try:
+            return int(self.fitz().page_count)
+        except Exception:
+            pass
+        try:
+            from pdf2image import pdfinfo_from_path
+
+            info = pdfinfo_from_path(self.path, poppler_path=self.poppler_path)
+            return int(info.get("Pages") or 0)
+        except Exception:
+            return 0
+
+    def text(self, page_number: int) -> str:
+        try:
+            return self.pypdf().pages[page_number - 1].extract_text() or ""
+        except Exception:
+            try:
+                return self.fitz().load_page(page_number - 1).get_text()
+            except Exception:
+                return ""
+
+    def _render(self, page_number: int) -> Any:
+        try:
+            from pdf2image import convert_from_path
+
+            kwargs = {"poppler_path": self.poppler_path} if self.poppler_path else {}
+            images = convert_from_path(
+                self.path,
+                dpi=OCR_DPI,
+                first_page=page_number,
+                last_page=page_number,
+                **kwargs,
+            )
+            return images[0]
+        except Exception:
+            # Fallback to PyMuPDF rendering when Poppler is unavailable.
+            try:
+                import fitz  # noqa: F401  # PyMuPDF
+            except ImportError as exc:
+                raise ValueError(_OCR_MISSING_RENDERER) from exc
+            from PIL import Image
+
+            pix = self.fitz().load_page(page_number - 1).get_pixmap(dpi=OCR_DPI)
+            return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+    def ocr(self, page_number: int) -> str:
+        import pytesseract
+
+        if self.tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+        try:
+            image = self._render(page_number)
+        except ValueError:
+            raise
+        except Exception as exc:
+            raise ValueError(_OCR_FAILED) from exc
+        try:
+            return pytesseract.image_to_string(image)
+        except Exception as exc:
+            raise ValueError(_OCR_FAILED) from exc
+        finally:
+            image.close()
+
+
+_worker_document: Optional[_Document] = None
+
+
+def _init_worker(path: str, poppler_path: Optional[str], tesseract_cmd: Optional[str]) -> None:
+    global _worker_document
+    _worker_document = _Document(path, poppler_path, tesseract_cmd)
+
+
+def _worker_text(page_number: int) -> str:
+    return _worker_document.text(page_number)
+
+
+def _worker_ocr(page_number: int) -> str:
+    return _worker_document.ocr(page_number)
+
+
+def _map_pages(
+    content: bytes,
+    serial: Callable[[_Document, int], str],
+    worker: Callable[[int], str],
+    min_parallel_pages: int,
+    workers: Optional[int] = None,
+) -> List[str]:
+    poppler_path = find_poppler_path()
+    tesseract_cmd = find_tesseract_cmd()
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(content)
+        path = tmp.name
+    try:
+        document = _Document(path, poppler_path, tesseract_cmd)
+        pages = list(range(1, document.page_count() + 1))
+        count = min(workers or PDF_PAGE_WORKERS, len(pages))
+        if count <= 1 or len(pages) < min_parallel_pages:
+            return [serial(document, page) for page in pages]
+        # "spawn" keeps workers independent of the server's threads and open sockets.
+        with ProcessPoolExecutor(
+            max_workers=count,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(path, poppler_path, tesseract_cmd),
+        ) as pool:
+            return list(pool.map(worker, pages))
+    finally:
+        Path(path).unlink(missing_ok=True)
+
+
+def extract_pdf_page_texts(content: bytes, workers: Optional[int] = None) -> List[str]:
+    """
+    Embedded text per page (pypdf, falling back to PyMuPDF), in page order.
+    """
+    return _map_pages(content, _Document.text, _worker_text, PDF_TEXT_PARALLEL_MIN_PAGES, workers)
+
+
+def ocr_pdf_page_texts(content: bytes, workers: Optional[int] = None) -> List[str]:
+    """
+    Tesseract output per page, in page order. Raises ValueError when no
+    renderer or Tesseract is usable.
+    """
+    texts = _map_pages(content, _Document.ocr, _worker_ocr, PDF_OCR_PARALLEL_MIN_PAGES, workers)
+    if not texts:
+        raise ValueError(_OCR_MISSING_RENDERER)
+    return texts
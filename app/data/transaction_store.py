@@ -0,0 +1,625 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+DATA_DIR = Path(__file__).resolve().parent
+DB_PATH = Path(os.environ.get("TRANSACTIONS_DB_PATH") or DATA_DIR / "bank_transactions.db")
+LEGACY_STORE_PATH = DATA_DIR / "bank_transactions.json"
+# Rows from the old single-file store wait here until the first signed-in owner
+# claims them; keeping them apart from the anonymous owner means anonymous
+# uploads are never handed to anyone.
+LEGACY_OWNER = ("__legacy__", "")
+
+TX_COLUMNS = [
+    "transaction_id",
+    "date",
+    "merchant_name",
+    "amount",
+    "category",
+    "notes",
+    "currency",
+    "currency_symbol",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    transaction_id TEXT NOT NULL,
+    date TEXT NOT NULL DEFAULT '',
+    merchant_name TEXT NOT NULL DEFAULT '',
+    amount REAL NOT NULL DEFAULT 0,
+    category TEXT NOT NULL DEFAULT '[]',
+    notes TEXT NOT NULL DEFAULT '',
+    currency TEXT,
+    currency_symbol TEXT,
+    source TEXT,
+    UNIQUE (user_id, account_id, transaction_id)
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (user_id, account_id, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_merchant ON transactions (user_id, account_id, merchant_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_transactions_amount ON transactions (user_id, account_id, amount);
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    source TEXT,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS owners (
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, account_id)
+);
+CREATE TABLE IF NOT EXISTS merchant_issues (
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    merchant TEXT NOT NULL,
+    first_seq INTEGER NOT NULL,
+    issues TEXT NOT NULL DEFAULT '[]',
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, account_id, merchant)
+);
+CREATE TABLE IF NOT EXISTS issue_index (
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    ruleset TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, account_id)
+);
+CREATE TABLE IF NOT EXISTS upload_staging (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    upload_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    transaction_id TEXT NOT NULL,
+    date TEXT NOT NULL DEFAULT '',
+    merchant_name TEXT NOT NULL DEFAULT '',
+    amount REAL NOT NULL DEFAULT 0,
+    category TEXT NOT NULL DEFAULT '[]',
+    notes TEXT NOT NULL DEFAULT '',
+    currency TEXT,
+    currency_symbol TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_upload_staging_upload ON upload_staging (upload_id, seq);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Stay well under SQLite's bound-parameter limit on older builds.
+MAX_IN_PARAMS = 500
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready: set = set()
+
+
+def _owner(user_id: Optional[str], account_id: Optional[str]) -> tuple[str, str]:
+    return (str(user_id or "").strip(), str(account_id or "").strip())
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _open(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def _ensure_schema(conn: sqlite3.Connection, path: Path) -> None:
+    key = str(path)
+    if key in _schema_ready:
+        return
+    with _schema_lock:
+        if key in _schema_ready:
+            return
+        conn.executescript(SCHEMA)
+        _import_legacy_store(conn)
+        _schema_ready.add(key)
+
+
+def _get_connection() -> sqlite3.Connection:
+    # One connection per thread; SQLite in WAL mode lets readers and a writer
+    # proceed concurrently across threads and uvicorn worker processes.
+    connections: Dict[str, sqlite3.Connection] = getattr(_local, "connections", None) or {}
+    _local.connections = connections
+    key = str(DB_PATH)
+    conn = connections.get(key)
+    if conn is None:
+        conn = _open(DB_PATH)
+        connections[key] = conn
+    _ensure_schema(conn, DB_PATH)
+    return conn
+
+
+@contextmanager
+def _transaction() -> Iterator[sqlite3.Connection]:
+    conn = _get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def stored_merchant_name(tx: Dict[str, Any]) -> str:
+    return str(tx.get("merchant_name") or "Unknown Merchant").strip()
+
+
+def _row_values(tx: Dict[str, Any], owner: tuple[str, str], source: str) -> tuple:
+    category = tx.get("category") or []
+    if not isinstance(category, list):
+        category = [str(category)]
+    try:
+        amount = float(tx.get("amount") or 0.0)
+    except (TypeError, ValueError):
+        amount = 0.0
+    return (
+        owner[0],
+        owner[1],
+        str(tx.get("transaction_id") or ""),
+        str(tx.get("date") or ""),
+        stored_merchant_name(tx),
+        amount,
+        json.dumps(category),
+        str(tx.get("notes") or ""),
+        tx.get("currency"),
+        tx.get("currency_symbol"),
+        source,
+    )
+
+
+def _row_to_tx(row: sqlite3.Row) -> Dict[str, Any]:
+    try:
+        category = json.loads(row["category"] or "[]")
+    except ValueError:
+        category = []
+    return {
+        "transaction_id": row["transaction_id"],
+        "date": row["date"],
+        "merchant_name": row["merchant_name"],
+        "amount": row["amount"],
+        "category": category,
+        "notes": row["notes"],
+        "currency": row["currency"],
+        "currency_symbol": row["currency_symbol"],
+    }
+
+
+_ROW_COLUMNS = (
+    "user_id, account_id, transaction_id, date, merchant_name, amount, "
+    "category, notes, currency, currency_symbol, source"
+)
+_UPSERT = """
+        ON CONFLICT (user_id, account_id, transaction_id) DO UPDATE SET
+            date = excluded.date,
+            merchant_name = excluded.merchant_name,
+            amount = excluded.amount,
+            category = excluded.category,
+            notes = excluded.notes,
+            currency = excluded.currency,
+            currency_symbol = excluded.currency_symbol,
+            source = excluded.source
+"""
+
+
+def _insert_rows(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    conn.executemany(
+        f"INSERT INTO transactions ({_ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) {_UPSERT}",
+        rows,
+    )
+
+
+def _record_upload(conn: sqlite3.Connection, owner: tuple[str, str], source: str, row_count: int) -> None:
+    conn.execute(
+        "INSERT INTO uploads (user_id, account_id, source, row_count, created_at) VALUES (?, ?, ?, ?, ?)",
+        (owner[0], owner[1], source, row_count, _now_iso()),
+    )
+
+
+def _chunked(items: List[Any], size: int = MAX_IN_PARAMS) -> Iterator[List[Any]]:
+    for idx in range(0, len(items), size):
+        yield items[idx : idx + size]
+
+
+def _bump_owner_version(conn: sqlite3.Connection, owner: tuple[str, str]) -> None:
+    conn.execute(
+        """
+        INSERT INTO owners (user_id, account_id, version, updated_at) VALUES (?, ?, 1, ?)
+        ON CONFLICT (user_id, account_id) DO UPDATE SET
+            version = owners.version + 1,
+            updated_at = excluded.updated_at
+        """,
+        (owner[0], owner[1], _now_iso()),
+    )
+
+
+def _import_legacy_store(conn: sqlite3.Connection) -> None:
+    # One-time migration of the old single-file JSON store into LEGACY_OWNER.
+    done = conn.execute("SELECT value FROM store_meta WHERE key = 'legacy_imported'").fetchone()
+    if done or not LEGACY_STORE_PATH.exists():
+        return
+    try:
+        data = json.loads(LEGACY_STORE_PATH.read_text(encoding="utf-8") or "{}")
+    except (OSError, ValueError):
+        data = {}
+    source = "legacy"
+    if isinstance(data, dict):
+        source = str(data.get("source") or source)
+        data = data.get("transactions")
+    transactions = data if isinstance(data, list) else []
+    owner = LEGACY_OWNER
+    with conn:
+        if transactions:
+            _insert_rows(conn, [_row_values(tx, owner, source) for tx in transactions if isinstance(tx, dict)])
+            _record_upload(conn, owner, source, len(transactions))
+            _bump_owner_version(conn, owner)
+        conn.execute(
+            "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('legacy_imported', ?)",
+            (_now_iso(),),
+        )
+
+
+def claim_legacy_transactions(user_id: Optional[str] = None, account_id: Optional[str] = None) -> int:
+    """
+    Hands the imported legacy rows, with their issues, to the given owner. Only
+    the first signed-in owner with nothing stored gets them; every later call
+    returns 0. Returns the number of rows moved.
+    """
+    owner = _owner(user_id, account_id)
+    if not owner[0] or owner == LEGACY_OWNER:
+        return 0
+    with _transaction() as conn:
+        if conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_claimed'").fetchone():
+            return 0
+        if conn.execute(
+            "SELECT 1 FROM transactions WHERE user_id = ? AND account_id = ? LIMIT 1",
+            owner,
+        ).fetchone():
+            return 0
+        moved = conn.execute(
+            "UPDATE transactions SET user_id = ?, account_id = ? WHERE user_id = ? AND account_id = ?",
+            (*owner, *LEGACY_OWNER),
+        ).rowcount
+        if not moved:
+            return 0
+        conn.execute("DELETE FROM merchant_issues WHERE user_id = ? AND account_id = ?", owner)
+        conn.execute("DELETE FROM issue_index WHERE user_id = ? AND account_id = ?", owner)
+        for table in ("merchant_issues", "issue_index", "uploads"):
+            conn.execute(
+                f"UPDATE {table} SET user_id = ?, account_id = ? WHERE user_id = ? AND account_id = ?",
+                (*owner, *LEGACY_OWNER),
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('legacy_claimed', ?)",
+            (json.dumps({"user_id": owner[0], "account_id": owner[1], "at": _now_iso()}),),
+        )
+        _bump_owner_version(conn, owner)
+        _bump_owner_version(conn, LEGACY_OWNER)
+    return moved
+
+
+def append_transactions(
+    transactions: Iterable[Dict[str, Any]],
+    source: str = "upload",
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> int:
+    """
+    Appends transactions for an owner. Rows that reuse an existing transaction_id
+    are updated in place, so re-confirming the same export does not duplicate it.
+    """
+    owner = _owner(user_id, account_id)
+    rows = [_row_values(tx, owner, source) for tx in transactions]
+    if not rows:
+        return 0
+    with _transaction() as conn:
+        _insert_rows(conn, rows)
+        _record_upload(conn, owner, source, len(rows))
+        _bump_owner_version(conn, owner)
+    return len(rows)
+
+
+def stage_transactions(
+    upload_id: str,
+    transactions: Iterable[Dict[str, Any]],
+    source: str = "upload",
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> int:
+    """
+    Holds one batch of a multi-batch upload aside; nothing is visible to readers
+    until commit_staged_upload, and discard_staged_upload drops it all.
+    """
+    owner = _owner(user_id, account_id)
+    rows = [(upload_id, *_row_values(tx, owner, source)) for tx in transactions]
+    if not rows:
+        return 0
+    with _transaction() as conn:
+        conn.executemany(
+            f"INSERT INTO upload_staging (upload_id, {_ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+    return len(rows)
+
+
+def commit_staged_upload(
+    upload_id: str,
+    source: str = "upload",
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> int:
+    """
+    Moves every staged batch of an upload into the owner's transactions in one
+    write transaction, recorded as a single upload. Returns the rows committed.
+    """
+    owner = _owner(user_id, account_id)
+    with _transaction() as conn:
+        # "WHERE" keeps SQLite from reading ON CONFLICT as a join constraint.
+        cursor = conn.execute(
+            f"INSERT INTO transactions ({_ROW_COLUMNS}) SELECT {_ROW_COLUMNS} FROM upload_staging "
+            f"WHERE upload_id = ? AND user_id = ? AND account_id = ? ORDER BY seq {_UPSERT}",
+            (upload_id, *owner),
+        )
+        count = cursor.rowcount
+        conn.execute("DELETE FROM upload_staging WHERE upload_id = ?", (upload_id,))
+        if count > 0:
+            _record_upload(conn, owner, source, count)
+            _bump_owner_version(conn, owner)
+    return max(count, 0)
+
+
+def discard_staged_upload(upload_id: str) -> None:
+    with _transaction() as conn:
+        conn.execute("DELETE FROM upload_staging WHERE upload_id = ?", (upload_id,))
+
+
+def clear_transactions(user_id: Optional[str] = None, account_id: Optional[str] = None) -> int:
+    owner = _owner(user_id, account_id)
+    with _transaction() as conn:
+        cursor = conn.execute(
+            "DELETE FROM transactions WHERE user_id = ? AND account_id = ?",
+            owner,
+        )
+        conn.execute("DELETE FROM merchant_issues WHERE user_id = ? AND account_id = ?", owner)
+        conn.execute("DELETE FROM issue_index WHERE user_id = ? AND account_id = ?", owner)
+        _bump_owner_version(conn, owner)
+    return cursor.rowcount
+
+
+def fetch_transactions(
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    merchants: Optional[Iterable[str]] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Returns an owner's transactions in upload order. Date bounds are inclusive
+    ISO dates (YYYY-MM-DD); merchant matching is exact and case-insensitive.
+    """
+    clauses = ["user_id = ?", "account_id = ?"]
+    params: List[Any] = list(_owner(user_id, account_id))
+    if start_date:
+        clauses.append("date >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("date <= ?")
+        params.append(end_date)
+    names: Optional[List[str]] = None
+    if merchants is not None:
+        names = sorted({str(m) for m in merchants})
+        if not names:
+            return []
+    if min_amount is not None:
+        clauses.append("amount >= ?")
+        params.append(float(min_amount))
+    if max_amount is not None:
+        clauses.append("amount <= ?")
+        params.append(float(max_amount))
+
+    conn = _get_connection()
+    sql = f"SELECT {', '.join(TX_COLUMNS)} FROM transactions WHERE {' AND '.join(clauses)}"
+    if names is None:
+        return [_row_to_tx(row) for row in conn.execute(f"{sql} ORDER BY seq", params)]
+
+    rows: List[tuple] = []
+    for chunk in _chunked(names):
+        placeholders = ", ".join("?" for _ in chunk)
+        cursor = conn.execute(
+            f"SELECT seq, {', '.join(TX_COLUMNS)} FROM transactions WHERE {' AND '.join(clauses)} "
+            f"AND merchant_name COLLATE NOCASE IN ({placeholders})",
+            params + chunk,
+        )
+        rows.extend((row["seq"], row) for row in cursor)
+    rows.sort(key=lambda item: item[0])
+    return [_row_to_tx(row) for _, row in rows]
+
+
+def count_transactions(user_id: Optional[str] = None, account_id: Optional[str] = None) -> int:
+    conn = _get_connection()
+    row = conn.execute(
+        "SELECT COUNT(*) FROM transactions WHERE user_id = ? AND account_id = ?",
+        _owner(user_id, account_id),
+    ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def list_merchants(user_id: Optional[str] = None, account_id: Optional[str] = None) -> List[str]:
+    conn = _get_connection()
+    cursor = conn.execute(
+        "SELECT DISTINCT merchant_name FROM transactions WHERE user_id = ? AND account_id = ?",
+        _owner(user_id, account_id),
+    )
+    return [row[0] for row in cursor]
+
+
+def owner_version(user_id: Optional[str] = None, account_id: Optional[str] = None) -> int:
+    """
+    Monotonic per-owner write counter, bumped by every write for that owner.
+    """
+    conn = _get_connection()
+    row = conn.execute(
+        "SELECT version FROM owners WHERE user_id = ? AND account_id = ?",
+        _owner(user_id, account_id),
+    ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def store_signature() -> tuple:
+    """
+    Cheap change detector for the database files: (mtime_ns, size) of the main
+    file and its WAL. Any committed write from any process changes it.
+    """
+    signature = []
+    for path in (DB_PATH, Path(f"{DB_PATH}-wal")):
+        try:
+            stat = path.stat()
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def merchants_for_transaction_ids(
+    transaction_ids: Iterable[str],
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> set:
+    """
+    Current merchant names of already-stored transactions, used to find the
+    groups an upsert is about to move rows out of.
+    """
+    owner = _owner(user_id, account_id)
+    ids = sorted({str(tx_id) for tx_id in transaction_ids if tx_id})
+    conn = _get_connection()
+    names = set()
+    for chunk in _chunked(ids):
+        cursor = conn.execute(
+            f"SELECT DISTINCT merchant_name FROM transactions WHERE user_id = ? AND account_id = ? "
+            f"AND transaction_id IN ({', '.join('?' for _ in chunk)})",
+            [owner[0], owner[1], *chunk],
+        )
+        names.update(row[0] for row in cursor)
+    return names
+
+
+def merchant_first_seq(
+    merchants: Iterable[str],
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> Dict[str, int]:
+    owner = _owner(user_id, account_id)
+    names = sorted({str(m) for m in merchants})
+    conn = _get_connection()
+    first: Dict[str, int] = {}
+    for chunk in _chunked(names):
+        cursor = conn.execute(
+            f"SELECT merchant_name, MIN(seq) FROM transactions WHERE user_id = ? AND account_id = ? "
+            f"AND merchant_name COLLATE NOCASE IN ({', '.join('?' for _ in chunk)}) GROUP BY merchant_name",
+            [owner[0], owner[1], *chunk],
+        )
+        first.update({row[0]: int(row[1]) for row in cursor})
+    return first
+
+
+def replace_merchant_issues(
+    entries: Dict[str, tuple],
+    stale_merchants: Iterable[str] = (),
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+    ruleset: Optional[str] = None,
+    full: bool = False,
+) -> None:
+    """
+    Stores precomputed issues per merchant group. `entries` maps merchant to
+    (first_seq, issues); `stale_merchants` are dropped first. With `full=True`
+    every existing row for the owner is replaced and the ruleset is recorded.
+    """
+    owner = _owner(user_id, account_id)
+    now = _now_iso()
+    with _transaction() as conn:
+        if full:
+            conn.execute("DELETE FROM merchant_issues WHERE user_id = ? AND account_id = ?", owner)
+        else:
+            stale = sorted(set(stale_merchants) | set(entries))
+            for chunk in _chunked(stale):
+                conn.execute(
+                    f"DELETE FROM merchant_issues WHERE user_id = ? AND account_id = ? "
+                    f"AND merchant IN ({', '.join('?' for _ in chunk)})",
+                    [owner[0], owner[1], *chunk],
+                )
+        conn.executemany(
+            "INSERT INTO merchant_issues (user_id, account_id, merchant, first_seq, issues, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (owner[0], owner[1], merchant, int(first_seq), json.dumps(issues), now)
+                for merchant, (first_seq, issues) in entries.items()
+            ],
+        )
+        if full and ruleset is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO issue_index (user_id, account_id, ruleset, updated_at) VALUES (?, ?, ?, ?)",
+                (owner[0], owner[1], ruleset, now),
+            )
+        _bump_owner_version(conn, owner)
+
+
+def issue_index_ruleset(user_id: Optional[str] = None, account_id: Optional[str] = None) -> Optional[str]:
+    conn = _get_connection()
+    row = conn.execute(
+        "SELECT ruleset FROM issue_index WHERE user_id = ? AND account_id = ?",
+        _owner(user_id, account_id),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def fetch_merchant_issues(
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+) -> tuple:
+    """
+    Returns (ruleset, [(merchant, first_seq, issues)]) for an owner; ruleset is
+    None when the owner's issues have never been fully indexed.
+    """
+    owner = _owner(user_id, account_id)
+    ruleset = issue_index_ruleset(*owner)
+    conn = _get_connection()
+    cursor = conn.execute(
+        "SELECT merchant, first_seq, issues FROM merchant_issues WHERE user_id = ? AND account_id = ? "
+        "ORDER BY first_seq",
+        owner,
+    )
+    rows = []
+    for row in cursor:
+        try:
+            issues = json.loads(row["issues"] or "[]")
+        except ValueError:
+            issues = []
+        rows.append((row["merchant"], int(row["first_seq"]), issues))
+    return (ruleset, rows)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DATA_DIR = Path(__file__).resolve().parent
+UPLOAD_CACHE_DIR = Path(os.environ.get("UPLOAD_CACHE_DIR") or DATA_DIR / "upload_cache")
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get("UPLOAD_CACHE_MAX_BYTES", str(256 * 1024 * 1024)) or "0")
+# Bump when extraction output changes so stale parses are not served.
+UPLOAD_CACHE_FORMAT = 1
+
+_CACHED_FIELDS = ("columns", "rows", "source", "notes", "confidence_stats")
+_evict_lock = threading.Lock()
+
+
+def upload_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _entry_path(digest: str) -> Path:
+    return UPLOAD_CACHE_DIR / f"{digest}.json"
+
+
+def load_cached_upload(digest: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cached extraction for an upload digest, or None. A hit
+    refreshes the entry's mtime, which is what eviction orders by.
+    """
+    if UPLOAD_CACHE_MAX_BYTES <= 0:
+        return None
+    path = _entry_path(digest)
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        path.unlink(missing_ok=True)
+        return None
+    if not isinstance(payload, dict) or payload.get("format") != UPLOAD_CACHE_FORMAT:
+        path.unlink(missing_ok=True)
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return {field: payload.get(field) for field in _CACHED_FIELDS}
+
+
+def store_cached_upload(digest: str, result: Dict[str, Any]) -> None:
+    if UPLOAD_CACHE_MAX_BYTES <= 0:
+        return
+    payload = {field: result.get(field) for field in _CACHED_FIELDS}
+    payload["format"] = UPLOAD_CACHE_FORMAT
+    UPLOAD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = UPLOAD_CACHE_DIR / f".{digest}.{uuid.uuid4().hex}.tmp"
+    try:
+        tmp.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(tmp, _entry_path(digest))
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        return
+    _evict()
+
+
+def _evict() -> None:
+    """
+    Drops least recently used entries until the cache fits its size budget.
+    """
+    with _evict_lock:
+        entries = []
+        total = 0
+        for path in UPLOAD_CACHE_DIR.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total += stat.st_size
+        if total <= UPLOAD_CACHE_MAX_BYTES:
+            return
+        entries.sort(key=lambda item: item[0])
+        for _, size, path in entries:
+            if total <= UPLOAD_CACHE_MAX_BYTES:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def clear_upload_cache() -> None:
+    for path in UPLOAD_CACHE_DIR.glob("*.json"):
+        path.unlink(missing_ok=True)
@@ -1,17 +1,28 @@
 # RAG Logic (ChromaDB setup)
 
+import bisect
+import functools
+import hashlib
+import json
 import math
+import multiprocessing
 import os
+import queue
 import re
+import threading
+import time
 import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from html import unescape
-from typing import Iterable, Optional, List, Dict
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, List, Dict, Tuple
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 from dotenv import load_dotenv
-from pypdf import PdfReader
-from openai import OpenAI
-from qdrant_client import QdrantClient
-from qdrant_client.http import models as qmodels
+
+from app.data.bm25_index import BM25Index, exact_terms, reciprocal_rank_fusion
+from app.data.chunking import CHUNKER_VERSION, best_excerpt, chunk_document
 
 # PATH CONFIGURATION
 load_dotenv()
@@ -20,6 +31,9 @@ os.environ.setdefault("HF_HUB_CONNECT_TIMEOUT", "30")
 
 DOCS_DIR = os.path.join(os.path.dirname(__file__), "documents")
 DB_PATH = os.path.join(os.path.dirname(__file__), "chroma_db_store")
+MANIFEST_VERSION = 1
+# Bumped when chunk ids change scheme; the next ingest re-keys every document.
+CHUNK_ID_VERSION = 2
 DEFAULT_COLLECTION = "consumer_laws"
 DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
@@ -44,6 +58,28 @@ QDRANT_COLLECTION = _read_env("QDRANT_COLLECTION", DEFAULT_COLLECTION) or DEFAUL
 QDRANT_TIMEOUT_SECONDS = int(_read_env("QDRANT_TIMEOUT_SECONDS", "60") or "60")
 EMBEDDING_BATCH_SIZE = int(_read_env("EMBEDDING_BATCH_SIZE", "32") or "32")
 QDRANT_UPSERT_BATCH_SIZE = int(_read_env("QDRANT_UPSERT_BATCH_SIZE", "64") or "64")
+VECTOR_DB_STATS_TTL_SECONDS = float(_read_env("VECTOR_DB_STATS_TTL_SECONDS", "30") or "30")
+# Chunk size in tokens; all-MiniLM-L6-v2 only reads the first 256 word pieces of a text.
+INGEST_CHUNK_TOKENS = int(_read_env("INGEST_CHUNK_TOKENS", "200" if EMBEDDING_PROVIDER == "local" else "400") or "400")
+INGEST_CHUNK_OVERLAP_TOKENS = int(_read_env("INGEST_CHUNK_OVERLAP_TOKENS", "40") or "40")
+# Length of the most query-relevant excerpt search_laws returns from each hit.
+SEARCH_EXCERPT_CHARS = int(_read_env("SEARCH_EXCERPT_CHARS", "700") or "700")
+# Hybrid retrieval: a BM25 index per collection, stored next to chroma_db_store, fused with
+# the top HYBRID_CANDIDATES dense results by reciprocal rank.
+BM25_INDEX_DIR = _read_env("BM25_INDEX_DIR") or os.path.join(os.path.dirname(__file__), "bm25_index")
+HYBRID_SEARCH_ENABLED = (_read_env("HYBRID_SEARCH_ENABLED", "1") or "1").lower() not in {"0", "false", "no"}
+HYBRID_CANDIDATES = int(_read_env("HYBRID_CANDIDATES", "20") or "20")
+HYBRID_RRF_K = int(_read_env("HYBRID_RRF_K", "60") or "60")
+# Ingestion pipeline: extraction processes, concurrent embedding requests (OpenAI only; a local
+# model runs one batch at a time), parallel upserts, and the cap on batches held in memory.
+INGEST_EXTRACT_WORKERS = int(_read_env("INGEST_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))) or "1")
+INGEST_EMBED_CONCURRENCY = int(_read_env("INGEST_EMBED_CONCURRENCY", "4") or "4")
+INGEST_UPSERT_CONCURRENCY = int(_read_env("INGEST_UPSERT_CONCURRENCY", "4") or "4")
+INGEST_MAX_INFLIGHT_BATCHES = int(_read_env("INGEST_MAX_INFLIGHT_BATCHES", "16") or "16")
+# Spacing for OpenAI embedding requests, shared by ingestion and queries; 0 disables.
+EMBEDDING_REQUESTS_PER_MINUTE = float(_read_env("EMBEDDING_REQUESTS_PER_MINUTE", "3000") or "0")
+# Content hashes of what has been indexed, per provider/collection.
+INGEST_MANIFEST_PATH = _read_env("INGEST_MANIFEST_PATH") or os.path.join(os.path.dirname(__file__), "ingest_manifest.json")
 
 
 def _infer_metadata_from_filename(file_name: str):
@@ -84,24 +120,107 @@ def _is_pdf(file_path: str) -> bool:
 def _strip_html(raw_text: str) -> str:
     # Remove script/style blocks first.
     cleaned = re.sub(r"(?is)<(script|style).*?>.*?</\1>", " ", raw_text)
+    # Block-level tags become paragraph breaks so the chunker can see the structure.
+    cleaned = re.sub(r"(?i)<br\s*/?>", "\n", cleaned)
+    cleaned = re.sub(
+        r"(?i)</?(?:p|div|h[1-6]|li|ul|ol|tr|table|section|article|blockquote|pre|header|footer|dd|dt)\b[^>]*>",
+        "\n\n",
+        cleaned,
+    )
     # Remove all remaining tags.
     cleaned = re.sub(r"(?is)<[^>]+>", " ", cleaned)
     cleaned = unescape(cleaned)
-    cleaned = re.sub(r"\s+", " ", cleaned)
+    cleaned = re.sub(r"[^\S\n]+", " ", cleaned)
+    cleaned = re.sub(r" ?\n ?", "\n", cleaned)
+    cleaned = re.sub(r"\n{3,}", "\n\n", cleaned)
     return cleaned.strip()
 
 
-def _chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> Iterable[str]:
-    if not text:
-        return []
+def _file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunk_ids(file_name: str, texts: List[str]) -> List[str]:
+    # Ids come from the chunk's text, not its position, so an edit near the top
+    # of a document leaves the ids of everything after it alone. Repeats of an
+    # identical chunk get a counter.
+    seen: Dict[str, int] = {}
+    ids = []
+    for text in texts:
+        digest = hashlib.sha1(f"{file_name}\0{text}".encode("utf-8")).hexdigest()[:16]
+        count = seen.get(digest, 0)
+        seen[digest] = count + 1
+        ids.append(f"{file_name}_chunk_{digest}_{count}" if count else f"{file_name}_chunk_{digest}")
+    return ids
+
+
+def _chunk_hash(text: str, metadata: Dict) -> str:
+    # Metadata is part of the hash so a re-tagged chunk is re-upserted too.
+    payload = json.dumps({"text": text, "metadata": _clean_metadata(metadata)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _load_manifest() -> Dict:
+    try:
+        with open(INGEST_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = None
+    except (OSError, ValueError) as exc:
+        print(f"Ignoring unreadable ingest manifest {INGEST_MANIFEST_PATH}: {exc}")
+        manifest = None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        manifest = {"version": MANIFEST_VERSION, "indexes": {}}
+    return manifest
+
+
+def _save_manifest(manifest: Dict) -> None:
+    os.makedirs(os.path.dirname(INGEST_MANIFEST_PATH) or ".", exist_ok=True)
+    tmp_path = f"{INGEST_MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, INGEST_MANIFEST_PATH)
+
+
+def _extract_document(docs_dir: str, file_name: str) -> List[tuple]:
+    """
+    (chunk_id, text, metadata) for every chunk of one document. Top-level so
+    ingestion can run it in worker processes.
+    """
+    file_path = os.path.join(docs_dir, file_name)
+    base_meta = _infer_metadata_from_filename(file_name)
+    # Start offset of each PDF page in the joined text.
+    page_starts: List[int] = []
+    if _is_pdf(file_path):
+        from pypdf import PdfReader
+
+        reader = PdfReader(file_path)
+        parts = []
+        length = 0
+        for page in reader.pages:
+            page_text = (page.extract_text() or "").strip()
+            page_starts.append(length)
+            parts.append(page_text)
+            length += len(page_text) + 2
+        text = "\n\n".join(parts)
+    else:
+        with open(file_path, "rb") as f:
+            raw = f.read().decode("utf-8", errors="ignore")
+        text = _strip_html(raw)
+
+    pieces = chunk_document(text, INGEST_CHUNK_TOKENS, INGEST_CHUNK_OVERLAP_TOKENS)
     chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        chunks.append(text[start:end])
-        if end >= len(text):
-            break
-        start = max(0, end - overlap)
+    for chunk_id, chunk in zip(_chunk_ids(file_name, [piece.text for piece in pieces]), pieces):
+        meta: Dict[str, object] = {"source": file_name, "start": chunk.start, "end": chunk.end, **base_meta}
+        if page_starts:
+            meta["page"] = bisect.bisect_right(page_starts, chunk.start) - 1
+        if chunk.section:
+            meta["section"] = chunk.section[:200]
+        chunks.append((chunk_id, chunk.text, meta))
     return chunks
 
 
@@ -160,6 +279,20 @@ def _load_sentence_transformer(model_name: str):
     return SentenceTransformer(model_name)
 
 
+def _load_qdrant():
+    # Imported on first use; qdrant_client alone adds about half a second to app startup.
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models as qmodels
+
+    return QdrantClient, qmodels
+
+
+def _openai_client(**kwargs):
+    from openai import OpenAI
+
+    return OpenAI(**kwargs)
+
+
 def _load_chromadb():
     try:
         import chromadb
@@ -180,13 +313,154 @@ def _l2_normalize(vectors: List[List[float]]) -> List[List[float]]:
     return normalized
 
 
+def _format_hit(doc: str, meta: Dict, query: str) -> str:
+    # The excerpt is the part of the chunk that best matches the query, with its
+    # character range in the source document when the chunk recorded one.
+    start, end = best_excerpt(doc, query, SEARCH_EXCERPT_CHARS)
+    excerpt = doc[start:end]
+    if start > 0:
+        excerpt = "..." + excerpt
+    if end < len(doc):
+        excerpt += "..."
+    lines = ["---", f"SOURCE: {meta.get('source', 'unknown')}", f"PAGE: {meta.get('page', '?')}"]
+    if meta.get("section"):
+        lines.append(f"SECTION: {meta['section']}")
+    if isinstance(meta.get("start"), int):
+        lines.append(f"CHARS: {meta['start'] + start}-{meta['start'] + end}")
+    lines.append(f"MERCHANT: {meta.get('merchant')}")
+    lines.append(f"EXCERPT: {excerpt}")
+    return "\n".join(lines) + "\n---\n"
+
+
+class _RateLimiter:
+    """
+    Spaces calls evenly at `per_minute` across threads; <= 0 disables.
+    """
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+_embedding_rate_limiter = _RateLimiter(EMBEDDING_REQUESTS_PER_MINUTE)
+
+
+class _IngestPipeline:
+    """
+    Embeds and upserts chunk batches on background threads. Embedding batches
+    run concurrently and each batch's upsert is queued as soon as its vectors
+    arrive, so the stages overlap; at most INGEST_MAX_INFLIGHT_BATCHES batches
+    are held at once. Files whose batches have all landed come back from
+    finished() so the caller can record them.
+    """
+
+    def __init__(self, kb: "LegalKnowledgeBase"):
+        self.kb = kb
+        embed_workers = INGEST_EMBED_CONCURRENCY if kb.embedding_provider == "openai" else 1
+        # Chroma's local store takes one writer at a time.
+        upsert_workers = INGEST_UPSERT_CONCURRENCY if kb.provider == "qdrant" else 1
+        self._embed_pool = ThreadPoolExecutor(max_workers=max(embed_workers, 1), thread_name_prefix="ingest-embed")
+        self._upsert_pool = ThreadPoolExecutor(max_workers=max(upsert_workers, 1), thread_name_prefix="ingest-upsert")
+        self._slots = threading.BoundedSemaphore(max(INGEST_MAX_INFLIGHT_BATCHES, 1))
+        self._lock = threading.Lock()
+        self._remaining: Dict[str, int] = {}
+        self._done: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._errors: List[BaseException] = []
+
+    def submit(self, file_name: str, chunks: List[tuple]) -> None:
+        batches = list(_batch_items(chunks, EMBEDDING_BATCH_SIZE))
+        with self._lock:
+            if not batches:
+                self._done.put(file_name)
+                return
+            self._remaining[file_name] = len(batches)
+        for batch in batches:
+            # Blocks while too many batches are in flight; upserts keep draining meanwhile.
+            while not self._slots.acquire(timeout=0.5):
+                self._raise_errors()
+            self._raise_errors()
+            future = self._embed_pool.submit(self.kb._embed_texts, [text for _, text, _ in batch])
+            future.add_done_callback(functools.partial(self._embedded, file_name, batch))
+
+    def _embedded(self, file_name: str, batch: List[tuple], future: Future) -> None:
+        try:
+            upsert = self._upsert_pool.submit(self.kb._write_chunks, batch, future.result())
+        except BaseException as exc:
+            self._fail(exc)
+            return
+        upsert.add_done_callback(functools.partial(self._upserted, file_name))
+
+    def _upserted(self, file_name: str, future: Future) -> None:
+        try:
+            future.result()
+        except BaseException as exc:
+            self._fail(exc)
+            return
+        self._slots.release()
+        with self._lock:
+            self._remaining[file_name] -= 1
+            if not self._remaining[file_name]:
+                # Queued before the entry goes away so finished(wait=True) can't miss it.
+                self._done.put(file_name)
+                del self._remaining[file_name]
+
+    def _fail(self, error: BaseException) -> None:
+        with self._lock:
+            self._errors.append(error)
+        self._slots.release()
+        self._done.put(None)
+
+    def _raise_errors(self) -> None:
+        with self._lock:
+            if self._errors:
+                raise self._errors[0]
+
+    def finished(self, wait: bool = False) -> Iterator[str]:
+        """
+        Files whose batches have all been upserted; with `wait`, blocks until
+        every submitted file is done.
+        """
+        while True:
+            self._raise_errors()
+            with self._lock:
+                busy = bool(self._remaining)
+            try:
+                file_name = self._done.get(block=wait and busy, timeout=0.5 if wait and busy else None)
+            except queue.Empty:
+                if wait and busy:
+                    continue
+                return
+            if file_name is not None:
+                yield file_name
+
+    def close(self) -> None:
+        failed = bool(self._errors)
+        self._embed_pool.shutdown(wait=True, cancel_futures=failed)
+        self._upsert_pool.shutdown(wait=True, cancel_futures=failed)
+
+
 class LegalKnowledgeBase:
     def __init__(self):
         self.provider = VECTOR_DB_PROVIDER
+        self._stats_lock = threading.Lock()
+        self._stats_cache: Optional[tuple] = None
+        self._lexical: Optional[BM25Index] = None
+        self._lexical_lock = threading.Lock()
         self.embedding_provider = EMBEDDING_PROVIDER
         self.embedding_model = os.environ.get("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
         self.embedding_dim: Optional[int] = None
-        self.openai_client: Optional[OpenAI] = None
+        self.openai_client: Optional["OpenAI"] = None
 
         if self.provider == "qdrant":
             if not QDRANT_URL:
@@ -197,11 +471,12 @@ class LegalKnowledgeBase:
                     raise ValueError("OPENAI_API_KEY is required when EMBEDDING_PROVIDER=openai")
                 self.embedding_model = _read_env("OPENAI_EMBEDDING_MODEL", OPENAI_EMBEDDING_MODEL) or OPENAI_EMBEDDING_MODEL
                 self.embedding_dim = int(_read_env("OPENAI_EMBEDDING_DIM", str(OPENAI_EMBEDDING_DIM)) or str(OPENAI_EMBEDDING_DIM))
-                self.openai_client = OpenAI(api_key=api_key)
+                self.openai_client = _openai_client(api_key=api_key)
                 self.embedder = None
             else:
                 self.embedder = _load_sentence_transformer(self.embedding_model)
                 self.embedding_dim = self.embedder.get_sentence_embedding_dimension()
+            QdrantClient, _ = _load_qdrant()
             self.qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=QDRANT_TIMEOUT_SECONDS)
             self.collection_name = QDRANT_COLLECTION
             self._ensure_qdrant_collection()
@@ -241,6 +516,7 @@ class LegalKnowledgeBase:
             vector_size = self.embedder.get_sentence_embedding_dimension()
         if vector_size is None:
             raise ValueError("Unable to determine embedding dimension for Qdrant collection.")
+        _, qmodels = _load_qdrant()
         if self.qdrant.collection_exists(self.collection_name):
             info = self.qdrant.get_collection(self.collection_name)
             existing_size = _extract_qdrant_vector_size(info)
@@ -265,12 +541,15 @@ class LegalKnowledgeBase:
             ),
         )
 
-    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def _compute_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.provider != "qdrant":
+            return _l2_normalize([list(map(float, vec)) for vec in self.embedding_fn(texts)])
         if self.embedding_provider == "openai":
             if not self.openai_client:
-                self.openai_client = OpenAI()
+                self.openai_client = _openai_client()
             embeddings: List[List[float]] = []
             for batch in _batch_items(texts, EMBEDDING_BATCH_SIZE):
+                _embedding_rate_limiter.acquire()
                 response = self.openai_client.embeddings.create(
                     model=self.embedding_model,
                     input=batch,
@@ -285,99 +564,353 @@ class LegalKnowledgeBase:
             batch_size=EMBEDDING_BATCH_SIZE,
         ).tolist()
 
+    def _embed_texts(self, texts: List[str], hot: bool = False) -> List[List[float]]:
+        """
+        Unit-length embeddings, served from the embedding cache when possible;
+        both vector DB providers share its entries.
+        """
+        if not texts:
+            return []
+        # Imported here so its settings are read after load_dotenv().
+        from app.data.embedding_cache import get_embedding_cache
+
+        cache = get_embedding_cache()
+        if cache is None:
+            return self._compute_embeddings(texts)
+        # Chroma's embedding functions use the model's native size, which we don't know up front.
+        dim = self.embedding_dim if self.provider == "qdrant" else None
+        return cache.embed(self.embedding_provider, self.embedding_model, dim, texts, self._compute_embeddings, hot=hot)
+
     def _embed_query(self, query: str) -> List[float]:
-        return self._embed_texts([query])[0]
+        return self._embed_texts([query], hot=True)[0]
 
-    def ingest_documents(self):
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
         """
-        Reads all PDFs in app/data/documents/ and stores them in the vector DB.
-        Run this ONCE or whenever new documents are added.
+        Unit-length embeddings from the knowledge base's configured embedder,
+        whichever vector DB provider is active.
+        """
+        return self._embed_texts(texts, hot=True)
+
+    def _index_key(self) -> str:
+        return f"{self.provider}:{self.collection_name}"
+
+    def _embedding_signature(self) -> str:
+        # Chunking settings are included: different windows mean different texts to embed.
+        return (
+            f"{self.embedding_provider}:{self.embedding_model}:{self.embedding_dim or ''}"
+            f":chunks-v{CHUNKER_VERSION}-{INGEST_CHUNK_TOKENS}-{INGEST_CHUNK_OVERLAP_TOKENS}"
+            f":ids-v{CHUNK_ID_VERSION}"
+        )
+
+    def _iter_extracted(self, file_names: List[str]) -> Iterator[Tuple[str, Optional[List[tuple]], Optional[BaseException]]]:
+        """
+        (file_name, chunks, error) as each document finishes extracting, in a
+        process pool when there's more than one.
+        """
+        workers = min(INGEST_EXTRACT_WORKERS, len(file_names))
+        if workers <= 1:
+            for file_name in file_names:
+                try:
+                    yield file_name, _extract_document(DOCS_DIR, file_name), None
+                except Exception as exc:
+                    yield file_name, None, exc
+            return
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            futures = {pool.submit(_extract_document, DOCS_DIR, file_name): file_name for file_name in file_names}
+            for future in as_completed(futures):
+                error = future.exception()
+                yield futures[future], None if error else future.result(), error
+
+    def _write_chunks(self, chunks: List[tuple], embeddings: List[List[float]]) -> None:
+        ids = [chunk_id for chunk_id, _, _ in chunks]
+        text_chunks = [text for _, text, _ in chunks]
+        metadatas = [meta for _, _, meta in chunks]
+        if self.provider == "qdrant":
+            payloads = []
+            for meta, text in zip(metadatas, text_chunks):
+                payload = _clean_metadata(meta)
+                payload["text"] = text
+                payloads.append(payload)
+
+            _, qmodels = _load_qdrant()
+            points = [
+                qmodels.PointStruct(id=_to_point_id(doc_id), vector=vector, payload=payload)
+                for doc_id, vector, payload in zip(ids, embeddings, payloads)
+            ]
+            for batch in _batch_items(points, QDRANT_UPSERT_BATCH_SIZE):
+                self.qdrant.upsert(collection_name=self.collection_name, points=batch)
+        else:
+            self.collection.upsert(
+                documents=text_chunks,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=ids,
+            )
+
+    def _update_chunk_metadata(self, chunks: List[tuple]) -> None:
+        """
+        Rewrites the stored metadata of chunks whose text (and so vector) is
+        unchanged but whose position or tags moved, without re-embedding.
+        """
+        if not chunks:
+            return
+        if self.provider == "qdrant":
+            _, qmodels = _load_qdrant()
+            operations = []
+            for chunk_id, text, meta in chunks:
+                payload = _clean_metadata(meta)
+                payload["text"] = text
+                operations.append(
+                    qmodels.OverwritePayloadOperation(
+                        overwrite_payload=qmodels.SetPayload(payload=payload, points=[_to_point_id(chunk_id)])
+                    )
+                )
+            for batch in _batch_items(operations, QDRANT_UPSERT_BATCH_SIZE):
+                self.qdrant.batch_update_points(collection_name=self.collection_name, update_operations=batch)
+        else:
+            self.collection.update(
+                ids=[chunk_id for chunk_id, _, _ in chunks],
+                metadatas=[meta for _, _, meta in chunks],
+            )
+
+    def _delete_chunks(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        if self.provider == "qdrant":
+            _, qmodels = _load_qdrant()
+            for batch in _batch_items(ids, QDRANT_UPSERT_BATCH_SIZE):
+                self.qdrant.delete(
+                    collection_name=self.collection_name,
+                    points_selector=qmodels.PointIdsList(points=[_to_point_id(doc_id) for doc_id in batch]),
+                )
+        else:
+            self.collection.delete(ids=ids)
+
+    def _clear_collection(self) -> None:
+        """
+        Drops every point in the active collection, keeping the collection itself
+        (and, for Qdrant, its vector config).
+        """
+        if self.provider == "qdrant":
+            _, qmodels = _load_qdrant()
+            # An empty filter matches every point.
+            self.qdrant.delete(
+                collection_name=self.collection_name,
+                points_selector=qmodels.FilterSelector(filter=qmodels.Filter()),
+            )
+        else:
+            self.client.delete_collection(name=self.collection_name)
+            self.collection = self.client.get_or_create_collection(
+                name=self.collection_name,
+                embedding_function=self.embedding_fn,
+            )
+        with self._stats_lock:
+            self._stats_cache = None
+
+    def ingest_documents(self, dry_run: bool = False, full: bool = False) -> Dict[str, int]:
+        """
+        Syncs the vector DB with the files in app/data/documents/.
+
+        Files whose bytes match the ingest manifest are skipped without being
+        read. Chunk ids derive from chunk text, so for a changed file only chunks
+        with new text are embedded; chunks that merely moved get their metadata
+        rewritten, and chunks of deleted files (or that a file no longer
+        produces) are removed.
+        `dry_run` reports the plan without touching the DB or the manifest;
+        `full` ignores the manifest and re-indexes everything.
+
+        Extraction, embedding and upserts are pipelined (see _IngestPipeline),
+        so a run takes about as long as its slowest stage.
         """
         print(f"Vector DB provider: {self.provider} (collection={self.collection_name})")
+        summary = {
+            "files_unchanged": 0,
+            "files_changed": 0,
+            "files_removed": 0,
+            "chunks_embedded": 0,
+            "chunks_moved": 0,
+            "chunks_unchanged": 0,
+            "chunks_deleted": 0,
+        }
         if not os.path.exists(DOCS_DIR):
+            if dry_run:
+                print(f"{DOCS_DIR} does not exist.")
+                return summary
             os.makedirs(DOCS_DIR)
             print(f"Created directory {DOCS_DIR}. Please put PDF files there.")
-            return
+            return summary
 
-        print(f"Scanning {DOCS_DIR} for PDFs...")
-        total_chunks = 0
+        manifest = _load_manifest()
+        entry = manifest["indexes"].get(self._index_key()) or {}
+        # What the DB holds according to the last run; used to find chunks to delete.
+        previous_files: Dict[str, Dict] = entry.get("files", {})
+        trusted = previous_files
+        if full:
+            trusted = {}
+        elif previous_files and entry.get("embedding") != self._embedding_signature():
+            print("Embedding or chunking settings changed since the last ingest; re-indexing everything.")
+            trusted = {}
+        elif previous_files and not self.get_collection_stats()["vectors_count"]:
+            # The collection was wiped or recreated; the manifest no longer describes it.
+            print("Collection is empty; re-indexing everything.")
+            trusted = {}
+        if not previous_files:
+            # No manifest entry, so nothing records which points the collection
+            # holds (e.g. ids from before the manifest existed). Those points can't
+            # be diffed or cleaned up per chunk, so start from an empty collection.
+            untracked = self.get_collection_stats()["vectors_count"]
+            if untracked:
+                print(f"{'Would remove' if dry_run else 'Removing'} {untracked} vectors not recorded in the ingest manifest.")
+                summary["chunks_deleted"] += untracked
+                if not dry_run:
+                    self._clear_collection()
+        # Untrusted entries keep their chunk ids (for cleanup) but never match a file hash.
+        index = {
+            "embedding": self._embedding_signature(),
+            "files": {
+                name: known if trusted else {"sha256": None, "chunks": known.get("chunks", {})}
+                for name, known in previous_files.items()
+            },
+        }
 
-        files = [
+        print(f"Scanning {DOCS_DIR} for documents...")
+        files = sorted(
             f
             for f in os.listdir(DOCS_DIR)
             if f.lower().endswith((".pdf", ".html", ".txt"))
-        ]
-        if not files:
-            print("No PDFs found.")
-            return
+        )
+        if not files and not previous_files:
+            print("No documents found.")
+            return summary
+
+        def save() -> None:
+            if not dry_run:
+                manifest["indexes"][self._index_key()] = index
+                _save_manifest(manifest)
 
+        lexical = self._lexical_index()
+        to_extract: Dict[str, Tuple[str, Optional[Dict]]] = {}
         for file_name in files:
-            file_path = os.path.join(DOCS_DIR, file_name)
-            print(f"Processing {file_name}...")
+            file_hash = _file_sha256(os.path.join(DOCS_DIR, file_name))
+            known = trusted.get(file_name)
+            if known is not None and known.get("sha256") == file_hash:
+                if lexical is None or lexical.has_file(file_name, file_hash):
+                    summary["files_unchanged"] += 1
+                    summary["chunks_unchanged"] += len(known.get("chunks", {}))
+                    continue
+                # Vectors are current but the BM25 index lacks the file: extract it again, embed nothing.
+            to_extract[file_name] = (file_hash, known)
 
-            text_chunks = []
-            metadatas = []
-            ids = []
-            base_meta = _infer_metadata_from_filename(file_name)
+        # file_name -> (sha256, chunks, chunk hashes, moved chunks, stale chunk ids) until all its batches have landed.
+        landing: Dict[str, Tuple[str, List[tuple], Dict[str, str], List[tuple], List[str]]] = {}
 
-            try:
-                if _is_pdf(file_path):
-                    reader = PdfReader(file_path)
-                    # Simple chunking by page.
-                    for i, page in enumerate(reader.pages):
-                        text = page.extract_text()
-                        if not text:
-                            continue
-                        chunk_id = f"{file_name}_page_{i}"
-                        text_chunks.append(text)
-                        metadatas.append({"source": file_name, "page": i, **base_meta})
-                        ids.append(chunk_id)
+        def finish(file_name: str) -> None:
+            file_hash, chunks, new_chunks, moved, stale = landing.pop(file_name)
+            self._update_chunk_metadata(moved)
+            self._delete_chunks(stale)
+            if lexical is not None:
+                lexical.replace_file(file_name, file_hash, chunks)
+            index["files"][file_name] = {"sha256": file_hash, "chunks": new_chunks}
+            save()
+
+        pipeline = None if dry_run else _IngestPipeline(self)
+        try:
+            for file_name, chunks, error in self._iter_extracted(list(to_extract)):
+                if error is not None:
+                    print(f"Skipping {file_name} due to error: {error}")
+                    continue
+                file_hash, known = to_extract[file_name]
+                old_chunks = (known or {}).get("chunks", {})
+                new_chunks = {chunk_id: _chunk_hash(text, meta) for chunk_id, text, meta in chunks}
+                # New ids carry new text and need vectors; known ids with a new hash only moved.
+                changed = [chunk for chunk in chunks if chunk[0] not in old_chunks]
+                moved = [
+                    chunk
+                    for chunk in chunks
+                    if chunk[0] in old_chunks and old_chunks[chunk[0]] != new_chunks[chunk[0]]
+                ]
+                stale = sorted(set(previous_files.get(file_name, {}).get("chunks", {})) - set(new_chunks))
+                if known is not None and known.get("sha256") == file_hash:
+                    summary["files_unchanged"] += 1
+                    print(f"{'Would add' if dry_run else 'Adding'} {file_name} to the BM25 index")
                 else:
-                    with open(file_path, "rb") as f:
-                        raw = f.read().decode("utf-8", errors="ignore")
-                    text = _strip_html(raw)
-                    for i, chunk in enumerate(_chunk_text(text)):
-                        chunk_id = f"{file_name}_chunk_{i}"
-                        text_chunks.append(chunk)
-                        metadatas.append({"source": file_name, "page": i, **base_meta})
-                        ids.append(chunk_id)
-            except Exception as e:
-                print(f"Skipping {file_name} due to error: {e}")
-                continue
+                    summary["files_changed"] += 1
+                    verb = "Would index" if dry_run else "Indexing"
+                    print(
+                        f"{verb} {len(changed)}/{len(chunks)} chunks from {file_name}, "
+                        f"moving {len(moved)}, removing {len(stale)} stale"
+                    )
+                summary["chunks_embedded"] += len(changed)
+                summary["chunks_moved"] += len(moved)
+                summary["chunks_unchanged"] += len(chunks) - len(changed) - len(moved)
+                summary["chunks_deleted"] += len(stale)
+                if pipeline is None:
+                    continue
 
-            if not text_chunks:
+                landing[file_name] = (file_hash, chunks, new_chunks, moved, stale)
+                pipeline.submit(file_name, changed)
+                for done in pipeline.finished():
+                    finish(done)
+            if pipeline is not None:
+                for done in pipeline.finished(wait=True):
+                    finish(done)
+        finally:
+            if pipeline is not None:
+                pipeline.close()
+
+        for file_name in sorted(set(previous_files) - set(files)):
+            ids = sorted(previous_files[file_name].get("chunks", {}))
+            summary["files_removed"] += 1
+            summary["chunks_deleted"] += len(ids)
+            print(f"{'Would remove' if dry_run else 'Removed'} {len(ids)} chunks of deleted file {file_name}")
+            if dry_run:
                 continue
+            self._delete_chunks(ids)
+            index["files"].pop(file_name, None)
+            save()
+        save()
+        if lexical is not None and not dry_run:
+            for file_name in set(lexical.files) - set(files):
+                lexical.remove_file(file_name)
+            lexical.save()
 
-            if self.provider == "qdrant":
-                payloads = []
-                for meta, text in zip(metadatas, text_chunks):
-                    payload = _clean_metadata(meta)
-                    payload["text"] = text
-                    payloads.append(payload)
-
-                embeddings = self._embed_texts(text_chunks)
-                points = [
-                    qmodels.PointStruct(id=_to_point_id(doc_id), vector=vector, payload=payload)
-                    for doc_id, vector, payload in zip(ids, embeddings, payloads)
-                ]
-                for batch in _batch_items(points, QDRANT_UPSERT_BATCH_SIZE):
-                    self.qdrant.upsert(collection_name=self.collection_name, points=batch)
-                total_chunks += len(text_chunks)
-                print(f"Indexed {len(text_chunks)} chunks from {file_name} into Qdrant")
-            else:
-                self.collection.upsert(documents=text_chunks, metadatas=metadatas, ids=ids)
-                total_chunks += len(text_chunks)
-                print(f"Indexed {len(text_chunks)} chunks from {file_name}")
+        with self._stats_lock:
+            self._stats_cache = None
+        print(
+            f"{'Dry run: ' if dry_run else ''}{summary['chunks_embedded']} chunks to embed, "
+            f"{summary['chunks_moved']} moved, {summary['chunks_unchanged']} unchanged, "
+            f"{summary['chunks_deleted']} deleted "
+            f"({summary['files_changed']} changed, {summary['files_unchanged']} unchanged, "
+            f"{summary['files_removed']} removed files)."
+        )
+        return summary
 
-        if total_chunks:
-            print(f"Indexed {total_chunks} total chunks.")
+    def _lexical_index(self) -> Optional[BM25Index]:
+        """
+        The collection's BM25 index, reloaded when another process (an ingest
+        run) has rewritten it; None when hybrid search is off.
+        """
+        if not HYBRID_SEARCH_ENABLED:
+            return None
+        path = os.path.join(BM25_INDEX_DIR, f"{_sanitize_collection_suffix(self._index_key())}.json")
+        with self._lexical_lock:
+            try:
+                mtime: Optional[float] = os.path.getmtime(path)
+            except OSError:
+                mtime = None
+            if self._lexical is None or (mtime is not None and mtime != self._lexical.mtime):
+                self._lexical = BM25Index.load(path)
+            return self._lexical
 
-    def search_laws(self, query: str, n_results: int = 2, merchant: Optional[str] = None):
+    def _dense_search(self, query: str, limit: int, merchant: Optional[str] = None) -> List[Tuple[str, str, Dict]]:
         """
-        Retrieves the most relevant legal text for a given query from the DB.
-        If merchant is provided and present in metadata, retrieval is filtered.
+        (point id, text, metadata) of the nearest chunks in the vector DB.
         """
         if self.provider == "qdrant":
+            _, qmodels = _load_qdrant()
             query_vector = self._embed_query(query)
             search_filter = None
             if merchant:
@@ -392,57 +925,65 @@ class LegalKnowledgeBase:
             results = self.qdrant.query_points(
                 collection_name=self.collection_name,
                 query=query_vector,
-                limit=n_results,
+                limit=limit,
                 query_filter=search_filter,
                 with_payload=True,
             )
             points = getattr(results, "points", None) or getattr(results, "result", None) or []
-            if not points:
-                return "No specific legal documents found."
-
-            context = ""
+            hits = []
             for hit in points:
                 payload = getattr(hit, "payload", None) or {}
-                doc = payload.get("text", "")
-                source = payload.get("source", "unknown")
-                page = payload.get("page", "?")
-                merchant_meta = payload.get("merchant")
-                context += (
-                    "---\n"
-                    f"SOURCE: {source}\n"
-                    f"PAGE: {page}\n"
-                    f"MERCHANT: {merchant_meta}\n"
-                    f"EXCERPT: {doc[:500]}\n"
-                    "---\n"
-                )
-            return context
+                hits.append((str(hit.id), payload.get("text", ""), payload))
+            return hits
 
         where = {"merchant": merchant} if merchant else None
         results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results,
+            query_embeddings=[self._embed_query(query)],
+            n_results=limit,
             where=where,
         )
-
         if not results.get("documents") or not results["documents"][0]:
-            return "No specific legal documents found."
+            return []
+        return [
+            (_to_point_id(chunk_id), doc, meta or {})
+            for chunk_id, doc, meta in zip(results["ids"][0], results["documents"][0], results["metadatas"][0])
+        ]
 
-        context = ""
-        for i, doc in enumerate(results["documents"][0]):
-            meta = results["metadatas"][0][i]
-            source = meta.get("source", "unknown")
-            page = meta.get("page", "?")
-            merchant_meta = meta.get("merchant")
-            context += (
-                "---\n"
-                f"SOURCE: {source}\n"
-                f"PAGE: {page}\n"
-                f"MERCHANT: {merchant_meta}\n"
-                f"EXCERPT: {doc[:500]}\n"
-                "---\n"
+    def search_laws(self, query: str, n_results: int = 2, merchant: Optional[str] = None):
+        """
+        Retrieves the most relevant legal text for a given query from the DB.
+        If merchant is provided and present in metadata, retrieval is filtered.
+
+        Dense results are fused with the local BM25 index by reciprocal rank.
+        Queries citing section numbers or quoted phrases are answered from the
+        BM25 index alone when enough chunks contain them verbatim.
+        """
+        lexical = self._lexical_index()
+        if lexical is None or not len(lexical):
+            hits = self._dense_search(query, n_results, merchant)
+        else:
+            required = exact_terms(query)
+            if required:
+                exact = lexical.search(query, n_results, merchant=merchant, require=required)
+                if len(exact) >= n_results:
+                    return "".join(_format_hit(hit.text, hit.metadata, query) for hit in exact)
+            candidates = max(n_results, HYBRID_CANDIDATES)
+            dense = self._dense_search(query, candidates, merchant)
+            # Point ids are uuid5(chunk_id) for both providers, so the two rankings share keys.
+            lexical_hits = [
+                (_to_point_id(hit.chunk_id), hit.text, hit.metadata)
+                for hit in lexical.search(query, candidates, merchant=merchant)
+            ]
+            by_key = {key: (key, text, meta) for key, text, meta in lexical_hits + dense}
+            fused = reciprocal_rank_fusion(
+                [[key for key, _, _ in dense], [key for key, _, _ in lexical_hits]],
+                HYBRID_RRF_K,
             )
+            hits = [by_key[key] for key in fused[:n_results]]
 
-        return context
+        if not hits:
+            return "No specific legal documents found."
+        return "".join(_format_hit(text, meta, query) for _, text, meta in hits)
 
     def get_collection_stats(self) -> Dict[str, int]:
         """
@@ -464,7 +1005,67 @@ class LegalKnowledgeBase:
         count = self.collection.count()
         return {"vectors_count": int(count)}
 
+    def cached_collection_stats(self, max_age: Optional[float] = None) -> Dict[str, int]:
+        """
+        get_collection_stats() reused for `max_age` seconds (VECTOR_DB_STATS_TTL_SECONDS),
+        so frequent health probes don't each hit the vector DB.
+        """
+        ttl = VECTOR_DB_STATS_TTL_SECONDS if max_age is None else max_age
+        with self._stats_lock:
+            cached = self._stats_cache
+            if cached is not None and time.monotonic() - cached[0] < ttl:
+                return dict(cached[1])
+        stats = self.get_collection_stats()
+        with self._stats_lock:
+            self._stats_cache = (time.monotonic(), stats)
+        return dict(stats)
+
+
+_kb_lock = threading.Lock()
+_kb: Optional[LegalKnowledgeBase] = None
+_kb_loaded = False
+_kb_error: Optional[str] = None
+
+
+def get_knowledge_base() -> Optional[LegalKnowledgeBase]:
+    """
+    The process-wide knowledge base, opened once (embedding model, DB
+    connection, collection checks) and shared by every caller. None when it
+    can't be opened; see knowledge_base_status().
+    """
+    global _kb, _kb_loaded, _kb_error
+    with _kb_lock:
+        if not _kb_loaded:
+            try:
+                _kb = LegalKnowledgeBase()
+            except Exception as exc:
+                _kb = None
+                _kb_error = str(exc)
+            _kb_loaded = True
+        return _kb
+
+
+def peek_knowledge_base() -> Optional[LegalKnowledgeBase]:
+    """
+    The shared knowledge base if it has already been opened; never opens it.
+    """
+    return _kb
+
+
+def knowledge_base_status() -> Dict[str, Optional[str]]:
+    if _kb is not None:
+        return {"status": "ready", "error": None}
+    if _kb_loaded:
+        return {"status": "unavailable", "error": _kb_error}
+    return {"status": "loading" if _kb_lock.locked() else "pending", "error": None}
+
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sync app/data/documents/ into the legal knowledge base.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be embedded or deleted.")
+    parser.add_argument("--full", action="store_true", help="Ignore the ingest manifest and re-index everything.")
+    args = parser.parse_args()
     kb = LegalKnowledgeBase()
-    kb.ingest_documents()
+    kb.ingest_documents(dry_run=args.dry_run, full=args.full)
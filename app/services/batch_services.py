@@ -0,0 +1,508 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.analysis.transaction_analyzer import analyze_transactions_rule_based
+from app.services.execution_services import CPU_WORKERS
+
+
+def _read_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, "") or default)
+    except ValueError:
+        return default
+
+
+DEFAULT_JOBS_DIR = Path(__file__).resolve().parents[1] / "data" / "batch_jobs"
+BATCH_JOBS_DIR = Path(os.environ.get("BATCH_JOBS_DIR") or DEFAULT_JOBS_DIR)
+# Sets analyzed, enriched and written out together; also the checkpoint granularity.
+BATCH_WINDOW_SIZE = _read_int("BATCH_WINDOW_SIZE", 500)
+BATCH_WORKERS = _read_int("BATCH_WORKERS", CPU_WORKERS)
+BATCH_RETRIEVAL_THREADS = _read_int("BATCH_RETRIEVAL_THREADS", 8)
+BATCH_LLM_CONCURRENCY = _read_int("BATCH_LLM_CONCURRENCY", 8)
+BATCH_POLL_SECONDS = float(os.environ.get("BATCH_POLL_SECONDS", "30") or "30")
+LLM_MODES = ("online", "provider")
+
+Progress = Callable[[Dict[str, Any]], None]
+
+
+@dataclass
+class BatchOptions:
+    retrieve: bool = False
+    draft_letters: bool = False
+    letters_per_set: int = 1
+    # "online": concurrent calls through the LLM gateway; "provider": the OpenAI Batch API.
+    llm_mode: str = "online"
+    workers: int = BATCH_WORKERS
+    window_size: int = BATCH_WINDOW_SIZE
+
+    def __post_init__(self) -> None:
+        if self.llm_mode not in LLM_MODES:
+            raise ValueError(f"llm_mode must be one of {', '.join(LLM_MODES)}")
+
+
+def iter_batch_input(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Transaction sets from a JSONL file, one per line:
+    {"id": ..., "transactions": [...]} or {"id": ..., "user_id": ..., "account_id": ...}
+    to analyze stored transactions. Lines without an id are numbered.
+    """
+    with open(path, "r", encoding="utf-8") as handle:
+        for line_no, line in enumerate(handle, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield {"id": f"line-{line_no}", "error": f"Invalid JSON: {exc}"}
+                continue
+            if not isinstance(record, dict):
+                yield {"id": f"line-{line_no}", "error": "Each line must be a JSON object."}
+                continue
+            record.setdefault("id", f"line-{line_no}")
+            record["id"] = str(record["id"])
+            yield record
+
+
+def analyze_set(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Deterministic stage for one set (runs in a worker process).
+    """
+    result: Dict[str, Any] = {"id": record["id"]}
+    for key in ("user_id", "account_id"):
+        if record.get(key):
+            result[key] = record[key]
+    if record.get("error"):
+        return {**result, "status": "error", "error": record["error"]}
+    try:
+        transactions = record.get("transactions")
+        if transactions is None:
+            from app.data.bank_transactions import load_transactions
+
+            transactions = load_transactions(record.get("user_id"), record.get("account_id")) or []
+        if not isinstance(transactions, list):
+            raise ValueError("transactions must be a list")
+        issues = analyze_transactions_rule_based(transactions)
+    except Exception as exc:
+        return {**result, "status": "error", "error": str(exc)}
+    return {**result, "status": "ok", "transaction_count": len(transactions), "issues": issues}
+
+
+def _retrieval_key(issue: Dict[str, Any]) -> Tuple[str, str]:
+    return (str(issue.get("merchant") or "").strip().lower(), str(issue.get("issue") or "").strip().lower())
+
+
+def _attach_evidence(results: List[Dict[str, Any]], kb: Any) -> None:
+    """
+    One search per distinct merchant/issue pair in the window; sweeps repeat
+    the same few findings across thousands of accounts.
+    """
+    from app.agent.graph import normalize_merchant
+
+    unique: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for result in results:
+        for issue in result.get("issues") or []:
+            unique.setdefault(_retrieval_key(issue), issue)
+
+    def search(issue: Dict[str, Any]) -> str:
+        query = f"{issue.get('merchant', '')} - {issue.get('issue', '')}".strip(" -")
+        try:
+            return kb.search_laws(query, merchant=normalize_merchant(issue.get("merchant"))) if query else ""
+        except Exception:
+            return ""
+
+    keys = list(unique)
+    with ThreadPoolExecutor(max_workers=max(BATCH_RETRIEVAL_THREADS, 1)) as pool:
+        evidence = dict(zip(keys, pool.map(search, [unique[key] for key in keys])))
+    for result in results:
+        for issue in result.get("issues") or []:
+            issue["evidence"] = evidence.get(_retrieval_key(issue), "")
+
+
+def _letter_requests(results: List[Dict[str, Any]], letters_per_set: int) -> Dict[str, List[Dict[str, str]]]:
+    from app.agent.graph import build_letter_messages
+
+    requests: Dict[str, List[Dict[str, str]]] = {}
+    for result in results:
+        for idx, issue in enumerate((result.get("issues") or [])[: max(letters_per_set, 0)]):
+            requests[f"{result['id']}:{idx}"] = build_letter_messages(issue, issue.get("evidence", ""))
+    return requests
+
+
+async def _draft_online(requests: Dict[str, List[Dict[str, str]]]) -> Dict[str, str]:
+    from openai import AsyncOpenAI
+
+    from app.agent.llm_gateway import LLM_GENERATION_TIMEOUT_SECONDS, chat_completion, client_timeout
+
+    # A client per run: httpx pools are bound to the event loop that created them.
+    client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0, timeout=client_timeout())
+    semaphore = asyncio.Semaphore(max(BATCH_LLM_CONCURRENCY, 1))
+
+    async def draft(messages: List[Dict[str, str]]) -> str:
+        async with semaphore:
+            try:
+                response = await chat_completion(
+                    client,
+                    "batch_letter",
+                    timeout=LLM_GENERATION_TIMEOUT_SECONDS,
+                    model="gpt-4o-mini",
+                    messages=messages,
+                )
+            except Exception:
+                return ""
+            return response.choices[0].message.content or ""
+
+    try:
+        keys = list(requests)
+        texts = await asyncio.gather(*(draft(requests[key]) for key in keys))
+        return dict(zip(keys, texts))
+    finally:
+        await client.close()
+
+
+def _draft_with_provider_batch(
+    requests: Dict[str, List[Dict[str, str]]],
+    checkpoint: "_Checkpoint",
+    window_key: str,
+) -> Dict[str, str]:
+    """
+    Drafts through the OpenAI Batch API (half the price, completes within 24h).
+    The batch id is checkpointed, so a resumed run polls the same batch.
+    """
+    from openai import OpenAI
+
+    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    batch_id = checkpoint.pending_batch(window_key)
+    if batch_id is None:
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {"model": "gpt-4o-mini", "messages": messages},
+                }
+            )
+            for custom_id, messages in requests.items()
+        ]
+        uploaded = client.files.create(file=("letters.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        batch_id = batch.id
+        checkpoint.set_pending_batch(window_key, batch_id)
+
+    batch = client.batches.retrieve(batch_id)
+    while batch.status not in {"completed", "failed", "expired", "cancelled"}:
+        time.sleep(BATCH_POLL_SECONDS)
+        batch = client.batches.retrieve(batch_id)
+
+    letters: Dict[str, str] = {}
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            try:
+                item = json.loads(line)
+                body = (item.get("response") or {}).get("body") or {}
+                letters[item["custom_id"]] = body["choices"][0]["message"]["content"] or ""
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+    return letters
+
+
+def _draft_letters(
+    requests: Dict[str, List[Dict[str, str]]],
+    options: BatchOptions,
+    checkpoint: "_Checkpoint",
+    window_key: str,
+) -> Dict[str, str]:
+    """
+    Drafts each distinct prompt once (accounts with the same finding and
+    evidence share a letter) and fans the text back out to every request.
+    """
+    groups: Dict[str, List[str]] = {}
+    unique: Dict[str, List[Dict[str, str]]] = {}
+    for custom_id, messages in requests.items():
+        key = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+        groups.setdefault(key, []).append(custom_id)
+        unique.setdefault(key, messages)
+    if options.llm_mode == "provider":
+        drafted = _draft_with_provider_batch(unique, checkpoint, window_key)
+    else:
+        drafted = asyncio.run(_draft_online(unique))
+    return {custom_id: drafted.get(key, "") for key, ids in groups.items() for custom_id in ids}
+
+
+class _Checkpoint:
+    """
+    `<output>.checkpoint.json`: the provider batch still in flight, if any.
+    Completed sets are recovered from the output file itself.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.state: Dict[str, Any] = {}
+        if path.exists():
+            try:
+                self.state = json.loads(path.read_text(encoding="utf-8"))
+            except ValueError:
+                self.state = {}
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def pending_batch(self, window_key: str) -> Optional[str]:
+        pending = self.state.get("pending_batch") or {}
+        return pending.get("batch_id") if pending.get("window") == window_key else None
+
+    def set_pending_batch(self, window_key: Optional[str], batch_id: Optional[str]) -> None:
+        self.state["pending_batch"] = {"window": window_key, "batch_id": batch_id} if batch_id else None
+        self.save()
+
+
+def _scan_output(output_path: Path) -> Tuple[Set[str], Dict[str, int]]:
+    """
+    Ids and totals already written to `output_path`; a torn last line from
+    an interrupted run is truncated away.
+    """
+    done: Set[str] = set()
+    totals = {"issues": 0, "errors": 0, "letters": 0}
+    if not output_path.exists():
+        return done, totals
+    with open(output_path, "rb+") as handle:
+        valid_end = 0
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break
+            valid_end += len(line)
+            try:
+                result = json.loads(line)
+                done.add(str(result["id"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+            totals["issues"] += len(result.get("issues") or [])
+            totals["errors"] += result.get("status") == "error"
+            totals["letters"] += len(result.get("letters") or [])
+        handle.truncate(valid_end)
+    return done, totals
+
+
+def _window_key(records: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256("\n".join(r["id"] for r in records).encode("utf-8")).hexdigest()[:16]
+
+
+def run_batch(
+    input_path: Path,
+    output_path: Path,
+    options: Optional[BatchOptions] = None,
+    progress: Optional[Progress] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Dict[str, Any]:
+    """
+    Analyzes every set in `input_path` and appends one JSONL result per set to
+    `output_path`, a window at a time: rule-based analysis in a process pool,
+    then (optionally) evidence retrieval deduplicated across the window and
+    letter drafting with the window's LLM calls issued together. Re-running
+    with the same output resumes after the last completed set.
+    """
+    options = options or BatchOptions()
+    input_path, output_path = Path(input_path), Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint = _Checkpoint(output_path.with_name(output_path.name + ".checkpoint.json"))
+    done, totals = _scan_output(output_path)
+    total = sum(1 for _ in iter_batch_input(input_path))
+    stats = {"total": total, "done": len(done), "skipped": len(done), **totals}
+
+    kb = None
+    if options.retrieve:
+        from app.data.vector_db import get_knowledge_base
+
+        kb = get_knowledge_base()
+
+    def report(stage: str) -> None:
+        if progress:
+            progress({**stats, "stage": stage})
+
+    pending = (record for record in iter_batch_input(input_path) if record["id"] not in done)
+    with ProcessPoolExecutor(
+        max_workers=max(options.workers, 1),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool, open(output_path, "a", encoding="utf-8") as out:
+        report("start")
+        while True:
+            if should_stop and should_stop():
+                break
+            window = list(islice(pending, max(options.window_size, 1)))
+            if not window:
+                break
+            chunksize = max(len(window) // (max(options.workers, 1) * 4), 1)
+            results = list(pool.map(analyze_set, window, chunksize=chunksize))
+            report("analyzed")
+
+            if kb is not None:
+                _attach_evidence(results, kb)
+                report("retrieved")
+            if options.draft_letters:
+                requests = _letter_requests(results, options.letters_per_set)
+                if requests:
+                    letters = _draft_letters(requests, options, checkpoint, _window_key(window))
+                    by_set: Dict[str, List[Dict[str, Any]]] = {}
+                    for custom_id, text in letters.items():
+                        set_id, _, idx = custom_id.rpartition(":")
+                        if text:
+                            by_set.setdefault(set_id, []).append({"issue_index": int(idx), "letter": text})
+                    for result in results:
+                        result["letters"] = sorted(by_set.get(result["id"], []), key=lambda l: l["issue_index"])
+                        stats["letters"] += len(result["letters"])
+                    report("drafted")
+
+            for result in results:
+                out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                stats["issues"] += len(result.get("issues") or [])
+                stats["errors"] += result.get("status") == "error"
+            out.flush()
+            os.fsync(out.fileno())
+            stats["done"] += len(results)
+            if checkpoint.state.get("pending_batch"):
+                checkpoint.set_pending_batch(None, None)
+            report("written")
+    report("finished" if stats["done"] >= total else "stopped")
+    return stats
+
+
+@dataclass
+class BatchJob:
+    job_id: str
+    options: BatchOptions
+    status: str = "queued"
+    progress: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def directory(self) -> Path:
+        return BATCH_JOBS_DIR / self.job_id
+
+    @property
+    def input_path(self) -> Path:
+        return self.directory / "input.jsonl"
+
+    @property
+    def output_path(self) -> Path:
+        return self.directory / "results.jsonl"
+
+    def to_dict(self) -> Dict[str, Any]:
+        payload = asdict(self)
+        payload["options"] = asdict(self.options)
+        return payload
+
+    def save(self) -> None:
+        self.updated_at = time.time()
+        tmp = self.directory / "status.json.tmp"
+        tmp.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+        os.replace(tmp, self.directory / "status.json")
+
+
+_jobs: Dict[str, BatchJob] = {}
+_running: Dict[str, threading.Thread] = {}
+_jobs_lock = threading.Lock()
+
+
+def _run_job(job: BatchJob) -> None:
+    def on_progress(progress: Dict[str, Any]) -> None:
+        job.progress = progress
+        job.save()
+
+    job.status = "running"
+    job.error = None
+    job.save()
+    try:
+        stats = run_batch(job.input_path, job.output_path, job.options, progress=on_progress)
+        job.status = "completed" if stats["done"] >= stats["total"] else "stopped"
+    except Exception as exc:
+        job.status = "failed"
+        job.error = str(exc)
+    finally:
+        job.save()
+        with _jobs_lock:
+            _running.pop(job.job_id, None)
+
+
+def _start(job: BatchJob) -> None:
+    with _jobs_lock:
+        if job.job_id in _running:
+            return
+        thread = threading.Thread(target=_run_job, args=(job,), name=f"batch-{job.job_id}", daemon=True)
+        _running[job.job_id] = thread
+        _jobs[job.job_id] = job
+        job.status = "queued"
+    thread.start()
+
+
+def create_batch_job(sets: List[Dict[str, Any]], options: Optional[BatchOptions] = None) -> BatchJob:
+    """
+    Stores the sets as a job's input and starts it on a background thread.
+    """
+    job = BatchJob(job_id=uuid.uuid4().hex, options=options or BatchOptions())
+    job.directory.mkdir(parents=True, exist_ok=True)
+    with open(job.input_path, "w", encoding="utf-8") as handle:
+        for record in sets:
+            handle.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    job.save()
+    _start(job)
+    return job
+
+
+def get_batch_job(job_id: str) -> Optional[BatchJob]:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job
+    status_path = BATCH_JOBS_DIR / job_id / "status.json"
+    if not status_path.is_file():
+        return None
+    payload = json.loads(status_path.read_text(encoding="utf-8"))
+    payload["options"] = BatchOptions(**payload.get("options") or {})
+    job = BatchJob(**payload)
+    if job.status in {"queued", "running"}:
+        # Left behind by a previous process.
+        job.status = "interrupted"
+    with _jobs_lock:
+        return _jobs.setdefault(job_id, job)
+
+
+def resume_batch_job(job_id: str) -> Optional[BatchJob]:
+    """
+    Restarts an interrupted, stopped or failed job; completed sets are skipped.
+    """
+    job = get_batch_job(job_id)
+    if job is not None and job.status != "completed":
+        _start(job)
+    return job
+
+
+def iter_batch_results(job_id: str) -> Iterator[str]:
+    job = get_batch_job(job_id)
+    if job is None or not job.output_path.exists():
+        return
+    with open(job.output_path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.endswith("\n"):
+                yield line
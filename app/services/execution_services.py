@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+
+def _read_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, "") or default)
+    except ValueError:
+        return default
+
+
+CPU_WORKERS = _read_int("EXECUTION_CPU_WORKERS", min(4, os.cpu_count() or 1))
+IO_WORKERS = _read_int("EXECUTION_IO_WORKERS", 32)
+# Seconds a request may wait for a route slot before it is turned away.
+ROUTE_QUEUE_TIMEOUT = float(os.environ.get("EXECUTION_QUEUE_TIMEOUT", "30") or "30")
+ROUTE_LIMITS: Dict[str, int] = {
+    "analyze": _read_int("ANALYZE_CONCURRENCY", 16),
+    "parse": _read_int("PARSE_CONCURRENCY", 2),
+    "ingest": _read_int("INGEST_CONCURRENCY", 4),
+}
+
+_lock = threading.Lock()
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_io_pool: Optional[ThreadPoolExecutor] = None
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class RouteBusyError(RuntimeError):
+    """
+    Raised when a route's concurrency slots stay full past the queue timeout.
+    """
+
+
+def _get_cpu_pool() -> ProcessPoolExecutor:
+    global _cpu_pool
+    with _lock:
+        if _cpu_pool is None:
+            # "spawn" avoids forking a process that holds event-loop threads and sockets.
+            _cpu_pool = ProcessPoolExecutor(
+                max_workers=max(CPU_WORKERS, 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _cpu_pool
+
+
+def _get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    with _lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=max(IO_WORKERS, 1), thread_name_prefix="blocking-io")
+        return _io_pool
+
+
+async def run_cpu(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Runs a CPU-bound call (statement parsing, OCR) in the worker process pool.
+    `fn` and its arguments must be picklable.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_cpu_pool(), partial(fn, *args, **kwargs))
+
+
+async def run_io(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Runs a blocking I/O call (SQLite, OpenAI, vector search) in the bounded thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_io_pool(), partial(fn, *args, **kwargs))
+
+
+def _semaphore(route: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(route)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(ROUTE_LIMITS.get(route, 8), 1))
+        _semaphores[route] = semaphore
+    return semaphore
+
+
+@asynccontextmanager
+async def route_slot(route: str) -> AsyncIterator[None]:
+    """
+    Holds one of the route's concurrency slots for the duration of the block.
+    """
+    semaphore = _semaphore(route)
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=ROUTE_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError as exc:
+        raise RouteBusyError(f"Too many concurrent {route} requests. Please retry shortly.") from exc
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def shutdown_executors() -> None:
+    global _cpu_pool, _io_pool
+    with _lock:
+        if _cpu_pool is not None:
+            _cpu_pool.shutdown(wait=False, cancel_futures=True)
+            _cpu_pool = None
+        if _io_pool is not None:
+            _io_pool.shutdown(wait=False, cancel_futures=True)
+            _io_pool = None
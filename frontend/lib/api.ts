@@ -37,6 +37,23 @@ class ApiService {
     return headers;
   }
 
+  private getUserId(): string | undefined {
+    if (typeof window === 'undefined') {
+      return undefined;
+    }
+    const userStr = localStorage.getItem('user');
+    if (!userStr) {
+      return undefined;
+    }
+    try {
+      const parsed = JSON.parse(userStr) as { id?: string };
+      return parsed?.id || undefined;
+    } catch {
+      // Ignore malformed user cache.
+      return undefined;
+    }
+  }
+
   private async handleResponse<T>(response: Response): Promise<ApiResponse<T>> {
     const data = await response.json().catch(() => ({ message: 'Invalid response from server' }));
     
@@ -229,7 +246,9 @@ class ApiService {
 
   // Transaction endpoints
   async getTransactions(): Promise<Transaction[]> {
-    const response = await fetch(`${API_BASE_URL}/transactions`, {
+    const userId = this.getUserId();
+    const query = userId ? `?user_id=${encodeURIComponent(userId)}` : '';
+    const response = await fetch(`${API_BASE_URL}/transactions${query}`, {
       headers: this.getHeaders(),
     });
     
@@ -265,7 +284,7 @@ class ApiService {
     const response = await fetch(`${API_BASE_URL}/transactions/confirm`, {
       method: 'POST',
       headers: this.getHeaders(),
-      body: JSON.stringify({ preview_id: previewId, mapping }),
+      body: JSON.stringify({ preview_id: previewId, mapping, user_id: this.getUserId() }),
     });
     
     if (!response.ok) {
@@ -279,6 +298,10 @@ class ApiService {
   async uploadTransactions(file: File): Promise<{ count: number }> {
     const formData = new FormData();
     formData.append('file', file);
+    const userId = this.getUserId();
+    if (userId) {
+      formData.append('user_id', userId);
+    }
 
     const response = await fetch(`${API_BASE_URL}/transactions/upload`, {
       method: 'POST',
@@ -1,10 +1,22 @@
 # This is the Entry point (FastAPI app)
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
+import asyncio
+import csv
+import json
+import os
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, ConfigDict, Field
-from app.agent.core import run_sentinel
+from app.agent.core import arun_sentinel, astream_sentinel, readiness, warm_up
+from app.agent.llm_gateway import LLMUnavailableError, llm_metrics
+from app.agent.response_cache import response_cache_stats
 from app.data.bank_transactions import (
+    claim_legacy_transactions,
     extract_rows_from_upload,
+    ingest_csv_stream,
+    is_streamable_csv,
+    load_transaction_issues,
     load_transactions,
     normalize_rows_with_mapping,
     parse_transactions_from_upload,
@@ -12,11 +24,25 @@ from app.data.bank_transactions import (
 )
 from app.data.preview_store import delete_preview, load_preview, save_preview
 from app.data.mock_plaid import get_mock_transactions
-from app.data.vector_db import LegalKnowledgeBase
+from app.data.vector_db import VECTOR_DB_PROVIDER, knowledge_base_status, peek_knowledge_base
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.services import auth_services
+from app.services.execution_services import (
+    RouteBusyError,
+    route_slot,
+    run_cpu,
+    run_io,
+    shutdown_executors,
+)
+from app.services.batch_services import (
+    BatchOptions,
+    create_batch_job,
+    get_batch_job,
+    iter_batch_results,
+    resume_batch_job,
+)
 from app.services.conversation_services import (
     HISTORY_LIMIT,
     append_messages,
@@ -43,6 +69,41 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(RouteBusyError)
+async def route_busy_handler(_request, exc: RouteBusyError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(_request, exc: LLMUnavailableError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+# Build the agent (tracing, model clients, knowledge base) in the background after the
+# server starts listening; /health/ready reports when it's done.
+WARM_UP_ON_STARTUP = os.environ.get("WARM_UP_ON_STARTUP", "1").strip().lower() not in {"0", "false", "no"}
+_warm_up_task: asyncio.Task | None = None
+
+
+async def _warm_up_agent():
+    try:
+        await run_io(warm_up)
+    except Exception as exc:
+        print(f"Agent warm-up failed: {exc}")
+
+
+@app.on_event("startup")
+async def _start_warm_up():
+    global _warm_up_task
+    if WARM_UP_ON_STARTUP:
+        _warm_up_task = asyncio.create_task(_warm_up_agent())
+
+
+@app.on_event("shutdown")
+def _shutdown_executors():
+    shutdown_executors()
+
+
 
 class Request(BaseModel):
     query: str
@@ -56,9 +117,26 @@ class ConversationRequest(BaseModel):
     user_id: str | None = None
 
 
+class BatchSet(BaseModel):
+    id: str | None = None
+    transactions: list[dict] | None = None
+    user_id: str | None = None
+    account_id: str | None = None
+
+
+class BatchJobRequest(BaseModel):
+    sets: list[BatchSet]
+    retrieve: bool = False
+    draft_letters: bool = False
+    letters_per_set: int = 1
+    llm_mode: str = "online"
+
+
 class PreviewConfirmRequest(BaseModel):
     preview_id: str
     mapping: dict
+    user_id: str | None = None
+    account_id: str | None = None
 
 
 class PreviewSchemaField(BaseModel):
@@ -88,6 +166,22 @@ class PreviewResponse(BaseModel):
 def root():
     return {"message": "Fiscal Sentinel API up and running"}
 
+
+@app.get("/health/live", summary="Liveness", description="The process is up and serving requests.", tags=["infra"])
+def health_live():
+    return {"status": "ok"}
+
+
+@app.get(
+    "/health/ready",
+    summary="Readiness",
+    description="503 until the agent (model clients, knowledge base, graph) has been initialized.",
+    tags=["infra"],
+)
+def health_ready():
+    state = readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
 # Auth Routes
 @app.post(
     "/register",
@@ -162,14 +256,28 @@ async def delete_user(user_id: str):
 
 
 
+def _load_stored(user_id: str | None, account_id: str | None = None, with_issues: bool = True):
+    """
+    The owner's stored transactions and issues. Rows from the old single-file
+    store go to the first signed-in user who has nothing stored yet; nobody
+    else ever reads another owner's rows.
+    """
+    tx = load_transactions(user_id=user_id, account_id=account_id)
+    if not tx and claim_legacy_transactions(user_id=user_id, account_id=account_id):
+        tx = load_transactions(user_id=user_id, account_id=account_id)
+    if not tx:
+        return None, None
+    issues = load_transaction_issues(user_id=user_id, account_id=account_id) if with_issues else None
+    return tx, issues
+
 @app.get(
     "/transactions",
     summary="List transactions",
     description="Return stored transactions or fall back to mock data.",
     tags=["transactions"],
 )
-def get_tx():
-    stored = load_transactions()
+def get_tx(user_id: str | None = None, account_id: str | None = None):
+    stored, _issues = _load_stored(user_id, account_id, with_issues=False)
     return stored if stored else get_mock_transactions()
 
 @app.post(
@@ -186,13 +294,15 @@ async def preview_transactions(file: UploadFile = File(...)):
     if not content:
         raise HTTPException(status_code=400, detail="Uploaded file is empty.")
     try:
-        preview = extract_rows_from_upload(file.filename or "", content)
+        # Camelot/OCR are CPU-bound; keep them off the event loop.
+        async with route_slot("parse"):
+            preview = await run_cpu(extract_rows_from_upload, file.filename or "", content)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
     rows = preview.get("rows") or []
     columns = preview.get("columns") or []
-    preview_id = save_preview({"rows": rows, "columns": columns})
+    preview_id = await run_io(save_preview, {"rows": rows, "columns": columns})
     sample_rows = rows[:10]
     return {
         "preview_id": preview_id,
@@ -211,7 +321,7 @@ async def preview_transactions(file: UploadFile = File(...)):
 @app.post(
     "/transactions/confirm",
     summary="Confirm transaction mapping",
-    description="Apply a user-provided column mapping to the preview and persist transactions.",
+    description="Apply a user-provided column mapping to the preview and append transactions to the user's store.",
     tags=["transactions"],
 )
 def confirm_transactions(req: PreviewConfirmRequest):
@@ -228,31 +338,66 @@ def confirm_transactions(req: PreviewConfirmRequest):
     if not transactions:
         raise HTTPException(status_code=400, detail="No transactions produced from mapping.")
 
-    save_transactions(transactions, source=f"preview:{req.preview_id}")
+    save_transactions(
+        transactions,
+        source=f"preview:{req.preview_id}",
+        user_id=req.user_id,
+        account_id=req.account_id,
+    )
     delete_preview(req.preview_id)
     return {"count": len(transactions)}
 
 @app.post(
     "/transactions/upload",
     summary="Upload transactions",
-    description="Upload a CSV or PDF and persist parsed transactions directly.",
+    description="Upload a CSV or PDF and append parsed transactions to the user's store.",
     tags=["transactions"],
 )
-async def upload_transactions(file: UploadFile = File(...)):
+async def upload_transactions(
+    file: UploadFile = File(...),
+    user_id: str | None = Form(None),
+    account_id: str | None = Form(None),
+):
     if not file:
         raise HTTPException(status_code=400, detail="Missing file upload.")
+    if is_streamable_csv(file.filename or "", file.file):
+        # Large CSV exports are parsed and stored batch by batch instead of
+        # being decoded into memory as a whole.
+        try:
+            async with route_slot("ingest"):
+                count = await run_io(
+                    ingest_csv_stream,
+                    file.file,
+                    source=file.filename or "upload",
+                    user_id=user_id,
+                    account_id=account_id,
+                )
+        except (ValueError, csv.Error) as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        if not count:
+            raise HTTPException(status_code=400, detail="No transactions parsed from upload.")
+        return {"count": count}
+
     content = await file.read()
     if not content:
         raise HTTPException(status_code=400, detail="Uploaded file is empty.")
     try:
-        transactions = parse_transactions_from_upload(file.filename or "", content)
+        async with route_slot("parse"):
+            transactions = await run_cpu(parse_transactions_from_upload, file.filename or "", content)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
     if not transactions:
         raise HTTPException(status_code=400, detail="No transactions parsed from upload.")
 
-    save_transactions(transactions, source=file.filename or "upload")
+    async with route_slot("ingest"):
+        await run_io(
+            save_transactions,
+            transactions,
+            source=file.filename or "upload",
+            user_id=user_id,
+            account_id=account_id,
+        )
     return {"count": len(transactions)}
 
 @app.post(
@@ -262,18 +407,35 @@ async def upload_transactions(file: UploadFile = File(...)):
     tags=["analysis"],
 )
 async def analyze(req: Request):
+    async with route_slot("analyze"):
+        return await _analyze(req)
+
+
+async def _prepare_analysis(req: Request):
+    tx, issues = await run_io(_load_stored, req.user_id)
+    tx = tx or get_mock_transactions()
+    history = req.history or []
+    conversation_id = req.conversation_id
+
+    if conversation_id or req.history is None:
+        conversation_id = await get_or_create_conversation(conversation_id, req.user_id)
+        history = await get_history(conversation_id, limit=HISTORY_LIMIT, user_id=req.user_id)
+    return tx, issues, history, conversation_id
+
+
+async def _analyze(req: Request):
     try:
-        tx = load_transactions() or get_mock_transactions()
-        history = req.history or []
-        conversation_id = req.conversation_id
+        tx, issues, history, conversation_id = await _prepare_analysis(req)
         user_id = req.user_id
 
-        if conversation_id or req.history is None:
-            conversation_id = await get_or_create_conversation(conversation_id, user_id)
-            history = await get_history(conversation_id, limit=HISTORY_LIMIT, user_id=user_id)
-
         if req.debug:
-            response, debug_payload = run_sentinel(req.query, tx, history=history, debug=True)
+            response, debug_payload = await arun_sentinel(
+                req.query,
+                tx,
+                history=history,
+                debug=True,
+                issues=issues,
+            )
             new_messages = [
                 {"role": "user", "content": req.query},
                 {"role": "assistant", "content": response},
@@ -293,7 +455,7 @@ async def analyze(req: Request):
                 "history": history_out,
             }
 
-        response = run_sentinel(req.query, tx, history=history)
+        response = await arun_sentinel(req.query, tx, history=history, issues=issues)
         new_messages = [
             {"role": "user", "content": req.query},
             {"role": "assistant", "content": response},
@@ -311,10 +473,67 @@ async def analyze(req: Request):
             "conversation_id": conversation_id,
             "history": history_out,
         }
+    except LLMUnavailableError:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post(
+    "/analyze/stream",
+    summary="Analyze query (streaming)",
+    description=(
+        "Same as /analyze, streamed as Server-Sent Events: `node` events as each agent step "
+        "finishes (intent, issues found, evidence retrieved), `token` events with response text "
+        "as it is generated, then `done` with the full response (or `error`)."
+    ),
+    tags=["analysis"],
+)
+async def analyze_stream(req: Request):
+    try:
+        tx, issues, history, conversation_id = await _prepare_analysis(req)
+    except LLMUnavailableError:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    async def events():
+        try:
+            async with route_slot("analyze"):
+                yield _sse("start", {"conversation_id": conversation_id})
+                response = None
+                async for event in astream_sentinel(req.query, tx, history=history, issues=issues):
+                    name = event["event"]
+                    if name == "node":
+                        yield _sse(name, {"node": event["node"], **event["data"]})
+                        continue
+                    if name == "done":
+                        response = event["data"].get("response", "")
+                    yield _sse(name, event["data"])
+                if response is not None and conversation_id:
+                    await append_messages(
+                        conversation_id,
+                        [
+                            {"role": "user", "content": req.query},
+                            {"role": "assistant", "content": response},
+                        ],
+                        limit=HISTORY_LIMIT,
+                        user_id=req.user_id,
+                    )
+        except RouteBusyError as exc:
+            yield _sse("error", {"detail": str(exc)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post(
     "/conversations/new",
     summary="Create new conversation",
@@ -328,6 +547,69 @@ async def new_conversation(req: ConversationRequest):
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
+@app.post(
+    "/batch/jobs",
+    summary="Start a batch analysis job",
+    description=(
+        "Analyze many transaction sets (inline or by user_id/account_id) in the background: rule-based "
+        "analysis, optional evidence retrieval and letter drafting. Poll the job and stream its JSONL results."
+    ),
+    tags=["analysis"],
+)
+def start_batch_job(req: BatchJobRequest):
+    if not req.sets:
+        raise HTTPException(status_code=400, detail="No transaction sets provided.")
+    try:
+        options = BatchOptions(
+            retrieve=req.retrieve,
+            draft_letters=req.draft_letters,
+            letters_per_set=req.letters_per_set,
+            llm_mode=req.llm_mode,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    job = create_batch_job([item.model_dump(exclude_none=True) for item in req.sets], options)
+    return job.to_dict()
+
+
+@app.get(
+    "/batch/jobs/{job_id}",
+    summary="Batch job status",
+    description="Status and progress (sets done/total, issues, letters, errors) of a batch job.",
+    tags=["analysis"],
+)
+def batch_job_status(job_id: str):
+    job = get_batch_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found.")
+    return job.to_dict()
+
+
+@app.post(
+    "/batch/jobs/{job_id}/resume",
+    summary="Resume a batch job",
+    description="Restart an interrupted or failed job from its last checkpoint.",
+    tags=["analysis"],
+)
+def resume_batch(job_id: str):
+    job = resume_batch_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found.")
+    return job.to_dict()
+
+
+@app.get(
+    "/batch/jobs/{job_id}/results",
+    summary="Batch job results",
+    description="Results written so far, one JSON object per transaction set (JSONL).",
+    tags=["analysis"],
+)
+def batch_job_results(job_id: str):
+    if get_batch_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found.")
+    return StreamingResponse(iter_batch_results(job_id), media_type="application/x-ndjson")
+
+
 @app.get(
     "/vector-db/health",
     summary="Vector DB health",
@@ -335,12 +617,36 @@ async def new_conversation(req: ConversationRequest):
     tags=["infra"],
 )
 def vector_db_health():
+    # Only reports on the shared knowledge base; never opens one (that loads a model).
+    kb = peek_knowledge_base()
+    if kb is None:
+        status = knowledge_base_status()
+        if status["status"] == "unavailable":
+            raise HTTPException(status_code=500, detail=status["error"])
+        return JSONResponse(status_code=503, content={"provider": VECTOR_DB_PROVIDER, **status})
     try:
-        kb = LegalKnowledgeBase()
-        stats = kb.get_collection_stats()
+        stats = kb.cached_collection_stats()
         return {"provider": kb.provider, "collection": kb.collection_name, **stats}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
+@app.get(
+    "/metrics/response-cache",
+    summary="Response cache metrics",
+    description="Entries, hits (exact and semantic), misses, and hit rate per LLM response cache.",
+    tags=["infra"],
+)
+def response_cache_metrics():
+    return response_cache_stats()
+
+@app.get(
+    "/metrics/llm",
+    summary="LLM call metrics",
+    description="Circuit breaker state plus per-node call counts, retries, hedges, latency percentiles, and token usage.",
+    tags=["infra"],
+)
+def llm_call_metrics():
+    return llm_metrics()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
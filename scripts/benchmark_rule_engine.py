@@ -0,0 +1,89 @@
+"""
+Benchmark the rule-based analyzer against synthetic statements of growing size.
+
+Why this exists:
+- Shows how frame construction and the single-sweep rule engine scale with row count.
+- Gives a quick regression check when adding rules (a new rule should not add a pass).
+
+Usage:
+  python scripts/benchmark_rule_engine.py
+  python scripts/benchmark_rule_engine.py --sizes 1000 10000 100000 --merchants 2000 --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.analysis.transaction_analyzer import RULES, analyze_transactions_rule_based  # noqa: E402
+from app.analysis.transaction_frame import TransactionFrame  # noqa: E402
+
+
+NOTES = [
+    "",
+    "Monthly subscription",
+    "Recurring membership",
+    "Free trial ended",
+    "Asked to cancel in person",
+    "Monthly maintenance fee",
+    "Chargeback fee",
+    "Card purchase",
+]
+CATEGORIES = [["Subscription"], ["Fees"], ["Food and Drink"], ["Transfer"], []]
+
+
+def make_transactions(count: int, merchants: int, seed: int = 7):
+    rng = random.Random(seed)
+    start = date(2022, 1, 1)
+    return [
+        {
+            "transaction_id": f"tx_{i}",
+            "date": (start + timedelta(days=rng.randint(0, 730))).strftime("%Y-%m-%d"),
+            "merchant_name": f"Merchant {rng.randint(0, merchants - 1)}",
+            "amount": round(rng.choice([9.99, 12.0, 29.99, 54.5, -120.0, rng.uniform(1, 500)]), 2),
+            "category": rng.choice(CATEGORIES),
+            "notes": rng.choice(NOTES),
+        }
+        for i in range(count)
+    ]
+
+
+def best_of(repeat: int, fn):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--merchants", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"Rules registered: {len(RULES)} ({', '.join(rule.name for rule in RULES)})")
+    print(f"{'rows':>10} {'frame ms':>10} {'rules ms':>10} {'total ms':>10} {'us/row':>8} {'issues':>8}")
+    for size in args.sizes:
+        transactions = make_transactions(size, min(args.merchants, max(size // 5, 1)))
+        frame_s, frame = best_of(args.repeat, lambda: TransactionFrame.from_transactions(transactions))
+        rules_s, issues = best_of(args.repeat, lambda: analyze_transactions_rule_based(frame))
+        total = frame_s + rules_s
+        print(
+            f"{size:>10} {frame_s * 1000:>10.1f} {rules_s * 1000:>10.1f} {total * 1000:>10.1f}"
+            f" {total * 1e6 / size:>8.2f} {len(issues):>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
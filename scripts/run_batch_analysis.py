@@ -0,0 +1,84 @@
+"""
+Run the analysis over many transaction sets (nightly sweeps) and write JSONL results.
+
+Why this exists:
+- /analyze and run_sentinel handle one conversation at a time.
+- Sweeps need the deterministic rules for thousands of statements, plus evidence and
+  letters only where issues were found, without one LLM round-trip per account.
+
+Input (JSONL, one set per line):
+  {"id": "acct-1", "transactions": [...]}
+  {"id": "acct-2", "user_id": "u2", "account_id": "checking"}   # stored transactions
+
+Output: one JSON object per set, appended as each window completes. Re-running with
+the same --output resumes after the last completed set.
+
+Usage:
+  python scripts/run_batch_analysis.py --input sets.jsonl --output results.jsonl
+  python scripts/run_batch_analysis.py --input sets.jsonl --output results.jsonl --retrieve --letters
+  python scripts/run_batch_analysis.py --input sets.jsonl --output results.jsonl --letters --llm-mode provider
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.services.batch_services import (  # noqa: E402
+    BATCH_WINDOW_SIZE,
+    BATCH_WORKERS,
+    LLM_MODES,
+    BatchOptions,
+    run_batch,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=Path, required=True, help="JSONL file of transaction sets.")
+    parser.add_argument("--output", type=Path, required=True, help="JSONL results file (appended; resumable).")
+    parser.add_argument("--retrieve", action="store_true", help="Attach legal evidence to each issue.")
+    parser.add_argument("--letters", action="store_true", help="Draft dispute letters for flagged sets.")
+    parser.add_argument("--letters-per-set", type=int, default=1)
+    parser.add_argument("--llm-mode", choices=LLM_MODES, default="online")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Processes for rule-based analysis.")
+    parser.add_argument("--window", type=int, default=BATCH_WINDOW_SIZE, help="Sets per window/checkpoint.")
+    parser.add_argument("--restart", action="store_true", help="Discard existing output instead of resuming.")
+    args = parser.parse_args()
+
+    if args.restart:
+        for path in (args.output, args.output.with_name(args.output.name + ".checkpoint.json")):
+            path.unlink(missing_ok=True)
+
+    started = time.perf_counter()
+
+    def progress(state):
+        elapsed = time.perf_counter() - started
+        print(
+            f"[{elapsed:7.1f}s] {state['stage']:<9} {state['done']}/{state['total']} sets, "
+            f"{state['issues']} issues, {state['letters']} letters, {state['errors']} errors",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    options = BatchOptions(
+        retrieve=args.retrieve,
+        draft_letters=args.letters,
+        letters_per_set=args.letters_per_set,
+        llm_mode=args.llm_mode,
+        workers=args.workers,
+        window_size=args.window,
+    )
+    stats = run_batch(args.input, args.output, options, progress=progress)
+    if stats["skipped"]:
+        print(f"Resumed: {stats['skipped']} set(s) were already complete.", file=sys.stderr)
+    print(f"Wrote results for {stats['done']}/{stats['total']} sets to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
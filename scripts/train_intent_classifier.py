@@ -0,0 +1,227 @@
+"""
+Train and evaluate the local intent classifier used by the router.
+
+Why this exists:
+- The router's heuristics miss many messages; those used to go to the LLM.
+- A small TF-IDF + logistic model answers confident cases locally and only
+  escalates low-confidence messages, with thresholds calibrated on held-out data.
+
+Training data:
+- Routing traces: JSONL lines {"text": ..., "intent": ..., "source": ...}, as written
+  by the router when ROUTING_TRACE_PATH is set (exports with "input"/"user_input"
+  instead of "text" also work). Only --sources are used, so the classifier never
+  trains on its own decisions.
+- Built-in seed examples for each intent (disable with --no-seed).
+
+Usage:
+  python scripts/train_intent_classifier.py --traces routing_traces.jsonl
+  python scripts/train_intent_classifier.py --traces a.jsonl b.jsonl --target-precision 0.97
+  python scripts/train_intent_classifier.py --traces routing_traces.jsonl --eval-only
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.agent.intent_classifier import (  # noqa: E402
+    INTENT_CLASSIFIER_PATH,
+    INTENTS,
+    IntentClassifier,
+    calibrate_thresholds,
+    train_intent_classifier,
+)
+from app.agent.response_cache import normalize_prompt  # noqa: E402
+
+
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "greeting": [
+        "hi there",
+        "hello sentinel",
+        "hey, how are you?",
+        "good morning!",
+        "hiya",
+        "hello, anyone there?",
+        "hey there friend",
+        "greetings",
+    ],
+    "general_question": [
+        "what can you do?",
+        "how does this work?",
+        "what should I do if a merchant refuses a refund?",
+        "how do I cancel a subscription online?",
+        "can you explain what a chargeback is?",
+        "what's the best way to avoid overdraft charges?",
+        "how long does a refund usually take?",
+        "should I contact my bank or the merchant first?",
+    ],
+    "analyze_transactions": [
+        "are there any zombies in my subscription list?",
+        "anything weird on my account this month?",
+        "did I get double billed?",
+        "find suspicious payments",
+        "which subscriptions am I still paying for?",
+        "am I paying for things I don't use?",
+        "look for hidden charges",
+        "did my gym bill me after I cancelled?",
+    ],
+    "retrieve_laws": [
+        "is it legal for netflix to raise my price without notice?",
+        "what are my rights if a gym won't let me cancel?",
+        "does the ftc allow negative option billing?",
+        "can i fight a hidden bank fee?",
+        "what regulation covers free trial conversions?",
+        "is requiring in-person cancellation allowed by law?",
+        "what does consumer protection law say about auto renewals?",
+        "are junk fees illegal?",
+    ],
+    "draft_letter": [
+        "draft a letter to equinox regarding my unused membership",
+        "write a dispute letter for the adobe charge",
+        "please write a cancellation letter to planet fitness",
+        "compose a complaint to my bank about the fee",
+        "generate a letter asking spotify for a refund",
+        "can you write to amazon disputing this charge?",
+        "draft a termination notice for my gym",
+        "write the letter for me",
+    ],
+    "other": [
+        "who won the football game last night?",
+        "write me a poem about the sea",
+        "what's the weather tomorrow?",
+        "tell me a joke",
+        "build a website for my bakery",
+        "translate this into french",
+        "recommend a movie",
+        "what is the capital of peru?",
+    ],
+}
+
+
+def load_traces(paths: List[str], sources: set) -> List[Tuple[str, str]]:
+    examples: List[Tuple[str, str]] = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                text = record.get("text") or record.get("input") or record.get("user_input")
+                intent = record.get("intent")
+                source = record.get("source")
+                if not text or intent not in INTENTS:
+                    continue
+                if source and source not in sources:
+                    continue
+                examples.append((str(text), intent))
+    return examples
+
+
+def dedupe(examples: List[Tuple[str, str]]) -> Tuple[List[str], List[str]]:
+    # Majority label per normalized text; traces repeat common messages.
+    votes: Dict[str, Counter] = defaultdict(Counter)
+    first_text: Dict[str, str] = {}
+    for text, intent in examples:
+        key = normalize_prompt(text)
+        if not key:
+            continue
+        votes[key][intent] += 1
+        first_text.setdefault(key, text)
+    texts = list(votes)
+    return [first_text[key] for key in texts], [votes[key].most_common(1)[0][0] for key in texts]
+
+
+def stratified_split(texts: List[str], labels: List[str], holdout: float, seed: int):
+    by_label: Dict[str, List[int]] = defaultdict(list)
+    for idx, label in enumerate(labels):
+        by_label[label].append(idx)
+    rng = random.Random(seed)
+    train, test = [], []
+    for indices in by_label.values():
+        rng.shuffle(indices)
+        cut = int(round(len(indices) * holdout)) if len(indices) > 2 else 0
+        test.extend(indices[:cut])
+        train.extend(indices[cut:])
+    return train, test
+
+
+def report(model: IntentClassifier, texts: List[str], labels: List[str]) -> None:
+    if not texts:
+        print("No held-out examples to evaluate.")
+        return
+    predicted = [model.predict(text)[0] for text in texts]
+    accepted = [model.classify(text) for text in texts]
+    accuracy = sum(p == y for p, y in zip(predicted, labels)) / len(texts)
+    answered = [(a, y) for a, y in zip(accepted, labels) if a is not None]
+    coverage = len(answered) / len(texts)
+    answered_accuracy = sum(a == y for a, y in answered) / len(answered) if answered else 0.0
+
+    print(f"Held-out examples: {len(texts)}")
+    print(f"Top-1 accuracy:    {accuracy:.3f}")
+    print(f"Answered locally:  {coverage:.3f} (escalated to LLM: {1 - coverage:.3f})")
+    print(f"Accuracy when answered: {answered_accuracy:.3f}")
+    print(f"{'intent':<22} {'threshold':>9} {'precision':>9} {'recall':>7} {'support':>7}")
+    for intent in model.intents:
+        tp = sum(a == intent and y == intent for a, y in zip(accepted, labels))
+        fp = sum(a == intent and y != intent for a, y in zip(accepted, labels))
+        support = sum(y == intent for y in labels)
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / support if support else 0.0
+        threshold = model.thresholds.get(intent, 1.01)
+        print(f"{intent:<22} {threshold:>9.3f} {precision:>9.3f} {recall:>7.3f} {support:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traces", nargs="*", default=[], help="Routing trace JSONL files.")
+    parser.add_argument("--sources", default="llm,heuristic", help="Trace sources to learn from.")
+    parser.add_argument("--no-seed", action="store_true", help="Do not add the built-in seed examples.")
+    parser.add_argument("--holdout", type=float, default=0.25)
+    parser.add_argument("--target-precision", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--out", type=Path, default=INTENT_CLASSIFIER_PATH)
+    parser.add_argument("--eval-only", action="store_true", help="Evaluate the saved model on the traces.")
+    args = parser.parse_args()
+
+    examples = load_traces(args.traces, {s.strip() for s in args.sources.split(",") if s.strip()})
+    print(f"Loaded {len(examples)} trace examples from {len(args.traces)} file(s).")
+
+    if args.eval_only:
+        texts, labels = dedupe(examples)
+        report(IntentClassifier.load(args.out), texts, labels)
+        return
+
+    if not args.no_seed:
+        examples += [(text, intent) for intent, texts in SEED_EXAMPLES.items() for text in texts]
+    texts, labels = dedupe(examples)
+    print(f"Training on {len(texts)} distinct messages: {dict(Counter(labels))}")
+
+    train_idx, test_idx = stratified_split(texts, labels, args.holdout, args.seed)
+    model = train_intent_classifier([texts[i] for i in train_idx], [labels[i] for i in train_idx])
+    held_texts = [texts[i] for i in test_idx]
+    held_labels = [labels[i] for i in test_idx]
+    model.thresholds = calibrate_thresholds(
+        model,
+        held_texts,
+        held_labels,
+        target_precision=args.target_precision,
+    )
+    report(model, held_texts, held_labels)
+    model.save(args.out)
+    print(f"Saved model to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
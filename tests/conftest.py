@@ -0,0 +1,12 @@
+import pytest
+
+from app.data import bank_transactions, transaction_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """An empty transaction store in a temp dir, with a fresh transaction cache."""
+    monkeypatch.setattr(transaction_store, "DB_PATH", tmp_path / "transactions.db")
+    monkeypatch.setattr(transaction_store, "LEGACY_STORE_PATH", tmp_path / "bank_transactions.json")
+    monkeypatch.setattr(bank_transactions, "_cache", bank_transactions._TransactionCache(8))
+    return tmp_path
@@ -0,0 +1,112 @@
+import io
+import threading
+
+import pytest
+
+from app.data import bank_transactions, transaction_store
+
+
+def _tx(tx_id, merchant="Netflix", amount=15.49, date="2024-01-05"):
+    return {"transaction_id": tx_id, "date": date, "merchant_name": merchant, "amount": amount, "category": []}
+
+
+def test_slow_load_for_one_owner_does_not_block_other_owners(store, monkeypatch):
+    bank_transactions.save_transactions([_tx("a1")], user_id="alice")
+    bank_transactions.save_transactions([_tx("b1")], user_id="bob")
+    assert bank_transactions.load_transactions(user_id="alice")
+
+    loading = threading.Event()
+    release = threading.Event()
+    fetch = bank_transactions.fetch_transactions
+
+    def slow_fetch(user_id=None, account_id=None, **kwargs):
+        if user_id == "bob":
+            loading.set()
+            assert release.wait(5)
+        return fetch(user_id=user_id, account_id=account_id, **kwargs)
+
+    monkeypatch.setattr(bank_transactions, "fetch_transactions", slow_fetch)
+    results = {}
+    slow = threading.Thread(target=lambda: results.setdefault("bob", bank_transactions.load_transactions(user_id="bob")))
+    slow.start()
+    try:
+        assert loading.wait(5)
+        # Alice's warm hit and a cold load for carol both finish while bob's load is stuck.
+        assert [tx["transaction_id"] for tx in bank_transactions.load_transactions(user_id="alice")] == ["a1"]
+        assert bank_transactions.load_transactions(user_id="carol") is None
+    finally:
+        release.set()
+        slow.join(5)
+    assert [tx["transaction_id"] for tx in results["bob"]] == ["b1"]
+
+
+def test_cache_reloads_an_owner_after_its_own_write(store):
+    bank_transactions.save_transactions([_tx("a1")], user_id="alice")
+    first = bank_transactions.load_transactions(user_id="alice")
+    bank_transactions.save_transactions([_tx("b1")], user_id="bob")
+    assert bank_transactions.load_transactions(user_id="alice") is first
+    bank_transactions.save_transactions([_tx("a2", date="2024-01-06")], user_id="alice")
+    assert [tx["transaction_id"] for tx in bank_transactions.load_transactions(user_id="alice")] == ["a1", "a2"]
+
+
+def _uploads(owner=("", "")):
+    conn = transaction_store._get_connection()
+    rows = conn.execute("SELECT row_count FROM uploads WHERE user_id = ? AND account_id = ?", owner)
+    return [row[0] for row in rows]
+
+
+CSV_ROWS = [
+    "date,description,amount,notes",
+    "2024-01-05,Netflix,15.49,Monthly subscription",
+    '2024-01-05,Netflix,15.49,"two\nlines"',
+    "2024-01-06,Spotify,9.99,",
+    "2024-01-06,Spotify,9.99,",
+]
+
+
+def test_streamed_csv_handles_bom_and_any_line_ending(store):
+    for newline in ("\n", "\r\n", "\r"):
+        content = ("﻿" + newline.join(CSV_ROWS) + newline).encode("utf-8")
+        batches = list(bank_transactions.iter_csv_batches(io.BytesIO(content), batch_size=2))
+        rows = [tx for batch in batches for tx in batch]
+        assert [len(batch) for batch in batches] == [2, 2]
+        assert [tx["merchant_name"] for tx in rows] == ["Netflix", "Netflix", "Spotify", "Spotify"]
+        assert rows[1]["notes"].split() == ["two", "lines"]
+
+
+def test_streamed_csv_ids_are_stable_across_batches_and_reuploads(store):
+    content = ("\n".join(CSV_ROWS) + "\n").encode("utf-8")
+    one = [tx["transaction_id"] for batch in bank_transactions.iter_csv_batches(io.BytesIO(content), batch_size=1) for tx in batch]
+    many = [tx["transaction_id"] for batch in bank_transactions.iter_csv_batches(io.BytesIO(content), batch_size=10) for tx in batch]
+    assert one == many
+    # The two identical Spotify rows stay two transactions.
+    assert len(set(one)) == 4
+
+    assert bank_transactions.ingest_csv_stream(io.BytesIO(content), user_id="alice", batch_size=2) == 4
+    bank_transactions.ingest_csv_stream(io.BytesIO(content), user_id="alice", batch_size=3)
+    assert len(bank_transactions.load_transactions(user_id="alice")) == 4
+    assert _uploads(("alice", "")) == [4, 4]
+
+
+class _FailingUpload(io.BytesIO):
+    def __init__(self, content, fail_after):
+        super().__init__(content)
+        self.fail_after = fail_after
+
+    def read(self, size=-1):
+        if self.tell() >= self.fail_after:
+            raise OSError("client went away")
+        return super().read(min(size, 64) if size and size > 0 else 64)
+
+
+def test_failed_stream_leaves_the_store_untouched(store):
+    bank_transactions.save_transactions([_tx("keep")], user_id="alice")
+    lines = ["date,description,amount"] + [f"2024-01-{day % 28 + 1:02d},Shop {day},{day}.00" for day in range(200)]
+    content = ("\n".join(lines) + "\n").encode("utf-8")
+    upload = _FailingUpload(content, fail_after=len(content) // 2)
+    with pytest.raises(OSError):
+        bank_transactions.ingest_csv_stream(upload, user_id="alice", batch_size=10)
+    assert [tx["transaction_id"] for tx in bank_transactions.load_transactions(user_id="alice")] == ["keep"]
+    assert _uploads(("alice", "")) == [1]
+    staged = transaction_store._get_connection().execute("SELECT COUNT(*) FROM upload_staging").fetchone()[0]
+    assert staged == 0
@@ -0,0 +1,169 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app.agent import llm_gateway
+from app.agent.llm_gateway import LLMUnavailableError, chat_completion
+
+
+def _client(create):
+    client = openai.AsyncOpenAI(api_key="test")
+    client.chat.completions.create = create
+    return client
+
+
+def _response(text="ok"):
+    message = SimpleNamespace(content=text)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = llm_gateway._CircuitBreaker(failures=1, reset_seconds=0)
+    monkeypatch.setattr(llm_gateway, "_breaker", breaker)
+    monkeypatch.setattr(llm_gateway, "LLM_RETRY_BASE_DELAY", 0)
+    return breaker
+
+
+def test_cancelled_probe_releases_half_open_breaker(breaker):
+    breaker.record(False)
+    assert breaker.state == "half_open"
+    started = asyncio.Event()
+
+    async def hang(**kwargs):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def ok(**kwargs):
+        return _response()
+
+    async def scenario():
+        probe = asyncio.ensure_future(chat_completion(_client(hang), "probe", model="m", messages=[]))
+        await started.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await chat_completion(_client(ok), "after", model="m", messages=[])
+
+    result = asyncio.run(scenario())
+    assert result.choices[0].message.content == "ok"
+    assert breaker.state == "closed"
+
+
+def test_open_breaker_rejects_until_reset(monkeypatch):
+    breaker = llm_gateway._CircuitBreaker(failures=2, reset_seconds=60)
+    monkeypatch.setattr(llm_gateway, "_breaker", breaker)
+    breaker.record(False)
+    assert breaker.allow() == (True, False)
+    breaker.record(False)
+    assert breaker.state == "open"
+
+    async def ok(**kwargs):
+        return _response()
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(chat_completion(_client(ok), "rejected", model="m", messages=[]))
+
+
+def test_transient_errors_are_retried(breaker):
+    calls = []
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+    async def flaky(**kwargs):
+        calls.append(kwargs)
+        if len(calls) < 3:
+            raise openai.APIConnectionError(request=request)
+        return _response("third")
+
+    result = asyncio.run(chat_completion(_client(flaky), "flaky", model="m", messages=[]))
+    assert result.choices[0].message.content == "third"
+    assert len(calls) == 3
+    assert breaker.state == "closed"
+
+
+class _FakeStream:
+    def __init__(self, deltas, gap, stall_after=None):
+        self.deltas = list(deltas)
+        self.gap = gap
+        self.stall_after = stall_after
+        self.sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.sent == len(self.deltas):
+            raise StopAsyncIteration
+        await asyncio.sleep(60 if self.sent == self.stall_after else self.gap)
+        delta = SimpleNamespace(content=self.deltas[self.sent])
+        self.sent += 1
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+    async def close(self):
+        self.closed = True
+
+
+def test_stream_outlives_attempt_timeout_while_chunks_keep_arriving(breaker, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_ATTEMPT_TIMEOUT_SECONDS", 0.2)
+    monkeypatch.setattr(llm_gateway, "LLM_STREAM_IDLE_TIMEOUT_SECONDS", 0.2)
+    monkeypatch.setattr(llm_gateway, "LLM_DEADLINE_SECONDS", 0.2)
+    stream = _FakeStream(["a"] * 10, gap=0.05)
+
+    async def create(**kwargs):
+        return stream
+
+    deltas = []
+
+    async def on_delta(delta):
+        deltas.append(delta)
+
+    text = asyncio.run(llm_gateway.stream_chat_completion(_client(create), "letter", on_delta, model="m", messages=[]))
+    assert text == "a" * 10
+    assert deltas == ["a"] * 10
+    assert stream.closed
+
+
+def test_stalled_stream_fails_without_repeating_output(breaker, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_STREAM_IDLE_TIMEOUT_SECONDS", 0.1)
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return _FakeStream(["a", "b", "c"], gap=0, stall_after=2)
+
+    async def on_delta(delta):
+        pass
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(llm_gateway.stream_chat_completion(_client(create), "letter", on_delta, model="m", messages=[]))
+    assert len(calls) == 1
+
+
+def test_hedging_only_applies_to_short_budget_calls(breaker, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_HEDGE_AFTER_SECONDS", 0.05)
+    calls = []
+
+    async def slow(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.2)
+        return _response()
+
+    asyncio.run(chat_completion(_client(slow), "router", hedge=True, model="m", messages=[]))
+    assert len(calls) == 2
+
+    calls.clear()
+    asyncio.run(
+        chat_completion(
+            _client(slow),
+            "compose",
+            hedge=True,
+            timeout=llm_gateway.LLM_GENERATION_TIMEOUT_SECONDS,
+            model="m",
+            messages=[],
+        )
+    )
+    assert len(calls) == 1
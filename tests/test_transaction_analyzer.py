@@ -0,0 +1,139 @@
+import random
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.analysis.transaction_analyzer import analyze_transactions_rule_based
+from app.analysis.transaction_frame import TransactionFrame
+
+
+def _parse_date(value):
+    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(str(value or "").strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _category_text(tx):
+    category = tx.get("category") or []
+    return " ".join(category) if isinstance(category, list) else str(category)
+
+
+def _issue(merchant, issue, amount, reason):
+    return {"merchant": merchant, "issue": issue, "amount": amount, "reason": reason, "needs_evidence": False}
+
+
+def _reference(transactions):
+    """The seven-pass analyzer the rule engine replaced, kept as the oracle."""
+    by_merchant = defaultdict(list)
+    for tx in transactions:
+        by_merchant[(tx.get("merchant_name") or "Unknown Merchant").strip()].append(tx)
+    dated = {
+        merchant: sorted(
+            ((_parse_date(tx.get("date")), tx) for tx in txs if _parse_date(tx.get("date"))),
+            key=lambda item: item[0],
+        )
+        for merchant, txs in by_merchant.items()
+    }
+    issues = []
+    for merchant, indexed in dated.items():
+        for (prev_date, prev_tx), (curr_date, curr_tx) in zip(indexed, indexed[1:]):
+            if abs((curr_date - prev_date).days) <= 1 and float(curr_tx["amount"]) == float(prev_tx["amount"]):
+                issues.append(_issue(merchant, "Possible duplicate charge", float(curr_tx["amount"]), "Same amount charged twice within 24 hours."))
+                break
+    for merchant, indexed in dated.items():
+        if len(by_merchant[merchant]) < 2 or len(indexed) < 2:
+            continue
+        prev_amt, curr_tx = float(indexed[-2][1]["amount"]), indexed[-1][1]
+        curr_amt = float(curr_tx["amount"])
+        text = f"{(curr_tx.get('notes') or '').lower()} {_category_text(curr_tx)}".lower()
+        if prev_amt > 0 and curr_amt > prev_amt * 1.1 and any(w in text for w in ("subscription", "recurring", "plan", "membership")):
+            issues.append(_issue(merchant, "Possible price increase on subscription", curr_amt, f"Amount increased from {prev_amt:.2f} to {curr_amt:.2f}."))
+    notes_rules = [
+        (lambda m, tx: (tx.get("notes") or ""), ["cancel", "cancellation", "terminate", "in person"],
+         "Cancellation friction or billing after cancel request", "Notes mention cancellation or in-person requirement."),
+        (lambda m, tx: (tx.get("notes") or ""), ["free trial", "trial ended", "trial"],
+         "Free trial converted to paid plan", "Charge occurred after a trial period."),
+        (lambda m, tx: f"{m} {tx.get('notes') or ''} {_category_text(tx)}", ["fee", "fees", "maintenance"],
+         "Unexpected fee", "Charge categorized as a fee or described as maintenance."),
+        (lambda m, tx: (tx.get("notes") or ""), ["chargeback fee", "dispute fee", "returned item fee"],
+         "Possible chargeback/dispute fee", "Notes mention a chargeback or dispute-related fee."),
+    ]
+    for text_of, needles, name, reason in notes_rules:
+        for merchant, txs in by_merchant.items():
+            for tx in txs:
+                if any(n in text_of(merchant, tx).lower() for n in needles):
+                    issues.append(_issue(merchant, name, float(tx["amount"]), reason))
+                    break
+    for merchant, txs in by_merchant.items():
+        by_day = defaultdict(list)
+        for tx in txs:
+            when = _parse_date(tx.get("date"))
+            if when:
+                by_day[when.strftime("%Y-%m-%d")].append(float(tx["amount"]))
+        for day, amounts in by_day.items():
+            if len(amounts) < 2 or len(set(amounts)) == 1 or sum(amounts) <= 0:
+                continue
+            issues.append(_issue(merchant, "Multiple same-day charges", sum(amounts), f"{len(amounts)} charges on {day}. Possible split billing."))
+            break
+    return issues
+
+
+NOTES = ["", "Monthly subscription", "Recurring membership", "Free trial ended", "Asked to cancel in person",
+         "Monthly maintenance fee", "Chargeback fee", "Card purchase", "TRIAL"]
+CATEGORIES = [["Subscription"], ["Fees"], ["Food and Drink"], "Plan", []]
+
+
+def _statement(seed, count=400, merchants=25):
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    rows = []
+    for idx in range(count):
+        day = start + timedelta(days=rng.randint(0, 90))
+        rows.append(
+            {
+                "transaction_id": f"tx_{idx}",
+                "date": rng.choice([day.strftime("%Y-%m-%d"), day.strftime("%m/%d/%Y"), "", "not a date"]),
+                "merchant_name": rng.choice([f"Merchant {rng.randint(0, merchants - 1)}", " Padded ", "Late Fee Co", ""]),
+                "amount": rng.choice([9.99, 12.0, 14.99, 29.99, -120.0, round(rng.uniform(1, 200), 2)]),
+                "category": rng.choice(CATEGORIES),
+                "notes": rng.choice(NOTES),
+            }
+        )
+    return rows
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_rule_engine_matches_reference_analyzer(seed):
+    transactions = _statement(seed)
+    expected = _reference(transactions)
+    assert expected
+    assert analyze_transactions_rule_based(transactions) == expected
+    assert analyze_transactions_rule_based(TransactionFrame.from_transactions(transactions)) == expected
+
+
+def test_each_rule_fires_on_a_minimal_statement():
+    transactions = [
+        {"date": "2024-01-01", "merchant_name": "Gym", "amount": 30.0, "notes": "Recurring membership"},
+        {"date": "2024-02-01", "merchant_name": "Gym", "amount": 40.0, "notes": "Recurring membership"},
+        {"date": "2024-01-03", "merchant_name": "Cafe", "amount": 4.5, "notes": ""},
+        {"date": "2024-01-04", "merchant_name": "Cafe", "amount": 4.5, "notes": ""},
+        {"date": "2024-01-05", "merchant_name": "Bank", "amount": 25.0, "notes": "Chargeback fee"},
+        {"date": "2024-01-06", "merchant_name": "Stream", "amount": 9.99, "notes": "Free trial ended, asked to cancel"},
+        {"date": "2024-01-07", "merchant_name": "Shop", "amount": 10.0, "notes": ""},
+        {"date": "2024-01-07", "merchant_name": "Shop", "amount": 15.0, "notes": ""},
+    ]
+    found = {(issue["merchant"], issue["issue"]) for issue in analyze_transactions_rule_based(transactions)}
+    assert found == {
+        ("Cafe", "Possible duplicate charge"),
+        ("Gym", "Possible price increase on subscription"),
+        ("Stream", "Cancellation friction or billing after cancel request"),
+        ("Stream", "Free trial converted to paid plan"),
+        ("Bank", "Unexpected fee"),
+        ("Bank", "Possible chargeback/dispute fee"),
+        ("Shop", "Multiple same-day charges"),
+    }
+    assert found == {(issue["merchant"], issue["issue"]) for issue in _reference(transactions)}
@@ -0,0 +1,63 @@
+from collections import defaultdict
+
+from app.analysis.transaction_context import build_context_chunks, estimate_tokens
+
+TABLE_HEADER = "TRANSACTIONS date|merchant|amount|category|notes"
+
+
+def _transactions(count, merchants=40):
+    return [
+        {
+            "date": f"2024-{(idx % 12) + 1:02d}-{(idx % 28) + 1:02d}",
+            "merchant_name": f"Merchant {idx % merchants}",
+            "amount": 10 + idx % 90,
+            "category": ["Shopping"],
+            "notes": f"order {idx}",
+        }
+        for idx in range(count)
+    ]
+
+
+def _table_rows(chunk):
+    table = chunk.split(TABLE_HEADER, 1)[1]
+    return [line for line in table.splitlines() if "|order " in line]
+
+
+def test_max_chunks_and_token_budget_are_respected():
+    transactions = _transactions(5000)
+    for budget in (1500, 2000, 6000):
+        for max_chunks in (1, 2, 8):
+            chunks = build_context_chunks(transactions, token_budget=budget, max_chunks=max_chunks)
+            assert 1 <= len(chunks) <= max_chunks
+            assert all(estimate_tokens(chunk) <= budget for chunk in chunks)
+
+
+def test_each_merchant_stays_in_one_chunk():
+    transactions = _transactions(600, merchants=30)
+    chunks = build_context_chunks(transactions, token_budget=2000, max_chunks=50)
+    assert len(chunks) > 1
+    chunks_by_merchant = defaultdict(set)
+    rows_by_merchant = defaultdict(int)
+    for idx, chunk in enumerate(chunks):
+        for line in _table_rows(chunk):
+            merchant = line.split("|")[1]
+            chunks_by_merchant[merchant].add(idx)
+            rows_by_merchant[merchant] += 1
+    assert len(chunks_by_merchant) == 30
+    assert all(len(found) == 1 for found in chunks_by_merchant.values())
+    assert all(count == 20 for count in rows_by_merchant.values())
+
+
+def test_omitted_count_covers_every_dropped_row():
+    transactions = _transactions(5000)
+    chunks = build_context_chunks(transactions, token_budget=2000, max_chunks=2)
+    shown = sum(len(_table_rows(chunk)) for chunk in chunks)
+    omitted = int(chunks[-1].rsplit("... ", 1)[1].split(" ", 1)[0])
+    assert shown + omitted == len(transactions)
+    # The largest spenders are kept; whatever is dropped is the smallest.
+    shown_merchants = {line.split("|")[1] for chunk in chunks for line in _table_rows(chunk)}
+    totals = defaultdict(float)
+    for tx in transactions:
+        totals[tx["merchant_name"]] += tx["amount"]
+    dropped = set(totals) - shown_merchants
+    assert dropped and min(totals[m] for m in shown_merchants) >= max(totals[m] for m in dropped)
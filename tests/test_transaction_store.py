@@ -0,0 +1,35 @@
+import json
+
+from app.data import bank_transactions
+
+
+def _tx(tx_id, merchant="Netflix", amount=-15.49, date="2024-01-05"):
+    return {"transaction_id": tx_id, "date": date, "merchant_name": merchant, "amount": amount, "category": []}
+
+
+def test_anonymous_uploads_are_not_visible_to_signed_in_users(store):
+    bank_transactions.save_transactions([_tx("a1")])
+    assert bank_transactions.load_transactions(user_id="alice") is None
+    assert bank_transactions.claim_legacy_transactions(user_id="alice") == 0
+    assert [tx["transaction_id"] for tx in bank_transactions.load_transactions()] == ["a1"]
+
+
+def test_legacy_rows_go_to_the_first_signed_in_owner_only(store):
+    (store / "bank_transactions.json").write_text(
+        json.dumps({"source": "legacy", "transactions": [_tx("l1"), _tx("l2", date="2024-02-05")]})
+    )
+    assert bank_transactions.load_transactions() is None
+    assert bank_transactions.claim_legacy_transactions() == 0
+
+    assert bank_transactions.claim_legacy_transactions(user_id="alice") == 2
+    assert [tx["transaction_id"] for tx in bank_transactions.load_transactions(user_id="alice")] == ["l1", "l2"]
+
+    assert bank_transactions.claim_legacy_transactions(user_id="bob") == 0
+    assert bank_transactions.load_transactions(user_id="bob") is None
+
+
+def test_owner_with_rows_does_not_claim_legacy_rows(store):
+    (store / "bank_transactions.json").write_text(json.dumps([_tx("l1")]))
+    bank_transactions.save_transactions([_tx("c1")], user_id="carol")
+    assert bank_transactions.claim_legacy_transactions(user_id="carol") == 0
+    assert bank_transactions.claim_legacy_transactions(user_id="dave") == 1
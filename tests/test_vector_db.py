@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+from app.data import vector_db
+
+
+def _document(extra=""):
+    sections = []
+    for number in range(1, 7):
+        body = " ".join(f"Clause {number}.{idx} requires the merchant to honor cancellation requests promptly." for idx in range(30))
+        if number == 1 and extra:
+            body = f"{extra}\n\n{body}"
+        sections.append(f"Section {number} Consumer Protections\n\n{body}")
+    return "\n\n".join(sections)
+
+
+def _chunks(tmp_path, text):
+    (tmp_path / "agreement.txt").write_text(text, encoding="utf-8")
+    return vector_db._extract_document(str(tmp_path), "agreement.txt")
+
+
+def test_chunk_ids_survive_an_insertion_near_the_top(tmp_path):
+    before = {chunk_id: meta for chunk_id, _, meta in _chunks(tmp_path, _document())}
+    after = {
+        chunk_id: meta
+        for chunk_id, _, meta in _chunks(tmp_path, _document("A new introductory paragraph the bank added this year."))
+    }
+    assert len(before) > 6
+    added = set(after) - set(before)
+    kept = set(after) & set(before)
+    # Only chunks of the edited section get new ids; everything after it keeps its id...
+    assert added and all(after[chunk_id]["section"].startswith("Section 1") for chunk_id in added)
+    assert len(kept) > len(added)
+    # ...even though its character offsets moved.
+    assert all(after[chunk_id]["start"] > before[chunk_id]["start"] for chunk_id in kept if not after[chunk_id]["section"].startswith("Section 1"))
+
+
+def test_identical_chunks_get_distinct_ids():
+    ids = vector_db._chunk_ids("doc.txt", ["same text", "other", "same text"])
+    assert len(set(ids)) == 3
+    assert ids == vector_db._chunk_ids("doc.txt", ["same text", "other", "same text"])
+    assert ids[0] != vector_db._chunk_ids("other.txt", ["same text"])[0]
+
+
+class _MemoryCollection:
+    def __init__(self):
+        self.points = {}
+
+    def count(self):
+        return len(self.points)
+
+    def upsert(self, documents, embeddings, metadatas, ids):
+        for chunk_id, text, meta in zip(ids, documents, metadatas):
+            self.points[chunk_id] = (text, meta)
+
+    def update(self, ids, metadatas):
+        for chunk_id, meta in zip(ids, metadatas):
+            self.points[chunk_id] = (self.points[chunk_id][0], meta)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.points.pop(chunk_id, None)
+
+
+class _MemoryClient:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def delete_collection(self, name):
+        self.collection = _MemoryCollection()
+
+    def get_or_create_collection(self, name, embedding_function=None):
+        return self.collection
+
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch):
+    docs = tmp_path / "documents"
+    docs.mkdir()
+    monkeypatch.setattr(vector_db, "DOCS_DIR", str(docs))
+    monkeypatch.setattr(vector_db, "INGEST_MANIFEST_PATH", str(tmp_path / "ingest_manifest.json"))
+    monkeypatch.setattr(vector_db, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(vector_db, "INGEST_EXTRACT_WORKERS", 1)
+    kb = object.__new__(vector_db.LegalKnowledgeBase)
+    kb.provider = "chroma"
+    kb.embedding_provider = "local"
+    kb.embedding_model = "test"
+    kb.embedding_dim = None
+    kb.collection_name = vector_db.DEFAULT_COLLECTION
+    kb.collection = _MemoryCollection()
+    kb.client = _MemoryClient(kb.collection)
+    kb.embedding_fn = None
+    kb._stats_lock = threading.Lock()
+    kb._stats_cache = None
+    kb._embed_texts = lambda texts, hot=False: [[1.0, 0.0] for _ in texts]
+    return kb, docs
+
+
+def test_first_ingest_removes_points_from_before_the_manifest(knowledge_base):
+    kb, docs = knowledge_base
+    (docs / "agreement.txt").write_text(_document(), encoding="utf-8")
+    # Points left by the page/position-keyed ingest, including a file that no longer exists.
+    for chunk_id in ("agreement.txt_page_0", "agreement.txt_chunk_0", "removed.pdf_page_3"):
+        kb.collection.points[chunk_id] = ("old text", {"source": chunk_id.split("_")[0], "page": 0})
+
+    dry = kb.ingest_documents(dry_run=True)
+    assert dry["chunks_deleted"] == 3
+    assert len(kb.collection.points) == 3
+
+    summary = kb.ingest_documents()
+    expected = {chunk_id for chunk_id, _, _ in vector_db._extract_document(str(docs), "agreement.txt")}
+    assert set(kb.collection.points) == expected
+    assert summary["chunks_deleted"] == 3
+    assert summary["chunks_embedded"] == len(expected)
+
+    # Once the manifest describes the collection, a re-run touches nothing.
+    again = kb.ingest_documents()
+    assert again["chunks_embedded"] == again["chunks_deleted"] == 0
+    assert set(kb.collection.points) == expected